@@ -17,11 +17,22 @@
 
 import unittest
 from parse import ast_test
+import checker_boundary_test
+import checker_cache_test
 import checker_classes_test
 import checker_generics_test
+import checker_governor_test
+import checker_instrument_test
+import checker_lazy_test
+import checker_metrics_test
 import checker_overloading_test
+import checker_records_test
+import checker_sampling_test
+import checker_shadow_test
 import checker_test
 import checker_union_test
+import checker_validate_test
+import violation_ring_test
 
 def suite():
 
@@ -32,15 +43,29 @@ def suite():
     tuple_eq = unittest.TestLoader().loadTestsFromTestCase(ast_test.TestTupleEq)
 
     # checker tests
+    boundary = unittest.TestLoader().loadTestsFromTestCase(checker_boundary_test.TestCheckerBoundary)
+    cache = unittest.TestLoader().loadTestsFromTestCase(checker_cache_test.TestCheckerTypeCache)
     classes = unittest.TestLoader().loadTestsFromTestCase(checker_classes_test.TestCheckerClasses)
     generics = unittest.TestLoader().loadTestsFromTestCase(checker_generics_test.TestCheckerGenerics)
+    governor = unittest.TestLoader().loadTestsFromTestCase(checker_governor_test.TestCheckerGovernor)
+    instrument = unittest.TestLoader().loadTestsFromTestCase(checker_instrument_test.TestCheckerInstrument)
+    lazy = unittest.TestLoader().loadTestsFromTestCase(checker_lazy_test.TestCheckerLazy)
+    metrics = unittest.TestLoader().loadTestsFromTestCase(checker_metrics_test.TestCheckerMetrics)
     overloading = unittest.TestLoader().loadTestsFromTestCase(checker_overloading_test.TestCheckerOverloading)
+    records = unittest.TestLoader().loadTestsFromTestCase(checker_records_test.TestCheckerRecords)
+    sampling = unittest.TestLoader().loadTestsFromTestCase(checker_sampling_test.TestCheckerSampling)
+    shadow = unittest.TestLoader().loadTestsFromTestCase(checker_shadow_test.TestCheckerShadow)
+    limiter = unittest.TestLoader().loadTestsFromTestCase(checker_shadow_test.TestViolationLimiter)
     simple = unittest.TestLoader().loadTestsFromTestCase(checker_test.TestChecker)
     union = unittest.TestLoader().loadTestsFromTestCase(checker_union_test.TestCheckerUnion)
+    validate = unittest.TestLoader().loadTestsFromTestCase(checker_validate_test.TestCheckerValidate)
+    ring = unittest.TestLoader().loadTestsFromTestCase(violation_ring_test.TestViolationRing)
 
 
-    all_tests = [ast_generation, tuple_eq, classes, generics, overloading,
-                 simple, union]
+    all_tests = [ast_generation, tuple_eq, boundary, cache, classes,
+                 generics, governor, instrument, lazy, metrics, overloading,
+                 records, sampling, shadow, limiter, simple, union, validate,
+                 ring]
 
     return unittest.TestSuite(all_tests)
 
@@ -21,9 +21,18 @@
 
 from __future__ import print_function
 
+import array
+import atexit
 import collections
 import inspect
+import itertools
+import json
+import math
+import random
 import sys
+import threading
+import time
+import timeit
 import traceback
 import types
 from pytypedecl import pytd
@@ -106,49 +115,158 @@ def Classes(module):
 
 
 def MethodsForClass(cls):
-  return inspect.getmembers(cls, inspect.ismethod)
+  """Return the methods defined in a class itself, not inherited ones.
+
+  Only the class's own __dict__ is looked at, so that properties and other
+  attributes aren't evaluated.
+
+  Args:
+    cls: A class
+
+  Returns:
+    A list of (name, function, staticmethod or classmethod object) pairs, as
+    they're stored in the class.
+  """
+  return [(name, value) for name, value in cls.__dict__.items()
+          if isinstance(value, (types.FunctionType, staticmethod,
+                                classmethod))]
 
 
 class CheckTypeAnnotationError(Exception):
   """An exception encapsulating type checking errors.
 
-     A list of error messages is passed to the constructor.
+     A list of TypeViolations is passed to the constructor.
   """
   pass
 
 
+class TypeViolation(object):
+  """A type error found by the checker, formatted only when it's printed.
+
+  The errors in a CheckTypeAnnotationError, and the errors reported in
+  shadow mode, are TypeViolations. Creating one only stores references, so
+  a call site that fails millions of times doesn't format millions of
+  messages; str() formats the message.
+
+  Attributes:
+    kind: PARAM, RETURN, EXCEPTION, OVERLOAD, GENERATOR or FIELD
+    func_name: Name of the function, as printed (without the class, for
+      methods), or of the class, for FIELD
+    qualified_name: Name of the function ("Class.method" for methods), which
+      tells methods of different classes apart. The checker sets it when it
+      raises or reports the violation; by default, it's func_name.
+    param: Name of the parameter, for PARAM, or of the field, for FIELD
+    observed: The type of the offending value, or of the exception. None
+      for a missing field.
+    expected: The declared type (a tuple of classes for EXCEPTION)
+    iteration: Number of the offending item, for GENERATOR, or index of
+      the record, for FIELD
+    generator: The offending generator, for GENERATOR
+  """
+
+  PARAM, RETURN, EXCEPTION, OVERLOAD, GENERATOR, FIELD = (
+      "param", "return", "exception", "overload", "generator", "field")
+
+  __slots__ = ("kind", "func_name", "qualified_name", "param", "observed",
+               "expected", "iteration", "generator")
+
+  def __init__(self, kind, func_name, param=None, observed=None,
+               expected=None, iteration=None, generator=None):
+    self.kind = kind
+    self.func_name = func_name
+    self.qualified_name = func_name
+    self.param = param
+    self.observed = observed
+    self.expected = expected
+    self.iteration = iteration
+    self.generator = generator
+
+  def Key(self):
+    """What repeats of this violation have in common, see ViolationLimiter."""
+    return self.qualified_name, self.kind, self.param, self.observed
+
+  def __str__(self):
+    if self.kind == self.PARAM:
+      return ("[TYPE_ERROR] Function: {f}, parameter: {p}"
+              " => FOUND: {found:s} but EXPECTED: {expected:s}").format(
+                  f=self.func_name, p=self.param, found=self.observed,
+                  expected=self.expected)
+    elif self.kind == self.RETURN:
+      return ("[TYPE_ERROR] Function: {f}, returns {found:s} but "
+              "EXPECTED {expected:s}").format(
+                  f=self.func_name, found=self.observed,
+                  expected=self.expected)
+    elif self.kind == self.EXCEPTION:
+      return ("[TYPE_ERROR] Function: {f}, raised {found:s} but "
+              "EXPECTED one of {expected:s}").format(
+                  f=self.func_name, found=self.observed,
+                  expected=self.expected)
+    elif self.kind == self.OVERLOAD:
+      # TODO(raoulDoc): improve error message (actual args)
+      return ("[TYPE_ERROR] Function: {f}, overloading error "
+              "no matching signature found").format(f=self.func_name)
+    elif self.kind == self.FIELD:
+      if self.observed is None:
+        return ("[TYPE_ERROR] Record #{i}: {c}, field: {p} is MISSING, "
+                "EXPECTED: {expected:s}").format(
+                    i=self.iteration, c=self.func_name, p=self.param,
+                    expected=self.expected)
+      return ("[TYPE_ERROR] Record #{i}: {c}, field: {p}"
+              " => FOUND: {found:s} but EXPECTED: {expected:s}").format(
+                  i=self.iteration, c=self.func_name, p=self.param,
+                  found=self.observed, expected=self.expected)
+    else:
+      return "{} {!r} iteration #{} was a {} not an {}".format(
+          self.func_name, self.generator, self.iteration, self.observed,
+          self.expected)
+
+  def __repr__(self):
+    # Errors used to be plain strings, so print them as such, e.g. in the
+    # args of a CheckTypeAnnotationError.
+    return repr(str(self))
+
+  # Violations are equal if they print the same, regardless of whether the
+  # expected type is a class or the pytd type it was resolved from.
+  def __eq__(self, other):
+    return isinstance(other, TypeViolation) and str(self) == str(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash(str(self))
+
+
 def ParamTypeErrorMsg(func_name, p_name, actual_p, expected_t):
-  return ("[TYPE_ERROR] Function: {f}, parameter: {p}"
-          " => FOUND: {found:s} but EXPECTED: {expected:s}").format(
-              f=func_name, p=p_name, found=actual_p, expected=expected_t)
+  return TypeViolation(TypeViolation.PARAM, func_name, param=p_name,
+                       observed=actual_p, expected=expected_t)
 
 
 def ReturnTypeErrorMsg(func_name, actual_t, expected_t):
-  return ("[TYPE_ERROR] Function: {f}, returns {found:s} but "
-          "EXPECTED {expected:s}").format(
-              f=func_name, found=actual_t, expected=expected_t)
+  return TypeViolation(TypeViolation.RETURN, func_name, observed=actual_t,
+                       expected=expected_t)
 
 
 def ExceptionTypeErrorMsg(func_name, actual_e, expected_e):
-  return ("[TYPE_ERROR] Function: {f}, raised {found:s} but "
-          "EXPECTED one of {expected:s}").format(
-              f=func_name, found=actual_e, expected=expected_e)
+  return TypeViolation(TypeViolation.EXCEPTION, func_name, observed=actual_e,
+                       expected=expected_e)
 
 
-# TODO(raoulDoc): improve error message (actual args)
 def OverloadingTypeErrorMsg(func_name):
-  return ("[TYPE_ERROR] Function: {f}, overloading error "
-          "no matching signature found").format(f=func_name)
+  return TypeViolation(TypeViolation.OVERLOAD, func_name)
+
+
+def FieldTypeErrorMsg(class_name, field, actual_t, expected_t, index):
+  return TypeViolation(TypeViolation.FIELD, class_name, param=field,
+                       observed=actual_t, expected=expected_t,
+                       iteration=index)
 
 
 def GeneratorGenericTypeErrorMsg(func_name, gen_to_wrap,
                                  iteration, actual_t, expected_t):
-  return ("{} {!r} iteration #{} was a {} not an {}"
-          .format(func_name,
-                  gen_to_wrap,
-                  iteration,
-                  actual_t,
-                  expected_t))
+  return TypeViolation(TypeViolation.GENERATOR, func_name,
+                       observed=actual_t, expected=expected_t,
+                       iteration=iteration, generator=gen_to_wrap)
 
 
 def _EvalWithModuleContext(expr, module):
@@ -156,22 +274,45 @@ def _EvalWithModuleContext(expr, module):
   return eval(expr, module.__dict__)
 
 
-def ConvertToType(module, type_node):
-  """Helper for converting a type node to a valid Python type.
+# Most precise wall clock available.
+_Timer = timeit.default_timer
 
-  Args:
-    module: The module to look up symbols/types
-    type_node: A type node to convert into a python type
+# Marker for names that weren't bound when a type was resolved.
+_MISSING = object()
 
-  Returns:
-    A valid Python type. Note that None is considered a type in
-    the declaration language, but a value in Python. So a string
-    None is converted to a NoneType. We use the module object to look
-    up potential type definitions defined inside that module.
 
-  Raises:
-    TypeError: if the type node passed is not supported/unknown
+def _RecordNameDependencies(module, name, deps):
+  """Remember which bindings a dotted type name was resolved through.
+
+  For "simple.Apple", this records the global "simple" of the module and the
+  attribute "Apple" of the simple module. Names that aren't module globals
+  (e.g. builtins like "int") are recorded as missing, so shadowing them later
+  is noticed, too.
+
+  Args:
+    module: The module the name was resolved in
+    name: A (possibly dotted) type name
+    deps: dict to fill, {(id(namespace), name): (namespace, name, object)}
   """
+  namespace = module.__dict__
+  for part in name.split("."):
+    obj = namespace.get(part, _MISSING)
+    deps[(id(namespace), part)] = (namespace, part, obj)
+    namespace = getattr(obj, "__dict__", None)
+    if not isinstance(namespace, dict):
+      break
+
+
+def _DependenciesAreCurrent(deps):
+  """Check that none of the recorded bindings were rebound since."""
+  for namespace, name, obj in deps:
+    if namespace.get(name, _MISSING) is not obj:
+      return False
+  return True
+
+
+def _ConvertToType(module, type_node, deps):
+  """Implementation of ConvertToType. Records name bindings in deps."""
   # TODO: Convert this to a visitor.
 
   # clean up str
@@ -183,45 +324,124 @@ def ConvertToType(module, type_node):
     else:
       res = _EvalWithModuleContext(type_node.name, module)
       assert isinstance(res, type), (type_node.name, repr(res))
+      _RecordNameDependencies(module, type_node.name, deps)
       return res
 
+  elif isinstance(type_node, pytd.UnknownType):
+    # e.g. a missing "-> type": anything goes
+    return object
+
+  elif isinstance(type_node, (type, types.ClassType)):
+    return type_node  # already resolved
+
   elif isinstance(type_node, pytd.UnionType):
-    return pytd.UnionType([ConvertToType(module, t)
+    return pytd.UnionType([_ConvertToType(module, t, deps)
                            for t in type_node.type_list])
 
   elif isinstance(type_node, pytd.IntersectionType):
-    return pytd.IntersectionType([ConvertToType(module, t)
+    return pytd.IntersectionType([_ConvertToType(module, t, deps)
                                   for t in type_node.type_list])
 
   elif isinstance(type_node, pytd.GenericType):
-    return pytd.GenericType(ConvertToType(module,
-                                          type_node.base_type),
-                            type_node.parameters)
+    return pytd.GenericType(_ConvertToType(module,
+                                           type_node.base_type,
+                                           deps),
+                            tuple(_ConvertToType(module, p, deps)
+                                  for p in type_node.parameters))
 
   elif isinstance(type_node, pytd.HomogeneousContainerType):
-    return pytd.HomogeneousContainerType(ConvertToType(module,
-                                                       type_node.base_type),
-                                         ConvertToType(module,
-                                                       type_node.element_type))
+    return pytd.HomogeneousContainerType(
+        _ConvertToType(module, type_node.base_type, deps),
+        _ConvertToType(module, type_node.element_type, deps))
 
   else:
     raise TypeError("Unknown type of type_node: {!r}".format(type_node))
 
 
-# functools.wraps doesn't work on generators
-def _WrapGenWithTypeCheck(func_name, gen_to_wrap, element_type):
-  """Typechecking decorator for typed generators."""
-  def _TypeCheckPipeGenerator():
-    for iteration, elem in enumerate(gen_to_wrap):
-      if not isinstance(elem, element_type):
-        error_msg = GeneratorGenericTypeErrorMsg(func_name,
-                                                 gen_to_wrap,
-                                                 iteration + 1,
-                                                 type(elem),
-                                                 element_type)
-        raise CheckTypeAnnotationError([error_msg])
-      yield elem
-  return _TypeCheckPipeGenerator()
+class TypeCache(object):
+  """Per-module cache of the Python types that type nodes resolve to.
+
+  Every entry remembers the bindings (module globals, and attributes of
+  imported modules) that were looked up to resolve it, and the objects they
+  were bound to. An entry is only reused while all of these are still bound
+  to the same objects. So rebinding a global, through reload() or by
+  monkeypatching it in a test, invalidates the entry with a few dict lookups
+  instead of evaluating the type again.
+
+  Attributes:
+    module: The module used to look up symbols/types
+    hits: Number of lookups answered from the cache
+    misses: Number of lookups that had to resolve the type node
+  """
+
+  def __init__(self, module):
+    self.module = module
+    self.hits = 0
+    self.misses = 0
+    self._entries = {}  # type node -> (python type, dependencies)
+
+  def Lookup(self, type_node):
+    """Resolve a type node, using the cache if possible.
+
+    Args:
+      type_node: A type node to convert into a python type
+
+    Returns:
+      A tuple (python type, dependencies). See ConvertToType.
+    """
+    entry = self._entries.get(type_node)
+    if entry is not None and _DependenciesAreCurrent(entry[1]):
+      self.hits += 1
+      return entry
+    self.misses += 1
+    deps = {}
+    entry = (_ConvertToType(self.module, type_node, deps),
+             tuple(deps.itervalues()))
+    self._entries[type_node] = entry
+    return entry
+
+  def Entries(self):
+    """Return the cached entries as a dict {type node: python type}."""
+    return {type_node: resolved
+            for type_node, (resolved, _) in self._entries.iteritems()}
+
+  def Clear(self):
+    self._entries.clear()
+    self.hits = 0
+    self.misses = 0
+
+
+_TYPE_CACHES = {}  # module name -> TypeCache
+
+
+def GetTypeCache(module):
+  """Return the TypeCache of a module, creating it if necessary."""
+  cache = _TYPE_CACHES.get(module.__name__)
+  if cache is None or cache.module is not module:
+    cache = _TYPE_CACHES[module.__name__] = TypeCache(module)
+  return cache
+
+
+def ConvertToType(module, type_node):
+  """Helper for converting a type node to a valid Python type.
+
+  Results are cached per module, see TypeCache.
+
+  Args:
+    module: The module to look up symbols/types
+    type_node: A type node to convert into a python type
+
+  Returns:
+    A valid Python type. Note that None is considered a type in
+    the declaration language, but a value in Python. So a string
+    None is converted to a NoneType. We use the module object to look
+    up potential type definitions defined inside that module.
+
+  Raises:
+    TypeError: if the type node passed is not supported/unknown
+  """
+  resolved, _ = GetTypeCache(module).Lookup(type_node)
+  return resolved
 
 
 # see: http://docs.python.org/2/reference/datamodel.html
@@ -230,9 +450,61 @@ def _IsClassMethod(func):
   return hasattr(func, "im_self") and func.im_self
 
 
+def _SplitDescriptor(func):
+  """Split a callable into the function to call and the descriptor type.
+
+  Static and class methods are checked by wrapping the underlying function,
+  and wrapping the wrapper in the same kind of descriptor again. (Functions
+  are descriptors, too, which bind self.) Since these descriptors are
+  implemented in C, looking up a checked method costs the same as looking
+  up an unchecked one.
+
+  Args:
+    func: A function, a staticmethod or classmethod object, or a bound
+      classmethod (e.g. cls.method).
+
+  Returns:
+    A tuple (function, staticmethod, classmethod or None)
+  """
+  if isinstance(func, (staticmethod, classmethod)):
+    return func.__func__, type(func)
+  if _IsClassMethod(func):
+    return func.im_func, classmethod
+  return func, None
+
+
+def _HasCustomInstanceCheck(cls):
+  """Whether isinstance(x, cls) might depend on more than type(x)."""
+  for base in type(cls).__mro__:
+    if base is type:
+      return False
+    if "__instancecheck__" in base.__dict__:
+      return True
+  return True
+
+
+def _HasCustomClassAttribute(cls):
+  """Whether instances of cls might lie about their __class__."""
+  return any("__class__" in base.__dict__ for base in cls.__mro__[:-1])
+
+
+# Compiled formal types of IsCompatibleType, by identity: {id(formal):
+# [formal, compiled, last use]}. Formal types aren't necessarily hashable,
+# e.g. unions of lists. The entry keeps the formal alive, and is only used for
+# the same object, so reusing the id of a garbage collected formal is
+# harmless. A hit only stores the use count; when the cache is full, the
+# least recently used half of the entries is evicted.
+_COMPILED_TYPES = {}
+_MAX_COMPILED_TYPES = 1024
+_COMPILED_TYPE_USES = itertools.count()
+
+
 def IsCompatibleType(actual, formal):
   """Check compatibility of an expression with a type definition.
 
+  The formal type is compiled (see CompileType) the first time it is used,
+  and the compiled check is reused for the same formal type object.
+
   Args:
     actual: an expression being evaluated
     formal: type expected for this expression
@@ -240,277 +512,2996 @@ def IsCompatibleType(actual, formal):
   Returns:
     A boolean whether the actual expression is compatible with
     the formal type definition
+  """
+  if isinstance(formal, type):
+    return isinstance(actual, formal)
+  entry = _COMPILED_TYPES.get(id(formal))
+  if entry is None or entry[0] is not formal:
+    if len(_COMPILED_TYPES) >= _MAX_COMPILED_TYPES:
+      _EvictCompiledTypes()
+    entry = _COMPILED_TYPES[id(formal)] = [formal, CompileType(formal), 0]
+  entry[2] = next(_COMPILED_TYPE_USES)
+  return _Matches(entry[1], actual)
+
+
+def _EvictCompiledTypes():
+  """Evict the least recently used half of _COMPILED_TYPES."""
+  # items() copies, so other threads can use the cache meanwhile
+  by_use = sorted(_COMPILED_TYPES.items(), key=lambda item: item[1][2])
+  for key, _ in by_use[:len(by_use) // 2]:
+    _COMPILED_TYPES.pop(key, None)
+
+
+class ElementBudget(object):
+  """How many elements of a container are checked.
+
+  Containers with at most max_elements elements are checked completely.
+  Of larger sequences, max_elements elements spread evenly over the whole
+  sequence (including the first and the last element) are checked, or a
+  random sample of them. Containers that can't be indexed, like sets or dict
+  views, can only be iterated, so the first max_elements elements in
+  iteration order are checked.
+
+  The items of large mappings can only be reached by iterating, so a check
+  never iterates over more than max_scanned of them. Each check takes the
+  next max_elements items among the first max_scanned ones, where the
+  previous check with the same budget stopped, so that successive checks
+  cover all of them; the items before are skipped by islice, without running
+  any Python code. With a random source, a reservoir sample of the first
+  max_scanned items is checked instead. Note that the items of a dict come
+  in hash order, so the first ones aren't the oldest entries or any other
+  particular ones.
+
+  Attributes:
+    max_elements: Maximum number of elements to check per container
+    random: random.Random instance to sample randomly, or None to sample
+      evenly spread elements
+    max_scanned: Maximum number of mapping items to iterate over
+  """
 
-  Raises:
-    TypeError: if a generic type is not supported
+  __slots__ = ("max_elements", "random", "max_scanned", "_cursor")
+
+  def __init__(self, max_elements=16, rand=None, max_scanned=4096):
+    if max_elements < 1:
+      raise ValueError("Invalid element budget: {!r}".format(max_elements))
+    self.max_elements = max_elements
+    self.random = rand
+    self.max_scanned = max(max_scanned, max_elements)
+    self._cursor = 0  # where the next window of mapping items starts
+
+  def Sample(self, container):
+    """Pick the elements of a container to check.
+
+    Args:
+      container: A container that supports len()
+
+    Returns:
+      A tuple (iterable of elements to check, number of elements)
+    """
+    total = len(container)
+    k = self.max_elements
+    if total <= k:
+      return container, total
+    if isinstance(container, (list, tuple, collections.Sequence)):
+      if self.random is not None:
+        indices = sorted(self.random.sample(xrange(total), k))
+      elif k == 1:
+        indices = [0]
+      else:
+        indices = [i * (total - 1) // (k - 1) for i in xrange(k)]
+      return [container[i] for i in indices], total
+    return list(itertools.islice(container, k)), total
+
+  def SampleItems(self, mapping):
+    """Pick the (key, value) items of a mapping to check.
+
+    Args:
+      mapping: A mapping, e.g. a dict
+
+    Without a random source, these are the next items of a window that
+    moves on with every check, see above.
+
+    Returns:
+      A tuple (list of items to check, number of items)
+    """
+    total = len(mapping)
+    k = self.max_elements
+    items = mapping.iteritems()
+    if total <= k:
+      return list(items), total
+    scanned = min(total, self.max_scanned)
+    if self.random is None:
+      start = self._cursor
+      if start + k > scanned:
+        start = 0
+      # concurrent checks may move the window along just once, that's fine
+      self._cursor = start + k
+      return list(itertools.islice(items, start, start + k)), total
+    # Reservoir sampling with geometric skips ("Algorithm L"), which only
+    # draws O(k * log(n / k)) random numbers for n scanned items. Skipped
+    # items are consumed by islice, without running any Python code.
+    rand = self.random
+    reservoir = list(itertools.islice(items, k))
+    w = math.exp(math.log(1.0 - rand.random()) / k)
+    i = k - 1
+    while w < 1.0:
+      skip = int(math.log(1.0 - rand.random()) / math.log(1.0 - w))
+      i += skip + 1
+      if i >= scanned:
+        break
+      reservoir[rand.randrange(k)] = next(itertools.islice(items, skip, None))
+      w *= math.exp(math.log(1.0 - rand.random()) / k)
+    return reservoir, total
+
+
+DEFAULT_ELEMENT_BUDGET = ElementBudget()
+
+
+class ItemSampling(object):
+  """Which items of a generator are checked.
+
+  The items of a generator are only known while it's iterated, so they're
+  checked as they're produced: every k-th item, starting with the first
+  one, optionally only among the first n items.
+
+  Attributes:
+    every: Check every every-th item; 1 checks all of them
+    first: Only check items among the first `first` ones, or None to check
+      items all along
   """
 
-  if isinstance(formal, pytd.UnionType):
-    for t in formal.type_list:
-      if IsCompatibleType(actual, t):
-        return True
-    return False
-  if isinstance(formal, pytd.IntersectionType):
-    for t in formal.type_list:
-      if not IsCompatibleType(actual, t):
-        return False
-    return True
+  __slots__ = ("every", "first")
 
-  if isinstance(formal, pytd.GenericType):
-    # We do NOT check parameters. There is no generic way to know what they
-    # they mean.
-    return isinstance(actual, formal.base_type)
-  elif isinstance(formal, pytd.HomogeneousContainerType):
-    if not isinstance(actual, formal.base_type):
-      return False
-    if hasattr(actual, "__len__"):
-      # We can't iterate over the entire list, for performance reasons. (We
-      # would have to do this every single time a function is called!).
-      # But we can at least check the very first element.
-      return len(actual) == 0 or isinstance(actual[0], formal.element_type)
-    return True
+  def __init__(self, every=1, first=None):
+    if every < 1:
+      raise ValueError("Invalid item sampling: every {!r}".format(every))
+    if first is not None and first < 1:
+      raise ValueError("Invalid item sampling: first {!r}".format(first))
+    self.every = every
+    self.first = first
 
-  return isinstance(actual, formal)
 
+DEFAULT_ITEM_SAMPLING = ItemSampling()
 
-def _GetParamTypeErrors(module, func_name, func_sig, args):
-  """Helper for checking actual params vs formal params signature.
 
-  Args:
-    module: The module to look up symbols/types
-    func_name: function name
-    func_sig: function definition (Signature)
-    args: actual arguments passed to the function
+class _ItemCheck(object):
+  """Checks a sample of the items of a generator, see ItemSampling.
 
-  Returns:
-    A list of potential type errors
+  Items that are handed over one by one (sent to a generator) are sampled
+  with a countdown to the next item to check, so a skipped item only costs a
+  decrement. Once no more items are to be checked, the countdown is
+  infinite.
+
+  Attributes:
+    func_name: Name of the checked function
+    source: The generator, for error messages
+    check: The compiled element type (see CompileType)
+    element_type: The element type, for error messages
+    state: CheckState of the function, or None
+    countdown: Number of items until the next checked item
+    position: Position (1-based) of the next checked item
+    every: See ItemSampling
+    last: Position of the last item that may be checked
   """
-  params = ((p.name, p.type) for p in func_sig.params)
-  param_cmp_types = ((func_name, args[i], ConvertToType(module, t))
-                     for i, (func_name, t) in enumerate(params))
-  params_type_error_list = [ParamTypeErrorMsg(func_name, n, type(p), t)
-                            for n, p, t in param_cmp_types
-                            if not IsCompatibleType(p, t)]
 
-  return params_type_error_list
+  __slots__ = ("func_name", "source", "check", "element_type", "state",
+               "countdown", "position", "every", "last")
+
+  def __init__(self, func_name, source, check, element_type, state):
+    sampling = (state is not None and state.item_sampling or
+                DEFAULT_ITEM_SAMPLING)
+    self.func_name = func_name
+    self.source = source
+    self.check = check
+    self.element_type = element_type
+    self.state = state
+    self.countdown = 1
+    self.position = 1
+    self.every = sampling.every
+    self.last = float("inf") if sampling.first is None else sampling.first
+
+  def Check(self, item, position):
+    """Raise a CheckTypeAnnotationError if an item doesn't match."""
+    if not _Matches(self.check, item):
+      errors = [GeneratorGenericTypeErrorMsg(
+          self.func_name, self.source, position, type(item),
+          self.element_type)]
+      if self.state is not None:
+        self.state.CountViolation(errors)
+      raise CheckTypeAnnotationError(errors)
+
+  def Sampled(self, item):
+    """Check the item the countdown stopped at, and return it."""
+    position = self.position
+    self.position = position + self.every
+    self.countdown = (self.every if self.position <= self.last
+                      else float("inf"))
+    self.Check(item, position)
+    return item
+
+
+def _AllItemsChecked(iterator, sampler):
+  """Check every item of an iterator. A tight loop, for the default."""
+  check = sampler.check
+  if _IsClassCheck(check):
+    for position, item in enumerate(iterator, 1):
+      if not isinstance(item, check):
+        sampler.Check(item, position)  # raises
+      yield item
+  else:
+    matches = check.Matches
+    for position, item in enumerate(iterator, 1):
+      if not matches(item):
+        sampler.Check(item, position)  # raises
+      yield item
+
 
+def _SampledChunks(iterator, sampler):
+  """Split the items of an iterator into checked items and skipped runs.
 
-def _GetExceptionsTupleFromFuncSig(module, func_sig):
-  """Helper for extracting exceptions from a function definition.
+  The runs of skipped items are islices of the iterator, so iterating over
+  them doesn't run any Python code. Once no more items are to be checked,
+  the iterator itself is the last run.
 
   Args:
-      module: The module to look up symbols/types
-      func_sig: function definition
+    iterator: The iterator whose items are checked
+    sampler: The _ItemCheck of the items
 
-  Returns:
-      a tuple of exceptions from the function definition
+  Yields:
+    Iterables, whose items are the items of iterator
+  """
+  every, last = sampler.every, sampler.last
+  if every == 1:
+    checked = iterator if last == float("inf") else itertools.islice(
+        iterator, last)
+    yield _AllItemsChecked(checked, sampler)
+  else:
+    position = 1
+    while position <= last:
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      sampler.Check(item, position)
+      yield (item,)
+      position += every
+      if position <= last:
+        yield itertools.islice(iterator, every - 1)
+  yield iterator
+
+
+class _CheckedIterator(itertools.chain):
+  """Forwards to a generator, and checks a sample of its items.
+
+  Used for generators passed to and returned by checked functions. Iterating
+  over it chains the chunks of _SampledChunks, so skipped items are passed
+  through without running any Python code. send, throw and close are
+  forwarded to the generator, so it can still be used as a coroutine; the
+  items they return are sampled separately, with a countdown.
+
+  Attributes:
+    iterator: The generator
+    sampler: The _ItemCheck of its items
   """
-  return tuple(ConvertToType(module, e) for e in func_sig.exceptions)
 
+  __slots__ = ("iterator", "sampler")
 
-def TypeCheck(module, func_name, func, func_sigs):
-  """Decorator for typechecking a function.
+  def __new__(cls, iterator, func_name, check, element_type, state=None):
+    sampler = _ItemCheck(func_name, iterator, check, element_type, state)
+    self = cls.from_iterable(_SampledChunks(iterator, sampler))
+    self.iterator = iterator
+    self.sampler = sampler
+    return self
+
+  def send(self, value):  # pylint: disable=invalid-name
+    item = self.iterator.send(value)
+    sampler = self.sampler
+    sampler.countdown -= 1
+    if sampler.countdown:
+      return item
+    return sampler.Sampled(item)
+
+  def throw(self, typ, val=None, tb=None):  # pylint: disable=invalid-name
+    item = self.iterator.throw(typ, val, tb)
+    sampler = self.sampler
+    sampler.countdown -= 1
+    if sampler.countdown:
+      return item
+    return sampler.Sampled(item)
+
+  def close(self):  # pylint: disable=invalid-name
+    return self.iterator.close()
+
+
+# What a generator type matches: a generator passed on by a checked function
+# is a _CheckedIterator.
+_GENERATOR_CLASSES = (types.GeneratorType, _CheckedIterator)
+
+
+def _CompileClass(cls):
+  return _GENERATOR_CLASSES if cls is types.GeneratorType else cls
+
+
+def _ArrayElementTypes():
+  """Return a dict {array typecode: Python type of the array's elements}."""
+  element_types = {}
+  for typecode in "cbBuhHiIlLqQfd":
+    try:
+      a = array.array(typecode)
+    except ValueError:
+      continue  # not supported by this Python version
+    load = getattr(a, "frombytes", None) or a.fromstring
+    load(b"\0" * a.itemsize)
+    element_types[typecode] = type(a[0])
+  return element_types
+
+
+_ARRAY_ELEMENT_TYPES = _ArrayElementTypes()
+
+# struct format characters of memoryviews, and the Python types they index to.
+if sys.version_info[0] == 2:
+  # memoryview only supports bytes in Python 2
+  _MEMORYVIEW_ELEMENT_TYPES = {"B": bytes, "b": bytes, "c": bytes}
+else:
+  _MEMORYVIEW_ELEMENT_TYPES = dict(
+      [(c, int) for c in "bBhHiIlLqQnN"] +
+      [(c, float) for c in "efd"] +
+      [("?", bool), ("c", bytes)])
+
+
+# Containers that are known not to be typed buffers, to return early.
+_BUILTIN_CONTAINERS = frozenset([list, tuple, dict, set, frozenset, bytes,
+                                 type(u"")])
+
+
+def _BufferElementType(container):
+  """Return the type of all elements of a typed buffer.
+
+  array.array, memoryview and NumPy arrays store their elements in a native
+  format, so the Python type of every element follows from the typecode,
+  format or dtype, without looking at any element. NumPy is only consulted if
+  it has already been imported, since otherwise there can't be any NumPy
+  arrays.
 
   Args:
-    module: The module associated with the function to typecheck
-    func_name: Name of the function that's being checked.
-    func: A function to typecheck
-    func_sigs: signatures of the function (Function)
+    container: Any container
 
   Returns:
-    A decorated function with typechecking assertions
+    The Python type of the container's elements, or None if the container
+    isn't a typed buffer (or stores arbitrary objects).
   """
-  def Wrapped(*args, **kwargs):
-    """Typecheck a function given its signature.
+  if type(container) in _BUILTIN_CONTAINERS:
+    return None
+  if isinstance(container, array.array):
+    return _ARRAY_ELEMENT_TYPES.get(container.typecode)
+  if isinstance(container, memoryview):
+    if container.ndim != 1:
+      return None
+    return _MEMORYVIEW_ELEMENT_TYPES.get(container.format.lstrip("@=<>!"))
+  numpy = sys.modules.get("numpy")
+  if numpy is not None and isinstance(container, numpy.ndarray):
+    dtype = container.dtype
+    if dtype.kind == "O" or dtype.names is not None:
+      return None  # object arrays and structured arrays hold anything
+    return dtype.type
+  return None
+
+
+def _ClassMatches(compiled, cls):
+  """Whether all instances of cls match a compiled type.
 
-    Args:
-      *args: Arguments passed to the function
-      **kwargs: Key/Value arguments passed to the function
+  Args:
+    compiled: A result of CompileType
+    cls: A class
+
+  Returns:
+    True or False, or None if the answer depends on more than the class.
+  """
+  if _IsClassCheck(compiled):
+    classes = compiled if isinstance(compiled, tuple) else (compiled,)
+    # a custom __instancecheck__ can look at the value
+    plain = tuple(c for c in classes if not _HasCustomInstanceCheck(c))
+    if issubclass(cls, plain):
+      return True
+    return None if len(plain) < len(classes) else False
+  if isinstance(compiled, _UnionCheck):
+    results = [_ClassMatches(c, cls)
+               for c in (compiled.classes,) + compiled.others]
+    if True in results:
+      return True
+    return None if None in results else False
+  if isinstance(compiled, _IntersectionCheck):
+    results = [_ClassMatches(c, cls)
+               for c in compiled.classes + compiled.others]
+    if False in results:
+      return False
+    return None if None in results else True
+  return None
+
+
+# Compiled types. CompileType turns a formal type into either a class or a
+# tuple of classes, which can be checked with a single isinstance call, or
+# into one of the check objects below. Check objects have a Matches(actual)
+# method. _IsTypeDeterminedCheck tells whether the result only depends on
+# type(actual).
+
+
+def _IsClassCheck(compiled):
+  return isinstance(compiled, (type, types.ClassType, tuple))
+
+
+class _UnionCheck(object):
+  """Any-of check: a tuple of classes, then the remaining checks in order."""
+
+  __slots__ = ("classes", "others")
+
+  def __init__(self, classes, others):
+    self.classes = classes
+    self.others = others
+
+  def Matches(self, actual):
+    if isinstance(actual, self.classes):
+      return True
+    for check in self.others:
+      if check.Matches(actual):
+        return True
+    return False
+
+
+class _IntersectionCheck(object):
+  """All-of check: classes first, then the remaining checks, in order."""
+
+  __slots__ = ("classes", "others")
+
+  def __init__(self, classes, others):
+    self.classes = classes
+    self.others = others
+
+  def Matches(self, actual):
+    for cls in self.classes:
+      if not isinstance(actual, cls):
+        return False
+    for check in self.others:
+      if not check.Matches(actual):
+        return False
+    return True
+
+
+def _IsTypeDeterminedCheck(compiled):
+  """Whether matching a value against a compiled type only depends on its type.
+
+  Classes with a custom __instancecheck__ can look at the value, and so can
+  the container checks, which look at the elements.
+  """
+  if _IsClassCheck(compiled):
+    classes = compiled if isinstance(compiled, tuple) else (compiled,)
+    return not any(_HasCustomInstanceCheck(cls) for cls in classes)
+  if isinstance(compiled, (_UnionCheck, _IntersectionCheck)):
+    return (_IsTypeDeterminedCheck(compiled.classes) and
+            all(_IsTypeDeterminedCheck(c) for c in compiled.others))
+  return False
+
+
+def _Matches(compiled, actual):
+  """Check a value against the result of CompileType."""
+  if _IsClassCheck(compiled):
+    return isinstance(actual, compiled)
+  return compiled.Matches(actual)
+
+
+# Containers whose elements can't be replaced.
+_IMMUTABLE_CONTAINERS = (tuple, frozenset)
+
+# Progress of a container in _ImmutableContainerMemo once an element failed.
+_FAILED = -1
+
+
+class _ImmutableContainerMemo(object):
+  """Memo of how far immutable containers have been verified.
+
+  The same large tuples and frozensets often pass through many checked
+  functions. Since their elements can't change, every element only needs to
+  be verified once. Besides its sample, each check verifies the next leading
+  elements, as many as the element budget allows, and the memo remembers per
+  (container, check), by identity, how many leading elements have been
+  verified so far, or _FAILED once an element didn't match. Once the whole
+  container is verified, it matches without looking at it again.
+
+  The memo holds a reference to the container, so that its id can't be
+  reused while the entry exists. To bound the memory that is kept alive this
+  way, the memo evicts the oldest entries once it holds more than
+  max_entries containers, or once their estimated size (see _EstimatedSize)
+  adds up to more than max_bytes. Containers larger than
+  max_container_elements are not memoized.
+
+  Lookups don't lock, but updating entries does, since checked functions can
+  be called from many threads.
+
+  Attributes:
+    max_entries: Maximum number of containers
+    max_bytes: Maximum estimated size of all containers together
+    max_container_elements: Maximum number of elements of one container
+    hits: Number of checks answered from the memo alone
+  """
+
+  def __init__(self, max_entries=1024, max_bytes=64 << 20,
+               max_container_elements=1 << 16):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self.max_container_elements = max_container_elements
+    self.hits = 0
+    self._lock = threading.Lock()
+    self.Clear()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def Clear(self):
+    with self._lock:
+      # (id(container), id(check)) -> (container, check, verified, size)
+      self._entries = {}
+      self._order = collections.deque()
+      self._bytes = 0
+
+  def Lookup(self, container, check):
+    """Return how many elements of a container were verified, or None.
 
     Returns:
-      The result of calling the function decorated with typechecking
+      The number of leading elements that match, _FAILED if an element
+      doesn't, or None if the container isn't in the memo.
+    """
+    entry = self._entries.get((id(container), id(check)))
+    if entry is not None and entry[0] is container and entry[1] is check:
+      verified = entry[2]
+      if verified == _FAILED or verified == len(container):
+        self.hits += 1
+      return verified
+    return None
 
-    Raises:
-      CheckTypeAnnotationError: Type errors were found
+  def Add(self, container, check, verified, size):
+    """Remember how far a container was verified.
+
+    Progress only goes forward, and _FAILED is final, so concurrent checks
+    of the same container can't undo each other's results.
+
+    Args:
+      container: A tuple or frozenset
+      check: The _ContainerCheck that verified it
+      verified: Number of leading elements that match, or _FAILED
+      size: Estimated size of the container and its elements, in bytes. Only
+        used if the container isn't in the memo yet.
     """
-    # TODO(raoulDoc): generalise single sig and multiple sig checking
-    # to reuse code?
-    # at the moment this implementation is convenient because for
-    # single signature we stack the errors before raising them
-    # for overloading we only have "no matching signature found"
-    if len(func_sigs) == 1:
-      func_sig = func_sigs[0]
-      # need to copy args tuple into list so can modify individual arg
-      # specfically we want to replace args with decorated variants
-      mod_args = []
-
-      # decorating all typed generators
-      cache_of_generators = {}
-      for i, actual in enumerate(args):
-        # first check actual is a generator
-        if isinstance(actual, types.GeneratorType):
-          # resolve the param signature at the formal position i
-          resolved_type = ConvertToType(module,
-                                        func_sig.params[i].type)
-          # Was the generator defined as generic-typed?
-          # TODO(raoulDoc): formal  may be a union, so need to extract
-          # generator signature
-          if isinstance(resolved_type, pytd.HomogeneousContainerType):
-            # if yes replace generator with a decorated version
-            # we check if we already created a decorated version
-            # for cases such as foo(same_gen, same_gen)
-            if actual not in cache_of_generators:
-              new_gen = _WrapGenWithTypeCheck(func_name,
-                                              actual,
-                                              resolved_type.element_type)
-              cache_of_generators[actual] = new_gen
-            # get generator from cache
-            mod_args.append(cache_of_generators[actual])
-          else:
-          # here we have an untyped generator
-            mod_args.append(actual)
-        else:
-          mod_args.append(actual)
-      # type checking starts here
-      # checking params
-      type_error_list = _GetParamTypeErrors(module,
-                                            func_name,
-                                            func_sig,
-                                            args)
-
-      exception_tuple = _GetExceptionsTupleFromFuncSig(module,
-                                                       func_sig)
-      # checking exceptions
-      # semantic is "may raise": function doesn't have to throw
-      # an exception despite declaring it in its signature
-      # we check for excptions caught that were
-      # not explicitly declared in the signature
-      try:
-        # TODO(raoulDoc): get a better understanding of classmethod
-        # Is there a way without removing the first argument?
-        if _IsClassMethod(func):
-          mod_args = mod_args[1:]
-        res = func(*mod_args, **kwargs)
-      except Exception as e:
-        # check if the exception caught was explicitly declared
-        if (not isinstance(e, CheckTypeAnnotationError) and
-            not IsCompatibleType(e, exception_tuple)):
-          type_error_list.append(ExceptionTypeErrorMsg(
-              func_name, type(e), exception_tuple))
-
-          raise CheckTypeAnnotationError(type_error_list, e)
-        raise  # rethrow exception to preserve program semantics
-      else:
-        # checking return type
-        expected_return_type = ConvertToType(module,
-                                             func_sig.return_type)
-        if not IsCompatibleType(res, expected_return_type):
-          type_error_list.append(ReturnTypeErrorMsg(
-              func_name, type(res), expected_return_type))
-
-        if type_error_list:
-          raise CheckTypeAnnotationError(type_error_list)
-
-        return res
-   # overloading checking
-    else:
-      # TODO(raoulDoc): overloaded class method support
-      # TODO(raoulDoc): support for overloaded typed generators
-      param_sig_checked = ((func_sig,
-                            _GetParamTypeErrors(module,
-                                                func_name,
-                                                func_sig,
-                                                args))
-                           for func_sig in func_sigs)
-
-      # filter parameter signatures that yield no type errors
-      func_sig_candidates = [func_sig
-                             for (func_sig, type_errors) in param_sig_checked
-                             if not type_errors]
-      # nothing? this means no good signatures: overloading error
-      if not func_sig_candidates:
-        raise CheckTypeAnnotationError(
-            [OverloadingTypeErrorMsg(func_name)])
-
-      # need to check return type and exceptions
-      try:
-        res = func(*args, **kwargs)
-      except Exception as e:
-        # Is the exception caught valid with at least one func sig?
+    key = (id(container), id(check))
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        if entry[2] != _FAILED and (verified == _FAILED or
+                                    verified > entry[2]):
+          self._entries[key] = (container, check, verified, entry[3])
+        return
+      self._entries[key] = (container, check, verified, size)
+      self._order.append(key)
+      self._bytes += size
+      while self._order and (len(self._entries) > self.max_entries or
+                             self._bytes > self.max_bytes):
+        evicted = self._entries.pop(self._order.popleft())
+        self._bytes -= evicted[3]
+
+
+def _EstimatedSize(container, elements):
+  """Estimate the memory a container keeps alive, from some of its elements.
 
-        for func_sig in func_sig_candidates:
-          if IsCompatibleType(e, _GetExceptionsTupleFromFuncSig(module,
-                                                                func_sig)):
-            raise
+  Args:
+    container: A container that supports len()
+    elements: A non-empty sequence of elements of the container
 
-        raise CheckTypeAnnotationError(
-            [OverloadingTypeErrorMsg(func_name)])
-      else:
-        # Is the return type valid with at least one func sig?
-        for func_sig in func_sig_candidates:
-          if IsCompatibleType(res,
-                              ConvertToType(module,
-                                            func_sig.return_type)):
-            return res
+  Returns:
+    The size of the container itself plus its length times the average
+    (shallow) size of the first few elements, in bytes
+  """
+  elements = elements[:4]  # getsizeof isn't cheap
+  element_sizes = sum(itertools.imap(sys.getsizeof, elements))
+  return (sys.getsizeof(container) +
+          len(container) * element_sizes // len(elements))
 
-        raise CheckTypeAnnotationError(
-            [OverloadingTypeErrorMsg(func_name)])
 
-  Wrapped.__name__ = func.__name__
-  Wrapped.__doc__ = func.__doc__
-  Wrapped.__module__ = func.__module__
-  return classmethod(Wrapped) if(_IsClassMethod(func)) else Wrapped
+_IMMUTABLE_MEMO = _ImmutableContainerMemo()
 
 
-# TODO(raoulDoc): attach line number of functions/classes
-def _PrintWarning(msg):
-  print("(Warning)", msg, "not annotated", file=sys.stderr)
+def _CountElements(state, checked, skipped):
+  """Add up the elements checked and skipped in a function's CheckState."""
+  if state is not None:
+    state.elements_checked += checked
+    state.elements_skipped += skipped
 
 
-def _Check(module, classes_to_check, functions_to_check):
-  """TypeChecks a module.
+class _ContainerCheck(object):
+  """Check of a homogeneous container, within an element budget.
 
-  Args:
-    module: the module to typecheck
-    classes_to_check: list of classes_to_check parsed from the type declarations
-    functions_to_check: list of functions parsed from the type declarations
+  Typed buffers (array.array, memoryview, NumPy arrays) are checked on the
+  type of their elements, see _BufferElementType, in O(1).
+
+  Tuples and frozensets are sampled like other containers, but each check
+  also verifies the next budget of their leading elements, and the progress
+  is remembered in _IMMUTABLE_MEMO, as long as the element check only
+  depends on the type of the elements. (A tuple of lists is immutable, but
+  the lists aren't, and a custom __instancecheck__ can look at anything.)
+  Once all their elements are verified, they aren't looked at again.
+
+  If the check belongs to a checked function, the number of elements checked
+  and skipped is added up in the function's CheckState.
   """
 
-  # typecheck functions in module
-  for f_name, f_def in Functions(module):
-    allowed_signatures = functions_to_check.get(f_name, None)
-    if allowed_signatures is not None:
-      module.__dict__[f_name] = TypeCheck(module,
-                                          f_name,
-                                          f_def,
-                                          allowed_signatures)
+  __slots__ = ("base_type", "element", "element_is_class", "budget", "state",
+               "memoizable")
+
+  def __init__(self, base_type, element, budget, state):
+    self.base_type = base_type
+    self.element = element
+    self.element_is_class = _IsClassCheck(element)
+    self.budget = budget
+    self.state = state
+    self.memoizable = _IsTypeDeterminedCheck(element)
+
+  def Matches(self, actual):
+    if not isinstance(actual, self.base_type):
+      return False
+    if not hasattr(actual, "__len__"):
+      # e.g. generators, which are checked while they're iterated
+      return True
+    element_cls = _BufferElementType(actual)
+    if element_cls is not None:
+      result = _ClassMatches(self.element, element_cls)
+      if result is not None:
+        _CountElements(self.state, len(actual), 0)
+        return result
+    if (self.memoizable and isinstance(actual, _IMMUTABLE_CONTAINERS) and
+        len(actual) <= _IMMUTABLE_MEMO.max_container_elements):
+      return self._VerifyNext(actual)
+    elements, total = self.budget.Sample(actual)
+    checked = min(total, self.budget.max_elements)
+    _CountElements(self.state, checked, total - checked)
+    return self._ElementsMatch(elements)
+
+  def _VerifyNext(self, actual):
+    """Check a tuple or frozenset, and verify its next leading elements."""
+    verified = _IMMUTABLE_MEMO.Lookup(actual, self) or 0
+    total = len(actual)
+    if verified == _FAILED or verified == total:
+      return verified == total
+    k = self.budget.max_elements
+    end = min(total, verified + k)
+    if isinstance(actual, tuple):
+      leading = actual[verified:end]
+      sample = self.budget.Sample(actual)[0] if total > k else ()
     else:
-      _PrintWarning(f_name)
+      # sets can only be iterated, so their sample would be the first
+      # elements, which are the first leading ones
+      leading = tuple(itertools.islice(actual, verified, end))
+      sample = ()
+    checked = len(sample) + len(leading)
+    _CountElements(self.state, checked, max(0, total - checked))
+    ok = self._ElementsMatch(sample) and self._ElementsMatch(leading)
+    _IMMUTABLE_MEMO.Add(actual, self, end if ok else _FAILED,
+                        _EstimatedSize(actual, leading) if not verified else 0)
+    return ok
+
+  def _ElementsMatch(self, elements):
+    element = self.element
+    if self.element_is_class:
+      for e in elements:
+        if not isinstance(e, element):
+          return False
+    else:
+      for e in elements:
+        if not element.Matches(e):
+          return False
+    return True
 
-  # typecheck methods in classes
-  for c_name, c_def in Classes(module):
-    if c_name in classes_to_check:
-      class_methods_to_check = {f.name: f.signatures
-                                for f in classes_to_check[c_name].methods}
 
-      for f_name, f_def in MethodsForClass(c_def):
-        allowed_signatures = class_methods_to_check.get(f_name, None)
-        if allowed_signatures is not None:
-          setattr(c_def, f_name, TypeCheck(module,
-                                           f_name,
-                                           f_def,
-                                           allowed_signatures))
-        else:
-          _PrintWarning(c_name + "." + f_name)
+class _MappingCheck(object):
+  """Check of the keys and values of a mapping, e.g. dict<str, int>.
+
+  Like _ContainerCheck, large mappings are checked on a sample of their
+  items, see ElementBudget.SampleItems.
+  """
+
+  __slots__ = ("base_type", "key", "value", "classes_only", "budget", "state")
+
+  def __init__(self, base_type, key, value, budget, state):
+    self.base_type = base_type
+    self.key = key
+    self.value = value
+    self.classes_only = _IsClassCheck(key) and _IsClassCheck(value)
+    self.budget = budget
+    self.state = state
+
+  def Matches(self, actual):
+    if not isinstance(actual, self.base_type):
+      return False
+    items, total = self.budget.SampleItems(actual)
+    _CountElements(self.state, len(items), total - len(items))
+    key, value = self.key, self.value
+    if self.classes_only:
+      for k, v in items:
+        if not (isinstance(k, key) and isinstance(v, value)):
+          return False
     else:
-      _PrintWarning(c_name)
+      for k, v in items:
+        if not (_Matches(key, k) and _Matches(value, v)):
+          return False
+    return True
 
 
-def CheckFromFile(module, path):
-  by_name = ParserUtils().LoadTypeDeclarationFromFile(path)
-  _Check(module, by_name.classes, by_name.funcs)
+class _TupleCheck(object):
+  """Check of a fixed-size tuple, e.g. tuple<int, str>.
+
+  These tuples are small, so all their elements are checked.
+  """
 
+  __slots__ = ("base_type", "elements", "state")
 
-def CheckFromData(module, data):
-  classes, funcs = ParserUtils().LoadTypeDeclaration(data)
-  _Check(module, classes, funcs)
+  def __init__(self, base_type, elements, state):
+    self.base_type = base_type
+    self.elements = elements
+    self.state = state
+
+  def Matches(self, actual):
+    if (not isinstance(actual, self.base_type) or
+        len(actual) != len(self.elements)):
+      return False
+    _CountElements(self.state, len(actual), 0)
+    for check, e in zip(self.elements, actual):
+      if not _Matches(check, e):
+        return False
+    return True
+
+
+def CompileType(formal, state=None):
+  """Compile a formal type for fast checking.
+
+  Nested unions of classes are flattened into a single tuple of classes, so
+  that one isinstance call checks all of them. Of generic types, only
+  mappings (e.g. dict<str, int>) and fixed-size tuples (e.g. tuple<int, int>)
+  have their parameters checked. Unions with container members
+  first try the tuple of classes, and only then the containers. Intersections
+  check their classes first, then everything else. Generator types also match
+  generators that a checked function passed on (_CheckedIterators).
+
+  Args:
+    formal: A formal type, as returned by ConvertToType
+    state: CheckState of the function the type belongs to, or None. Its
+      element budget is used for containers.
+
+  Returns:
+    A class or tuple of classes, for isinstance, or a check object with a
+    Matches(actual) method.
+  """
+  if isinstance(formal, pytd.UnionType):
+    classes = []
+    others = []
+    for t in formal.type_list:
+      compiled = CompileType(t, state)
+      if isinstance(compiled, tuple):
+        classes.extend(compiled)
+      elif _IsClassCheck(compiled):
+        classes.append(compiled)
+      else:
+        others.append(compiled)
+    # remove duplicates, keeping the order
+    classes = tuple(cls for i, cls in enumerate(classes)
+                    if cls not in classes[:i])
+    if not others:
+      return classes[0] if len(classes) == 1 else classes
+    return _UnionCheck(classes, tuple(others))
+  elif isinstance(formal, pytd.IntersectionType):
+    compiled = [CompileType(t, state) for t in formal.type_list]
+    classes = tuple(c for c in compiled if _IsClassCheck(c))
+    others = tuple(c for c in compiled if not _IsClassCheck(c))
+    if len(classes) == 1 and not others:
+      return classes[0]
+    return _IntersectionCheck(classes, others)
+  elif isinstance(formal, pytd.GenericType):
+    base_type = formal.base_type
+    if isinstance(base_type, type):
+      params = tuple(CompileType(p, state) for p in formal.parameters)
+      if issubclass(base_type, tuple):
+        return _TupleCheck(base_type, params, state)
+      if len(params) == 2 and issubclass(base_type, collections.Mapping):
+        budget = state.element_budget if state is not None else None
+        return _MappingCheck(base_type, params[0], params[1],
+                             budget or DEFAULT_ELEMENT_BUDGET, state)
+    # There is no generic way to know what the parameters of other classes
+    # mean, so only the class itself is checked.
+    return _CompileClass(base_type)
+  elif isinstance(formal, pytd.HomogeneousContainerType):
+    budget = state.element_budget if state is not None else None
+    return _ContainerCheck(_CompileClass(formal.base_type),
+                           CompileType(formal.element_type, state),
+                           budget or DEFAULT_ELEMENT_BUDGET,
+                           state)
+  return _CompileClass(formal)
+
+
+def _MatchesAnything(compiled):
+  if isinstance(compiled, tuple):
+    return object in compiled
+  return compiled is object
+
+
+# Types parsed by _ParseType, by text. Type nodes are immutable, so they can
+# be shared; only resolving them depends on the module. Building the parser
+# generates its tables, which takes much longer than parsing, so a single
+# parser is built on first use and shared (under a lock, since it keeps state
+# while parsing).
+_PARSED_TYPES = {}
+_MAX_PARSED_TYPES = 1024
+_TYPE_PARSER = None
+_TYPE_PARSER_LOCK = threading.Lock()
+
+
+def _ParseType(text):
+  """Parse a type in the declaration language, e.g. "list<int> or None"."""
+  global _TYPE_PARSER
+  pytd_type = _PARSED_TYPES.get(text)
+  if pytd_type is None:
+    with _TYPE_PARSER_LOCK:
+      if _TYPE_PARSER is None:
+        _TYPE_PARSER = parser.TypeDeclParser()
+      unit = _TYPE_PARSER.Parse("_: " + text)
+    if len(_PARSED_TYPES) >= _MAX_PARSED_TYPES:
+      _PARSED_TYPES.clear()
+    pytd_type = _PARSED_TYPES[text] = unit.constants[0].type
+  return pytd_type
+
+
+def ValidateMany(values, pytd_type, module=None, element_budget=None):
+  """Check a batch of values against a type.
+
+  The type is resolved and compiled once. Values are then grouped by their
+  class, and for most types (classes, and unions and intersections of
+  classes) whether a value matches only depends on its class, so each
+  distinct class is checked only once. Only values of classes for which the
+  answer depends on the value, e.g. lists for list<int>, are checked one by
+  one. So a batch of values of a single class costs about one type() call
+  per value.
+
+  Args:
+    values: An iterable of values
+    pytd_type: The type, as a string in the declaration language (e.g.
+      "dict<str, int> or None"), a type node, or a python type (see
+      ConvertToType)
+    module: The module to resolve type names in. By default, only builtin
+      types can be used.
+    element_budget: ElementBudget for the elements of containers. By
+      default, large containers are only sampled, like arguments are.
+
+  Returns:
+    The sorted list of the indices of the values that don't match the type
+
+  Raises:
+    SyntaxError: if pytd_type is a string that can't be parsed
+  """
+  if module is None:
+    module = sys.modules["__builtin__"]
+  if isinstance(pytd_type, basestring):
+    pytd_type = _ParseType(pytd_type)
+  state = None
+  if element_budget is not None:
+    state = CheckState("ValidateMany", element_budget=element_budget)
+  compiled = CompileType(_ConvertToType(module, pytd_type, {}), state)
+  if not isinstance(values, (list, tuple)):
+    values = list(values)
+  classes = map(type, values)
+  verdicts = {}
+  for cls in set(classes):
+    if cls is types.InstanceType or _HasCustomClassAttribute(cls):
+      verdicts[cls] = None  # isinstance doesn't go by type() for these
+    else:
+      verdicts[cls] = _ClassMatches(compiled, cls)
+  suspects = {cls for cls, verdict in verdicts.iteritems()
+              if verdict is not True}
+  if not suspects:
+    return []
+  failing = []
+  for i in itertools.compress(itertools.count(),
+                              itertools.imap(suspects.__contains__,
+                                             classes)):
+    if verdicts[classes[i]] is False or not _Matches(compiled, values[i]):
+      failing.append(i)
+  return failing
+
+
+# A compiled record plan: the fields declared as constants of a pytd class
+# (and of its parents in the same declarations), resolved once.
+#   class_name: name of the pytd class.
+#   names: tuple of the field names, in declaration order, parents first.
+#   formals: tuple of the formal types of the fields (see ConvertToType).
+#   checks: tuple of the compiled field types (see CompileType).
+#   classes: the checks, if they can all be checked with isinstance, or
+#     None.
+RecordPlan = collections.namedtuple(
+    'RecordPlan', ['class_name', 'names', 'formals', 'checks', 'classes'])
+
+RecordResult = collections.namedtuple(
+    'RecordResult', ['index', 'record', 'violations'])
+
+
+def _ClassConstants(unit, cls):
+  """The constants of a pytd class and of its parents in unit, by name."""
+  constants = collections.OrderedDict()
+  for parent in cls.parents:
+    if isinstance(parent, pytd.NamedType):
+      try:
+        parent_cls = unit.Lookup(parent.name)
+      except KeyError:
+        continue  # e.g. object
+      if isinstance(parent_cls, pytd.Class):
+        constants.update(_ClassConstants(unit, parent_cls))
+  for constant in cls.constants:
+    constants.pop(constant.name, None)
+    constants[constant.name] = constant.type
+  return constants
+
+
+def CompileRecordPlan(unit, class_name, module=None, state=None):
+  """Resolve the fields of a pytd class into a RecordPlan.
+
+  Args:
+    unit: A TypeDeclUnit, as returned by the parser
+    class_name: Name of a class in unit
+    module: The module to resolve type names in. By default, only builtin
+      types can be used.
+    state: CheckState whose element budget is used for containers, or None
+
+  Returns:
+    A RecordPlan
+
+  Raises:
+    KeyError: if unit has no class class_name
+  """
+  cls = unit.Lookup(class_name)
+  if not isinstance(cls, pytd.Class):
+    raise KeyError(class_name)
+  if module is None:
+    module = sys.modules["__builtin__"]
+  constants = _ClassConstants(unit, cls)
+  formals = tuple(_ConvertToType(module, t, {})
+                  for t in constants.itervalues())
+  checks = tuple(CompileType(formal, state) for formal in formals)
+  classes = checks if all(_IsClassCheck(c) for c in checks) else None
+  return RecordPlan(class_name, tuple(constants), formals, checks, classes)
+
+
+def _IsMapping(record):
+  return type(record) is dict or isinstance(record, collections.Mapping)
+
+
+def _FieldValues(record, names):
+  """The values of the fields of a record, a mapping or an object."""
+  if _IsMapping(record):
+    return [record.get(name, _MISSING) for name in names]
+  return [getattr(record, name, _MISSING) for name in names]
+
+
+def _RecordViolations(plan, record, index):
+  """Return the TypeViolations of one record."""
+  names = plan.names
+  # Fast path: all fields present and matching, without any Python code per
+  # field.
+  values = None
+  try:
+    if not _IsMapping(record):
+      values = map(getattr, [record] * len(names), names)
+    elif all(itertools.imap(record.__contains__, names)):
+      # Looking for the fields first, since a mapping with __missing__ (like
+      # a defaultdict) would add the ones that aren't there.
+      values = map(record.__getitem__, names)
+  except (KeyError, AttributeError):
+    pass
+  if values is not None:
+    if plan.classes is not None:
+      if all(itertools.imap(isinstance, values, plan.classes)):
+        return []
+    elif all(itertools.imap(_Matches, plan.checks, values)):
+      return []
+  violations = []
+  for name, formal, check, value in zip(names, plan.formals, plan.checks,
+                                        _FieldValues(record, names)):
+    if value is _MISSING:
+      violations.append(FieldTypeErrorMsg(plan.class_name, name, None,
+                                          formal, index))
+    elif not _Matches(check, value):
+      violations.append(FieldTypeErrorMsg(plan.class_name, name, type(value),
+                                          formal, index))
+  return violations
+
+
+def ValidateRecords(records, unit, class_name, module=None,
+                    element_budget=None, invalid_only=True):
+  """Check a stream of records against the constants of a pytd class.
+
+  For a declaration like
+
+    class Point:
+      x: int
+      y: float or None
+
+  every record needs a field x with an int and a field y with a float or
+  None. Records are mappings (e.g. dicts decoded from JSON) or objects with
+  the fields as attributes. Constants of parent classes in the same
+  declarations are fields, too. Fields that aren't declared are ignored.
+
+  The fields are resolved and compiled into a RecordPlan once. Records are
+  then checked one at a time as they're pulled from the returned iterator,
+  and no references to them are kept, so a feed of any size can be checked
+  in constant memory.
+
+  Args:
+    records: An iterable of records
+    unit: A TypeDeclUnit, as returned by the parser
+    class_name: Name of the class in unit the records are declared as
+    module: The module to resolve type names in. By default, only builtin
+      types can be used.
+    element_budget: ElementBudget for the elements of containers. By
+      default, large containers are only sampled, like arguments are.
+    invalid_only: Only yield results for records with violations.
+
+  Returns:
+    An iterator of RecordResults (index, record, list of TypeViolations)
+
+  Raises:
+    KeyError: if unit has no class class_name
+  """
+  state = None
+  if element_budget is not None:
+    state = CheckState(class_name, element_budget=element_budget)
+  plan = CompileRecordPlan(unit, class_name, module, state)
+  return _ValidateRecords(plan, records, invalid_only)
+
+
+def _ValidateRecords(plan, records, invalid_only):
+  for index, record in enumerate(records):
+    violations = _RecordViolations(plan, record, index)
+    if violations or not invalid_only:
+      yield RecordResult(index, record, violations)
+
+
+# A compiled signature. All type names are resolved once, when the function
+# is decorated, so that the checking wrapper only has to run isinstance calls.
+#   params: tuple of (name, formal type) pairs, in declaration order.
+#   param_checks: tuple of the compiled params (see CompileType), in
+#     declaration order.
+#   class_checks: tuple of (position, class or tuple of classes) for params
+#     that can be checked with isinstance (see CompileType). Params declared
+#     as "object" are left out.
+#   other_checks: tuple of (position, check object) for all other params.
+#   keyword_checks: dict {name: (position, compiled param)} for the params
+#     that are checked, to check arguments passed by keyword.
+#   generator_params: tuple of (position, element type, compiled element
+#     type) for params declared as containers (e.g. generator<int>) that
+#     might be passed a generator.
+#   generator_return: (element type, compiled element type) if the return
+#     type is a container that might be a generator (e.g. generator<int>,
+#     but not list<int>), or None.
+#   return_type: the formal return type.
+#   return_class: the class or tuple of classes to check the return value
+#     against, or None.
+#   return_check: the check object for the return value if return_class is
+#     None.
+#   exceptions: tuple of exception classes the function may raise.
+#   deps: the bindings the types were resolved through (see TypeCache). The
+#     plan is stale once one of them has been rebound.
+CheckPlan = collections.namedtuple(
+    'CheckPlan',
+    ['params', 'param_checks', 'class_checks', 'other_checks',
+     'keyword_checks', 'generator_params', 'generator_return',
+     'return_type', 'return_class', 'return_check', 'exceptions', 'deps'])
+
+
+def CompileSignature(module, func_sig, state=None):
+  """Resolve all the types of a signature into a CheckPlan.
+
+  Args:
+    module: The module to look up symbols/types
+    func_sig: function definition (Signature)
+    state: CheckState of the function, or None
+
+  Returns:
+    A CheckPlan
+  """
+  cache = GetTypeCache(module)
+  deps = {}
+
+  def Resolve(type_node):
+    resolved, type_deps = cache.Lookup(type_node)
+    for namespace, name, obj in type_deps:
+      deps[(id(namespace), name)] = (namespace, name, obj)
+    return resolved
+
+  params = tuple((p.name, Resolve(p.type)) for p in func_sig.params)
+  compiled_params = [(i, CompileType(t, state))
+                     for i, (_, t) in enumerate(params)]
+  class_checks = tuple((i, c) for i, c in compiled_params
+                       if _IsClassCheck(c) and not _MatchesAnything(c))
+  other_checks = tuple((i, c) for i, c in compiled_params
+                       if not _IsClassCheck(c))
+  keyword_checks = {params[i][0]: (i, c) for i, c in compiled_params
+                    if not _MatchesAnything(c)}
+  generator_params = tuple(
+      (i, t.element_type, CompileType(t.element_type, state))
+      for i, (_, t) in enumerate(params)
+      if isinstance(t, pytd.HomogeneousContainerType))
+  return_type = Resolve(func_sig.return_type)
+  if (isinstance(return_type, pytd.HomogeneousContainerType) and
+      isinstance(return_type.base_type, type) and
+      issubclass(types.GeneratorType, return_type.base_type)):
+    generator_return = (return_type.element_type,
+                        CompileType(return_type.element_type, state))
+  else:
+    generator_return = None
+  return_compiled = CompileType(return_type, state)
+  exceptions = []
+  for e in func_sig.exceptions:
+    compiled = CompileType(Resolve(e), state)
+    exceptions.extend(compiled if isinstance(compiled, tuple) else [compiled])
+  return CheckPlan(
+      params=params,
+      param_checks=tuple(c for _, c in compiled_params),
+      class_checks=class_checks,
+      other_checks=other_checks,
+      keyword_checks=keyword_checks,
+      generator_params=generator_params,
+      generator_return=generator_return,
+      return_type=return_type,
+      return_class=(return_compiled if _IsClassCheck(return_compiled)
+                    else None),
+      return_check=(None if _IsClassCheck(return_compiled)
+                    else return_compiled),
+      exceptions=tuple(exceptions),
+      deps=tuple(deps.itervalues()))
+
+
+def _ParamsMatch(plan, args, kwargs=None):
+  """Fast check of actual params vs a CheckPlan, without error messages.
+
+  Arguments passed by keyword are looked up in plan.keyword_checks. Unknown
+  keywords are left to the function, which raises a TypeError for them.
+
+  Args:
+    plan: CheckPlan of the signature
+    args: actual arguments passed to the function
+    kwargs: actual keyword arguments passed to the function, or None
+
+  Returns:
+    True if all the params that were passed match their formal type
+  """
+  num_args = len(args)
+  for i, cls in plan.class_checks:
+    if i < num_args and not isinstance(args[i], cls):
+      return False
+  for i, check in plan.other_checks:
+    if i < num_args and not check.Matches(args[i]):
+      return False
+  if kwargs:
+    keyword_checks = plan.keyword_checks
+    for name, value in kwargs.iteritems():
+      entry = keyword_checks.get(name)
+      if entry is not None and not _Matches(entry[1], value):
+        return False
+  return True
+
+
+def _ReturnMatches(plan, res):
+  if plan.return_class is not None:
+    return isinstance(res, plan.return_class)
+  return plan.return_check.Matches(res)
+
+
+def _GetParamTypeErrors(func_name, plan, args, kwargs=None):
+  """Helper for checking actual params vs formal params signature.
+
+  Args:
+    func_name: function name
+    plan: CheckPlan of the signature
+    args: actual arguments passed to the function
+    kwargs: actual keyword arguments passed to the function, or None
+
+  Returns:
+    A list of potential type errors, in the order of the params
+  """
+  errors = [(i, n, p, t) for i, ((n, t), check, p)
+            in enumerate(zip(plan.params, plan.param_checks, args))
+            if not _Matches(check, p)]
+  if kwargs:
+    for name, value in kwargs.iteritems():
+      entry = plan.keyword_checks.get(name)
+      if entry is not None and not _Matches(entry[1], value):
+        i = entry[0]
+        errors.append((i, name, value, plan.params[i][1]))
+    errors.sort(key=lambda error: error[0])
+  return [ParamTypeErrorMsg(func_name, n, type(p), t)
+          for _, n, p, t in errors]
+
+
+def _WrapGeneratorArgs(func_name, plan, args, kwargs, state=None):
+  """Replace typed generators passed as arguments with checking versions.
+
+  Args:
+    func_name: function name
+    plan: CheckPlan of the signature
+    args: actual arguments passed to the function
+    kwargs: actual keyword arguments passed to the function
+    state: CheckState of the function, for its ItemSampling
+
+  Returns:
+    A tuple (list of arguments, dict of keyword arguments) to pass on to the
+    function.
+  """
+  # need to copy args tuple into list so can modify individual arg
+  # specfically we want to replace args with decorated variants
+  mod_args = list(args)
+  # we check if we already created a decorated version
+  # for cases such as foo(same_gen, same_gen)
+  cache_of_generators = {}
+
+  def Wrap(actual, element_type, check):
+    if actual not in cache_of_generators:
+      cache_of_generators[actual] = _CheckedIterator(
+          actual, func_name, check, element_type, state)
+    return cache_of_generators[actual]
+
+  num_args = len(args)
+  mod_kwargs = kwargs
+  for i, element_type, check in plan.generator_params:
+    if i < num_args:
+      if isinstance(args[i], _GENERATOR_CLASSES):
+        mod_args[i] = Wrap(args[i], element_type, check)
+    elif kwargs:
+      name = plan.params[i][0]
+      actual = kwargs.get(name)
+      if isinstance(actual, _GENERATOR_CLASSES):
+        if mod_kwargs is kwargs:
+          mod_kwargs = dict(kwargs)
+        mod_kwargs[name] = Wrap(actual, element_type, check)
+  return mod_args, mod_kwargs
+
+
+# Maximum number of argument type tuples remembered per overloaded function.
+_MAX_DISPATCH_CACHE_SIZE = 256
+
+# Dispatch cache entry for argument types whose values have to be matched
+# one by one: old-style instances, and instances that can lie about their
+# __class__.
+_BY_VALUE = object()
+
+
+class _CompiledSignatures(object):
+  """The CheckPlans of a function, recompiled when they become stale.
+
+  For overloaded functions, this also caches which signatures the arguments
+  of a call match, keyed on the tuple of the argument types. That is only
+  done if no signature has a parameter with a container type, or with a
+  class with a custom __instancecheck__, because for those, the answer
+  depends on the argument's value. Neither are calls with arguments whose
+  class isn't type() of them, like old-style instances, or proxies that
+  override __class__.
+
+  Attributes:
+    module: The module to look up symbols/types
+    func_sigs: The signatures of the function
+    state: The CheckState of the function, or None
+    plans: The CheckPlans of the signatures
+    deps: The bindings the plans were resolved through
+    dispatch: dict {tuple of argument types: tuple of matching CheckPlans,
+      or _BY_VALUE}
+    dispatch_cacheable: Whether dispatch is used
+  """
+
+  __slots__ = ("module", "func_sigs", "state", "plans", "deps", "dispatch",
+               "dispatch_cacheable")
+
+  def __init__(self, module, func_sigs, state=None):
+    self.module = module
+    self.func_sigs = func_sigs
+    self.state = state
+    self.dispatch = {}
+    self.Compile()
+
+  def Compile(self):
+    self.plans = tuple(CompileSignature(self.module, func_sig, self.state)
+                       for func_sig in self.func_sigs)
+    self.deps = tuple({(id(namespace), name): (namespace, name, obj)
+                       for plan in self.plans
+                       for namespace, name, obj in plan.deps}.itervalues())
+    self.dispatch.clear()
+    self.dispatch_cacheable = all(_IsTypeDeterminedCheck(check)
+                                  for plan in self.plans
+                                  for check in plan.param_checks)
+
+  def MatchingPlans(self, args, kwargs=None):
+    """Return the plans whose parameters match the arguments of a call.
+
+    Calls with keyword arguments are not cached.
+
+    Args:
+      args: actual arguments passed to the function
+      kwargs: actual keyword arguments passed to the function, or None
+
+    Returns:
+      A sequence of CheckPlans
+    """
+    plans = self.Current()
+    if kwargs or not self.dispatch_cacheable:
+      return [plan for plan in plans if _ParamsMatch(plan, args, kwargs)]
+    key = tuple(map(type, args))
+    candidates = self.dispatch.get(key)
+    if candidates is None:
+      if len(self.dispatch) >= _MAX_DISPATCH_CACHE_SIZE:
+        self.dispatch.clear()
+      if any(cls is types.InstanceType or _HasCustomClassAttribute(cls)
+             for cls in key):
+        # isinstance doesn't go by type() for these
+        candidates = self.dispatch[key] = _BY_VALUE
+      else:
+        candidates = self.dispatch[key] = tuple(
+            plan for plan in plans if _ParamsMatch(plan, args))
+    if candidates is _BY_VALUE:
+      return [plan for plan in plans if _ParamsMatch(plan, args)]
+    return candidates
+
+  def Current(self):
+    """Return the plans, after recompiling them if a type was rebound."""
+    if not _DependenciesAreCurrent(self.deps):
+      self.Compile()
+    return self.plans
+
+
+class CheckState(object):
+  """Runtime state of a checked function.
+
+  Only every sample_rate-th call of the function is checked. With a random
+  source, the distance between two checked calls is drawn from a geometric
+  distribution instead, so that 1 in sample_rate calls is checked on average
+  but periodic call patterns can't hide from the checker. Either way, an
+  unchecked call only costs a decrement of the countdown. The number of calls
+  is worked out from the countdown when it's needed (see Calls), so it
+  doesn't cost anything either.
+
+  Sampling is not synchronized between threads: a concurrent call might
+  occasionally be checked twice or skipped, which doesn't matter for sampling.
+
+  Attributes:
+    name: Name of the checked function ("Class.method" for methods)
+    sample_rate: Check 1 in sample_rate calls
+    random: random.Random instance for random sampling, or None
+    countdown: Number of calls until the next checked call
+    interval: The countdown the current sampling interval started with
+    fixed_interval: The sample rate, if every interval is the same and no
+      governor measures the checked calls, or None. Generated wrappers start
+      the next interval themselves if it's set, instead of calling Sample.
+    interval_calls: Number of calls in the sampling intervals before that
+    checked_calls: Number of calls that were checked
+    violations: Number of checked calls that raised a type error, or that
+      were reported in shadow mode
+    sink: Object whose Record method is called for each error raised, like
+      ShadowChecker.sink, or None
+    timings: CheckTimings measuring the checked calls, or None
+    governor: Governor adapting sample_rate to a CPU budget, or None
+    window_calls: Checked calls measured by the governor so far
+    window_check_time: Seconds spent checking during these calls
+    window_body_time: Seconds spent in the function during these calls
+    last_checked: Time of the last checked call, for the governor
+    last_checked_calls: Number of calls up to the last checked call
+    suspended: Whether checking is suspended, see Suspend
+    signatures: The compiled signatures of the function, set by TypeCheck
+    element_budget: ElementBudget for container arguments and return values,
+      or None for the default budget
+    item_sampling: ItemSampling for generator arguments and return values,
+      or None to check all their items
+    elements_checked: Number of container elements checked so far
+    elements_skipped: Number of container elements left out by the budget
+    boundary_calls: Number of calls from outside the module, in boundary-only
+      mode (these are checked, subject to sampling)
+    internal_calls: Number of calls from inside the module, which boundary-
+      only mode doesn't check
+  """
+
+  __slots__ = ("name", "sample_rate", "random", "countdown", "interval",
+               "fixed_interval", "interval_calls", "checked_calls",
+               "violations", "sink", "timings",
+               "governor", "window_calls", "window_check_time",
+               "window_body_time", "last_checked", "last_checked_calls",
+               "suspended", "signatures",
+               "element_budget", "elements_checked", "elements_skipped",
+               "item_sampling", "boundary_calls", "internal_calls")
+
+  def __init__(self, name, sample_rate=1, rand=None, governor=None,
+               element_budget=None, timings=None, item_sampling=None,
+               sink=None):
+    self.name = name
+    self.countdown = self.interval = 0
+    self.fixed_interval = None
+    self.interval_calls = 0
+    self.checked_calls = 0
+    self.violations = 0
+    self.sink = sink
+    self.timings = timings
+    self.item_sampling = item_sampling
+    self.signatures = None
+    self.element_budget = element_budget
+    self.elements_checked = 0
+    self.elements_skipped = 0
+    self.boundary_calls = 0
+    self.internal_calls = 0
+    self.governor = governor
+    if governor is not None:
+      governor.states.append(self)
+    self.last_checked = None
+    self.last_checked_calls = 0
+    self.suspended = False
+    self.ResetWindow()
+    self.SetSampleRate(sample_rate, rand)
+
+  def ResetWindow(self):
+    self.window_calls = 0
+    self.window_check_time = 0.0
+    self.window_body_time = 0.0
+
+  def SetSampleRate(self, sample_rate, rand=None):
+    """Change the sample rate. Takes effect immediately.
+
+    Args:
+      sample_rate: Check 1 in sample_rate calls. 1 checks every call.
+      rand: random.Random instance to sample randomly, or None to check
+        exactly every sample_rate-th call.
+
+    Raises:
+      ValueError: if the sample rate is smaller than 1
+    """
+    if sample_rate < 1:
+      raise ValueError("Invalid sample rate: {!r}".format(sample_rate))
+    self.sample_rate = sample_rate
+    self.random = rand
+    if self.suspended:
+      return  # takes effect on Resume
+    self.interval_calls += self._PendingCalls()
+    self.countdown = self.interval = self.NextInterval()
+    if (rand is None or sample_rate == 1) and self.governor is None:
+      self.fixed_interval = sample_rate
+    else:
+      self.fixed_interval = None
+
+  def CountViolation(self, errors):
+    """Account for a call that raises a CheckTypeAnnotationError.
+
+    Args:
+      errors: The TypeViolations of the call. They get the name of the
+        function as qualified_name, and are recorded to the sink.
+    """
+    self.violations += 1
+    for error in errors:
+      error.qualified_name = self.name
+    if self.sink is not None:
+      plans = self.signatures.plans if self.signatures is not None else ()
+      for error in errors:
+        self.sink.Record(self.name, *_SinkRecord(error, plans))
+
+  def Sample(self):
+    """Account for a checked call, and return the next countdown."""
+    self.checked_calls += 1
+    if self.suspended:
+      # a call that was already due when checking was suspended
+      return float("inf")
+    self.interval_calls += self.interval
+    self.interval = self.NextInterval()
+    return self.interval
+
+  def Suspend(self):
+    """Stop checking, until Resume.
+
+    Calls made in the meantime aren't counted. Changing the sample rate
+    doesn't resume checking, it only sets the rate Resume starts with.
+    """
+    self.interval_calls += self._PendingCalls()
+    self.suspended = True
+    self.countdown = self.interval = float("inf")
+    self.fixed_interval = None
+
+  def Resume(self):
+    """Start checking again, with the current sample rate."""
+    self.suspended = False
+    self.SetSampleRate(self.sample_rate, self.random)
+
+  def _PendingCalls(self):
+    """Number of calls since the current sampling interval started."""
+    if self.interval == float("inf"):
+      return 0
+    return self.interval - self.countdown
+
+  def Calls(self):
+    """Return the number of calls of the function so far."""
+    return self.interval_calls + self._PendingCalls() + self.internal_calls
+
+  def NextInterval(self):
+    """Return the number of calls until the next checked call."""
+    if self.random is None or self.sample_rate == 1:
+      return self.sample_rate
+    # geometric distribution with mean sample_rate
+    return 1 + int(math.log(1.0 - self.random.random()) /
+                   math.log(1.0 - 1.0 / self.sample_rate))
+
+
+class Governor(object):
+  """Adapts the sample rates of checked functions to a CPU budget.
+
+  The governor measures checked calls only: how long checking the call took
+  and how long the function itself ran. Every `window` checked calls, it
+  picks the smallest sample rate for which checking costs at most `budget`
+  of the function's runtime. A function that was called less than once per
+  `cold_after` seconds on average since its last checked call is considered
+  cold, and is checked on every call again until the next window has been
+  measured. This goes by the calls, not the checked calls, which are far
+  apart for any function whose sample rate was raised.
+
+  So that a throttled function doesn't have to wait for its next checked
+  call to be found cold, the governor keeps track of the CheckStates that
+  use it, and looks at all of them (see Sweep) on any checked call it
+  records, at most once per cold_after seconds. If none of the functions are
+  called, nothing is recorded; call Sweep from a timer to cover that, too.
+
+  Attributes:
+    budget: Share of a function's runtime that may be spent checking it
+    window: Number of checked calls between two adjustments
+    max_sample_rate: Upper bound for the sample rate
+    cold_after: Average seconds between calls above which a function is cold
+    states: The CheckStates using the governor
+  """
+
+  def __init__(self, budget=0.02, window=100, max_sample_rate=1000000,
+               cold_after=1.0):
+    if not 0.0 < budget <= 1.0:
+      raise ValueError("Invalid budget: {!r}".format(budget))
+    self.budget = budget
+    self.window = window
+    self.max_sample_rate = max_sample_rate
+    self.cold_after = cold_after
+    self.states = []
+    self._last_sweep = None
+
+  def Record(self, state, now, check_time, body_time):
+    """Account for a checked call, and adjust the sample rate if needed.
+
+    Args:
+      state: CheckState of the function
+      now: Time at which the call started
+      check_time: Seconds spent checking the call
+      body_time: Seconds spent in the function
+    """
+    calls = state.Calls()
+    self._ResetIfCold(state, now, calls)
+    state.last_checked = now
+    state.last_checked_calls = calls
+    state.window_calls += 1
+    state.window_check_time += check_time
+    state.window_body_time += body_time
+    if state.window_calls >= self.window:
+      state.SetSampleRate(self.SampleRate(state.window_check_time,
+                                          state.window_body_time),
+                          state.random)
+      state.ResetWindow()
+    if self._last_sweep is None or now - self._last_sweep >= self.cold_after:
+      self.Sweep(now)
+
+  def Sweep(self, now=None):
+    """Check every call of the functions that have gone cold again.
+
+    Args:
+      now: The current time, by default that of the timer the checked calls
+        are measured with
+    """
+    if now is None:
+      now = _Timer()
+    self._last_sweep = now
+    for state in self.states:
+      self._ResetIfCold(state, now, state.Calls())
+
+  def _ResetIfCold(self, state, now, calls):
+    """Set the sample rate of a cold function back to 1.
+
+    A function is cold if it was called less than once per cold_after
+    seconds on average since its last checked call.
+    """
+    if (state.last_checked is not None and state.sample_rate > 1 and
+        now - state.last_checked >
+        self.cold_after * max(1, calls - state.last_checked_calls)):
+      state.ResetWindow()
+      state.SetSampleRate(1, state.random)
+
+  def SampleRate(self, check_time, body_time):
+    """Return the smallest sample rate that keeps checking within budget.
+
+    Checking 1 in n calls costs check_time / (n * body_time + check_time) of
+    the runtime.
+
+    Args:
+      check_time: Time spent checking a number of calls
+      body_time: Time spent in the function during the same calls
+
+    Returns:
+      The sample rate, between 1 and max_sample_rate
+    """
+    if check_time <= 0.0:
+      return 1
+    if body_time <= 0.0:
+      return self.max_sample_rate
+    rate = math.ceil(check_time * (1.0 - self.budget) /
+                     (self.budget * body_time))
+    return int(max(1, min(self.max_sample_rate, rate)))
+
+
+class _BodyTimer(object):
+  """Calls a function and measures how long it took."""
+
+  __slots__ = ("func", "started", "elapsed", "raised")
+
+  def __init__(self, func):
+    self.func = func
+    self.started = None
+    self.elapsed = 0.0
+    self.raised = False
+
+  def __call__(self, *args, **kwargs):
+    self.started = start = _Timer()
+    self.raised = True
+    try:
+      result = self.func(*args, **kwargs)
+      self.raised = False
+      return result
+    finally:
+      self.elapsed = _Timer() - start
+
+
+class CheckTimings(object):
+  """Where the time of the checked calls of a function went.
+
+  The time before the function is called counts as checking the parameters,
+  the time after it returned or raised as checking the return value or the
+  exception. Like sampling, the sums aren't synchronized between threads.
+
+  Attributes:
+    param_time: Seconds spent checking parameters
+    return_time: Seconds spent checking return values
+    exception_time: Seconds spent checking exceptions
+    body_time: Seconds spent in the function itself
+  """
+
+  __slots__ = ("param_time", "return_time", "exception_time", "body_time")
+
+  def __init__(self):
+    self.param_time = 0.0
+    self.return_time = 0.0
+    self.exception_time = 0.0
+    self.body_time = 0.0
+
+  def Record(self, start, end, body):
+    """Account for a checked call.
+
+    Args:
+      start: Time at which the call started
+      end: Time at which the call ended
+      body: The _BodyTimer the function was called through
+    """
+    if body.started is None:  # the call failed before the function ran
+      self.param_time += end - start
+      return
+    self.param_time += body.started - start
+    self.body_time += body.elapsed
+    after = end - body.started - body.elapsed
+    if body.raised:
+      self.exception_time += after
+    else:
+      self.return_time += after
+
+
+def _MeasuredCall(state, checked_call, target, args, kwargs):
+  """Run a checked call, and report its timings to the state's governor and
+  CheckTimings."""
+  body = _BodyTimer(target)
+  start = _Timer()
+  try:
+    return checked_call(body, args, kwargs)
+  finally:
+    end = _Timer()
+    if state.governor is not None:
+      state.governor.Record(state, start, end - start - body.elapsed,
+                            body.elapsed)
+    if state.timings is not None:
+      state.timings.Record(start, end, body)
+
+
+def _SingleSignatureCall(func_name, compiled):
+  """Create a function that checks a call against a single signature."""
+
+  def CheckedCall(call, args, kwargs):
+    """Typecheck a function given its signature.
+
+    Args:
+      call: the function to call
+      args: Arguments passed to the function
+      kwargs: Key/Value arguments passed to the function
+
+    Returns:
+      The result of calling the function decorated with typechecking
+
+    Raises:
+      CheckTypeAnnotationError: Type errors were found
+    """
+    plan, = compiled.Current()
+    state = compiled.state
+    # decorating all typed generators
+    if plan.generator_params:
+      mod_args, mod_kwargs = _WrapGeneratorArgs(func_name, plan, args, kwargs,
+                                                state)
+    else:
+      mod_args, mod_kwargs = args, kwargs
+    # type checking starts here
+    # checking params
+    # the error list is only built once something is wrong
+    if _ParamsMatch(plan, args, kwargs):
+      type_error_list = None
+    else:
+      type_error_list = _GetParamTypeErrors(func_name, plan, args, kwargs)
+
+    # checking exceptions
+    # semantic is "may raise": function doesn't have to throw
+    # an exception despite declaring it in its signature
+    # we check for excptions caught that were
+    # not explicitly declared in the signature
+    try:
+      res = call(*mod_args, **mod_kwargs)
+    except Exception as e:
+      # check if the exception caught was explicitly declared
+      if (not isinstance(e, CheckTypeAnnotationError) and
+          not isinstance(e, plan.exceptions)):
+        type_error_list = (type_error_list or []) + [ExceptionTypeErrorMsg(
+            func_name, type(e), plan.exceptions)]
+
+        state.CountViolation(type_error_list)
+        raise CheckTypeAnnotationError(type_error_list, e)
+      raise  # rethrow exception to preserve program semantics
+    else:
+      # checking return type
+      if not _ReturnMatches(plan, res):
+        type_error_list = (type_error_list or []) + [ReturnTypeErrorMsg(
+            func_name, type(res), plan.return_type)]
+
+      if type_error_list:
+        state.CountViolation(type_error_list)
+        raise CheckTypeAnnotationError(type_error_list)
+
+      # typed generators are checked while they're iterated
+      if (plan.generator_return is not None and
+          type(res) in _GENERATOR_CLASSES):
+        element_type, check = plan.generator_return
+        return _CheckedIterator(res, func_name, check, element_type, state)
+      return res
+
+  return CheckedCall
+
+
+def _OverloadedCall(func_name, compiled):
+  """Create a function that checks a call against overloaded signatures."""
+
+  def CheckedCall(call, args, kwargs):
+    """Typecheck a function given its overloaded signatures.
+
+    Args:
+      call: the function to call
+      args: Arguments passed to the function
+      kwargs: Key/Value arguments passed to the function
+
+    Returns:
+      The result of calling the function decorated with typechecking
+
+    Raises:
+      CheckTypeAnnotationError: No signature matches the call
+    """
+    # TODO(raoulDoc): support for overloaded typed generators
+
+    # filter parameter signatures that yield no type errors
+    candidates = compiled.MatchingPlans(args, kwargs)
+    # nothing? this means no good signatures: overloading error
+    if not candidates:
+      errors = [OverloadingTypeErrorMsg(func_name)]
+      compiled.state.CountViolation(errors)
+      raise CheckTypeAnnotationError(errors)
+
+    # need to check return type and exceptions
+    try:
+      res = call(*args, **kwargs)
+    except Exception as e:
+      # Is the exception caught valid with at least one func sig?
+      for plan in candidates:
+        if isinstance(e, plan.exceptions):
+          raise
+
+      errors = [OverloadingTypeErrorMsg(func_name)]
+      compiled.state.CountViolation(errors)
+      raise CheckTypeAnnotationError(errors)
+    else:
+      # Is the return type valid with at least one func sig?
+      for plan in candidates:
+        if _ReturnMatches(plan, res):
+          return res
+
+      errors = [OverloadingTypeErrorMsg(func_name)]
+      compiled.state.CountViolation(errors)
+      raise CheckTypeAnnotationError(errors)
+
+  return CheckedCall
+
+
+# Generated wrappers. For a function with a single signature and a plain
+# parameter list, TypeCheck generates a wrapper that takes the same
+# parameters as the function, so that calling it doesn't pack and unpack
+# *args and **kwargs, and that checks the parameters and the return value
+# with inlined isinstance calls. The source only depends on the shape of the
+# signature: the parameter names, which of the parameters and the return
+# value are checked with isinstance, with a check object, or not at all, the
+# number of bindings the types were resolved through, and whether only calls
+# from other modules are checked.
+# It's compiled once per shape; the classes, check objects and bindings are
+# passed to the compiled factory.
+#
+# A checked call doesn't call any Python function before the function
+# itself: with a fixed sample rate, the wrapper starts the next sampling
+# interval itself (see CheckState.fixed_interval), and instead of
+# _CompiledSignatures.Current, it looks up the bindings the types were
+# resolved through with the bound get methods of their namespaces.
+#
+# Anything the generated code doesn't handle is left to the generic
+# CheckedCall: calls with type errors (to report them), calls measured by a
+# governor, calls after a type was rebound, and calls whose arguments don't
+# fit the parameters (missing, extra or unknown keyword arguments), so that
+# these raise the same errors as with the generic wrapper. The exception is
+# a parameter passed both by position and by keyword, as in f(1, a=2):
+# Python raises the TypeError when it binds the arguments to the parameters
+# of the wrapper, before any of its code runs, so that call raises a plain
+# TypeError naming Wrapped rather than a CheckTypeAnnotationError.
+#
+# All names used by the generated code start with _tc_, so that they can't
+# clash with the parameter names.
+
+_CLASS_CHECK, _OBJECT_CHECK = "class", "object"
+
+_WRAPPER_FACTORIES = {}  # shape -> factory of wrapper functions
+
+
+def _WrapperSource(shape):
+  """Generate the source of a wrapper factory for a signature shape.
+
+  Args:
+    shape: tuple (parameter names, kinds of the parameter checks, kind of the
+      return check, number of bindings, boundary_only), where a kind is
+      _CLASS_CHECK, _OBJECT_CHECK or None (not checked). See TypeCheck for
+      boundary_only.
+
+  Returns:
+    The source of a function _tc_MakeWrapper, which takes the objects the
+    wrapper needs (see _SpecializedWrapper) and returns the wrapper.
+  """
+  names, param_kinds, return_kind, num_deps, boundary_only = shape
+  params = ", ".join(names)
+  args = "({},)".format(params) if names else "()"
+  check_names = ["_tc_c{}".format(i) for i in range(len(names))]
+  dep_names = ["_tc_get{0}, _tc_name{0}, _tc_bound{0}".format(i)
+               for i in range(num_deps)]
+  unusual = ["_tc_args", "_tc_kwargs"] + [
+      "{} is _tc_missing".format(name) for name in names]
+  conditions = [
+      "_tc_get{0}(_tc_name{0}, _tc_missing) is not _tc_bound{0}".format(i)
+      for i in range(num_deps)]
+  for name, kind, check in zip(names, param_kinds, check_names):
+    if kind == _CLASS_CHECK:
+      conditions.append("not _tc_isinstance({}, {})".format(name, check))
+    elif kind == _OBJECT_CHECK:
+      conditions.append("not {}.Matches({})".format(check, name))
+  lines = [
+      "def _tc_MakeWrapper(_tc_state, _tc_target, _tc_checked_call,",
+      "                    _tc_measured_call, _tc_unusual, _tc_unexpected,",
+      "                    _tc_bad_return, _tc_isinstance, _tc_Exception,",
+      "                    _tc_exceptions, _tc_getframe, _tc_globals,",
+      "                    _tc_missing, _tc_r{}):".format(
+          "".join(", " + c for c in check_names + dep_names)),
+      "  def Wrapped({}):".format(", ".join(
+          ["{}=_tc_missing".format(name) for name in names] +
+          ["*_tc_args", "**_tc_kwargs"])),
+      "    if ({}):".format(" or\n        ".join(unusual)),
+      "      return _tc_unusual({}, _tc_args, _tc_kwargs,".format(args),
+      "                         _tc_getframe(1).f_globals)",
+  ]
+  if boundary_only:
+    lines += [
+        "    if _tc_getframe(1).f_globals is _tc_globals:",
+        "      _tc_state.internal_calls += 1",
+        "      return _tc_target({})".format(params),
+        "    _tc_state.boundary_calls += 1",
+    ]
+  lines += [
+      "    _tc_state.countdown -= 1",
+      "    if _tc_state.countdown > 0:",
+      "      return _tc_target({})".format(params),
+      "    _tc_interval = _tc_state.fixed_interval",
+      "    if _tc_interval:",
+      "      _tc_state.checked_calls += 1",
+      "      _tc_state.interval_calls += _tc_interval",
+      "      _tc_state.countdown = _tc_interval",
+      "    else:",
+      "      _tc_state.countdown = _tc_state.Sample()",
+      "      if _tc_state.governor is not None:",
+      "        return _tc_measured_call(_tc_state, _tc_checked_call,",
+      "                                 _tc_target, {}, {{}})".format(args),
+  ]
+  if conditions:
+    lines += [
+        "    if ({}):".format(" or\n        ".join(conditions)),
+        "      return _tc_checked_call(_tc_target, {}, {{}})".format(args),
+    ]
+  lines += [
+      "    try:",
+      "      _tc_res = _tc_target({})".format(params),
+      "    except _tc_Exception as _tc_e:",
+      "      if _tc_isinstance(_tc_e, _tc_exceptions):",
+      "        raise",
+      "      raise _tc_unexpected(_tc_e)",
+  ]
+  if return_kind == _CLASS_CHECK:
+    lines += ["    if not _tc_isinstance(_tc_res, _tc_r):",
+              "      raise _tc_bad_return(_tc_res)"]
+  elif return_kind == _OBJECT_CHECK:
+    lines += ["    if not _tc_r.Matches(_tc_res):",
+              "      raise _tc_bad_return(_tc_res)"]
+  lines += ["    return _tc_res",
+            "  return Wrapped",
+            ""]
+  return "\n".join(lines)
+
+
+def _WrapperFactory(shape):
+  """Return the compiled wrapper factory for a signature shape."""
+  factory = _WRAPPER_FACTORIES.get(shape)
+  if factory is None:
+    namespace = {}
+    code = compile(_WrapperSource(shape),
+                   "<pytypedecl wrapper {}>".format(", ".join(shape[0])),
+                   "exec")
+    exec(code, namespace)  # pylint: disable=exec-used
+    factory = _WRAPPER_FACTORIES[shape] = namespace["_tc_MakeWrapper"]
+  return factory
+
+
+def _CheckKind(compiled):
+  """How the generated wrapper checks a compiled type (see _WrapperSource)."""
+  if not _IsClassCheck(compiled):
+    return _OBJECT_CHECK
+  return None if _MatchesAnything(compiled) else _CLASS_CHECK
+
+
+def _SpecializedWrapper(func_name, state, compiled, target, checked_call,
+                        module_globals):
+  """Generate a wrapper for a function with a single, simple signature.
+
+  Args:
+    func_name: Name of the function
+    state: CheckState of the function
+    compiled: _CompiledSignatures of the function
+    target: The function to call
+    checked_call: The generic CheckedCall of the function
+    module_globals: The globals of the module for boundary_only checking
+      (see TypeCheck), or None
+
+  Returns:
+    The wrapper, or None if the function needs the generic wrapper: if it
+    has several signatures, generator parameters or return value, or
+    parameters that aren't plain positional parameters.
+  """
+  if len(compiled.plans) != 1 or not isinstance(target, types.FunctionType):
+    return None
+  plan, = compiled.plans
+  if plan.generator_params or plan.generator_return is not None:
+    return None
+  names, varargs, keywords, defaults = inspect.getargspec(target)
+  if (varargs or keywords or defaults or len(names) != len(plan.params) or
+      not all(isinstance(name, str) and not name.startswith("_tc_")
+              for name in names)):
+    return None
+  return_compiled = (plan.return_class if plan.return_class is not None
+                     else plan.return_check)
+  deps = compiled.deps
+  shape = (tuple(names),
+           tuple(_CheckKind(c) for c in plan.param_checks),
+           _CheckKind(return_compiled),
+           len(deps),
+           module_globals is not None)
+
+  def Unusual(values, extra_args, extra_kwargs, caller_globals):
+    """Sample and check a call whose arguments don't fit the parameters.
+
+    Like the generic wrapper, this leaves it to the function to raise a
+    TypeError, which the checks of the call turn into a
+    CheckTypeAnnotationError.
+    """
+    args, kwargs = _RebuildArgs(names, values, extra_args, extra_kwargs)
+    if module_globals is not None:
+      if caller_globals is module_globals:
+        state.internal_calls += 1
+        return target(*args, **kwargs)
+      state.boundary_calls += 1
+    state.countdown -= 1
+    if state.countdown > 0:
+      return target(*args, **kwargs)
+    state.countdown = state.Sample()
+    if state.governor is None:
+      return checked_call(target, args, kwargs)
+    return _MeasuredCall(state, checked_call, target, args, kwargs)
+
+  def Unexpected(e):
+    errors = [ExceptionTypeErrorMsg(func_name, type(e), plan.exceptions)]
+    state.CountViolation(errors)
+    return CheckTypeAnnotationError(errors, e)
+
+  def BadReturn(res):
+    errors = [ReturnTypeErrorMsg(func_name, type(res), plan.return_type)]
+    state.CountViolation(errors)
+    return CheckTypeAnnotationError(errors)
+
+  dep_args = []
+  for namespace, name, obj in deps:
+    dep_args += [namespace.get, name, obj]
+  return _WrapperFactory(shape)(
+      state, target, checked_call, _MeasuredCall, Unusual, Unexpected,
+      BadReturn, isinstance, Exception,
+      plan.exceptions + (CheckTypeAnnotationError,), sys._getframe,  # pylint: disable=protected-access
+      module_globals, _MISSING, return_compiled,
+      *(plan.param_checks + tuple(dep_args)))
+
+
+def _RebuildArgs(names, values, extra_args, extra_kwargs):
+  """Turn the parameters of a generated wrapper back into *args, **kwargs.
+
+  Args:
+    names: The parameter names
+    values: The values of the parameters, _MISSING for the ones that weren't
+      passed
+    extra_args: The arguments beyond the parameters
+    extra_kwargs: The keyword arguments that aren't parameters
+
+  Returns:
+    A tuple (args, kwargs) to call the function with
+  """
+  passed = len(values)
+  for i, value in enumerate(values):
+    if value is _MISSING:
+      passed = i
+      break
+  kwargs = dict(extra_kwargs)
+  for name, value in zip(names[passed:], values[passed:]):
+    if value is not _MISSING:
+      kwargs[name] = value  # can only have been passed by keyword
+  return tuple(values[:passed]) + extra_args, kwargs
+
+
+def _ClassMayMatch(compiled, cls):
+  """Whether instances of cls can match a compiled type.
+
+  Unlike _ClassMatches, containers are only checked on their own type, since
+  their elements aren't known. Neither are the values that a class with a
+  custom __instancecheck__ looks at, so such classes may always match.
+
+  Args:
+    compiled: A result of CompileType
+    cls: A class
+
+  Returns:
+    True or False
+  """
+  if cls is types.InstanceType:
+    return True  # an old-style instance, whose class we don't know
+  if _IsClassCheck(compiled):
+    classes = compiled if isinstance(compiled, tuple) else (compiled,)
+    return any(_SubclassMayMatch(cls, c) for c in classes)
+  if isinstance(compiled, _UnionCheck):
+    return (any(_SubclassMayMatch(cls, c) for c in compiled.classes) or
+            any(_ClassMayMatch(c, cls) for c in compiled.others))
+  if isinstance(compiled, _IntersectionCheck):
+    return (all(_SubclassMayMatch(cls, c) for c in compiled.classes) and
+            all(_ClassMayMatch(c, cls) for c in compiled.others))
+  return issubclass(cls, compiled.base_type)
+
+
+def _SubclassMayMatch(cls, expected):
+  return _HasCustomInstanceCheck(expected) or issubclass(cls, expected)
+
+
+# Param indices of violations that aren't about a param. These are the same
+# as in violation_ring.
+RETURN_INDEX = -1
+EXCEPTION_INDEX = -2
+OVERLOAD_INDEX = -3
+GENERATOR_INDEX = -4
+
+
+def _SinkRecord(error, plans):
+  """Return the param index and observed type of a TypeViolation, for a sink.
+
+  Args:
+    error: A TypeViolation of a call
+    plans: The CheckPlans of the function, to look up param names in
+
+  Returns:
+    A tuple (param index, observed type)
+  """
+  if error.kind == TypeViolation.PARAM:
+    for plan in plans:
+      for i, (name, _) in enumerate(plan.params):
+        if name == error.param:
+          return i, error.observed
+  return {TypeViolation.RETURN: RETURN_INDEX,
+          TypeViolation.EXCEPTION: EXCEPTION_INDEX,
+          TypeViolation.GENERATOR: GENERATOR_INDEX}.get(
+              error.kind, OVERLOAD_INDEX), error.observed
+
+
+def _PrintViolation(errors):
+  for error in errors:
+    print("(Shadow)", error, file=sys.stderr)
+
+
+class ViolationSummary(collections.namedtuple(
+    "ViolationSummary", ["violation", "count", "seconds"])):
+  """How often a violation was repeated without being reported.
+
+  Attributes:
+    violation: The TypeViolation that was reported first
+    count: Number of repeats since the last summary
+    seconds: Seconds since the last summary
+  """
+
+  __slots__ = ()
+
+  def __str__(self):
+    return "{} (repeated {} times in the last {:.0f} seconds)".format(
+        self.violation, self.count, self.seconds)
+
+  def __repr__(self):
+    return repr(str(self))
+
+
+class ViolationLimiter(object):
+  """Reports each kind of violation once, and then only how often it recurs.
+
+  Violations are grouped by function, parameter (or return value, etc.) and
+  observed type (see TypeViolation.Key). The first violation of a group is
+  passed on to report; repeats are only counted. Once summary_interval
+  seconds have passed, the next call also reports a ViolationSummary for
+  every group that recurred in the meantime. So a call site that fails
+  millions of times costs a dict lookup per violation, not a log line.
+
+  Summaries are driven by incoming violations: there is no timer, so the
+  repeats since the last summary are only reported with the next violation
+  or by Flush. ShadowChecker.Stop flushes its report function if it has a
+  Flush method.
+
+  Use it as the report function of a ShadowChecker:
+    ShadowChecker(report=ViolationLimiter())
+
+  Attributes:
+    report: Function called with a list of TypeViolations and
+      ViolationSummaries
+    summary_interval: Minimum seconds between two summaries
+    clock: Function returning the current time in seconds
+    suppressed: Number of violations that were only counted
+  """
+
+  def __init__(self, report=None, summary_interval=60.0, clock=time.time):
+    self.report = report or _PrintViolation
+    self.summary_interval = summary_interval
+    self.clock = clock
+    self.suppressed = 0
+    self._repeats = {}  # key -> [first violation, repeats since summary]
+    self._last_summary = clock()
+    self._lock = threading.Lock()
+
+  def __call__(self, violations):
+    """Report a list of violations (e.g. of a call), if they're new."""
+    new = []
+    with self._lock:
+      for violation in violations:
+        entry = self._repeats.get(violation.Key())
+        if entry is None:
+          self._repeats[violation.Key()] = [violation, 0]
+          new.append(violation)
+        else:
+          entry[1] += 1
+          self.suppressed += 1
+      if self.clock() - self._last_summary >= self.summary_interval:
+        summaries = self._TakeSummaries()
+      else:
+        summaries = []
+    if new:
+      self.report(new)
+    if summaries:
+      self.report(summaries)
+
+  def Flush(self):
+    """Report the repeats counted since the last summary, right away."""
+    with self._lock:
+      summaries = self._TakeSummaries()
+    if summaries:
+      self.report(summaries)
+
+  def _TakeSummaries(self):
+    now = self.clock()
+    seconds = now - self._last_summary
+    self._last_summary = now
+    summaries = []
+    for entry in self._repeats.itervalues():
+      if entry[1]:
+        summaries.append(ViolationSummary(entry[0], entry[1], seconds))
+        entry[1] = 0
+    return summaries
+
+
+class ShadowChecker(object):
+  """Checks calls in a background thread ("shadow mode").
+
+  In shadow mode, a checked call only records the types of its arguments,
+  and the type of its result or of the exception it raised, in a bounded
+  queue. A background thread matches these types against the signatures,
+  and reports violations to a callback, instead of raising an error in the
+  caller.
+
+  Since only types are recorded, the elements of containers aren't checked,
+  only the type of the container itself (see _ClassMayMatch). Generators
+  aren't wrapped either.
+
+  Recording never blocks: deque appends are atomic, and if the queue is
+  full, the call is dropped and counted in `dropped` instead.
+
+  Violations can also be written to a sink, such as a
+  violation_ring.ViolationRing shared by several processes. The sink's
+  Record(func_name, param_index, observed_type) method is called for every
+  error, with the name of the function ("Class.method" for methods, see
+  TypeViolation.qualified_name), the index of the offending param, or
+  RETURN_INDEX, EXCEPTION_INDEX or OVERLOAD_INDEX (observed type None).
+  Outside of shadow mode, the sink is set on the CheckStates instead, see
+  CheckState.CountViolation.
+
+  Attributes:
+    max_queued: Maximum number of calls waiting to be checked
+    report: Function called with the list of TypeViolations of a call that
+      doesn't match its signatures, e.g. a ViolationLimiter
+    sink: Object whose Record method is called for each error, or None
+    poll_interval: Seconds the background thread sleeps if the queue is empty
+    checked: Number of calls checked so far
+    violations: Number of calls that didn't match their signatures
+    dropped: Number of calls that were dropped because the queue was full
+    errors: Number of calls whose checking or reporting raised an exception
+      in the background thread
+  """
+
+  def __init__(self, max_queued=10000, report=None, poll_interval=0.01,
+               sink=None):
+    self.max_queued = max_queued
+    self.report = report or _PrintViolation
+    self.sink = sink
+    self.poll_interval = poll_interval
+    self.checked = 0
+    self.violations = 0
+    self.dropped = 0
+    self.errors = 0
+    self._queue = collections.deque()
+    self._thread = None
+    self._stopping = False
+
+  def Submit(self, call):
+    """Queue a recorded call, or drop it if the queue is full."""
+    if len(self._queue) < self.max_queued:
+      self._queue.append(call)
+    else:
+      self.dropped += 1
+
+  def Drain(self):
+    """Check all the calls queued so far, in the calling thread."""
+    queue = self._queue
+    while True:
+      try:
+        call = queue.popleft()
+      except IndexError:
+        return
+      self._CheckCall(*call)
+
+  def Start(self):
+    """Start the background thread, unless it's running already."""
+    if self._thread is None:
+      self._stopping = False
+      self._thread = threading.Thread(target=self._Run,
+                                      name="pytypedecl-shadow")
+      self._thread.daemon = True
+      self._thread.start()
+
+  def Stop(self):
+    """Stop the background thread, after it checked the queued calls.
+
+    Flushes the report function too, if it has a Flush method (like
+    ViolationLimiter), so that no counted repeats are lost at shutdown.
+    """
+    if self._thread is not None:
+      self._stopping = True
+      self._thread.join()
+      self._thread = None
+    flush = getattr(self.report, "Flush", None)
+    if flush is not None:
+      flush()
+
+  def _Run(self):
+    while not self._stopping:
+      if self._queue:
+        self._DrainLogged()
+      else:
+        time.sleep(self.poll_interval)
+    self._DrainLogged()
+
+  def _DrainLogged(self):
+    """Drain the queue, printing errors instead of ending the thread."""
+    while True:
+      try:
+        self.Drain()
+        return
+      except Exception:  # pylint: disable=broad-except
+        # e.g. a failing report callback, or a signature that no longer
+        # compiles. The call that failed is dropped; carry on with the rest.
+        self.errors += 1
+        print("(Shadow) checking failed:", file=sys.stderr)
+        traceback.print_exc()
+
+  def _CheckCall(self, func_name, compiled, arg_types, kwarg_types,
+                 result_type, exception_type):
+    """Check the types of a call against a function's signatures."""
+    self.checked += 1
+    errors_per_plan = [_ShadowErrors(func_name, plan, arg_types, kwarg_types,
+                                     result_type, exception_type)
+                       for plan in compiled.Current()]
+    if all(errors_per_plan):
+      self.violations += 1
+      compiled.state.violations += 1
+      if len(errors_per_plan) == 1:
+        errors, = errors_per_plan
+      else:
+        errors = [(OVERLOAD_INDEX, None, OverloadingTypeErrorMsg(func_name))]
+      name = compiled.state.name  # "Class.method" for methods
+      for _, _, message in errors:
+        message.qualified_name = name
+      self.report([message for _, _, message in errors])
+      if self.sink is not None:
+        for index, cls, _ in errors:
+          self.sink.Record(name, index, cls)
+
+
+def _ShadowErrors(func_name, plan, arg_types, kwarg_types, result_type,
+                  exception_type):
+  """Match the types recorded for a call against a CheckPlan.
+
+  Args:
+    func_name: function name
+    plan: CheckPlan of the signature
+    arg_types: types of the arguments
+    kwarg_types: dict {name: type} of the keyword arguments, or None
+    result_type: type of the result, or None if an exception was raised
+    exception_type: type of the exception that was raised, or None
+
+  Returns:
+    A list of errors (param index, observed type, TypeViolation), empty if
+    the call matches the signature. The param index is RETURN_INDEX or
+    EXCEPTION_INDEX for the result.
+  """
+  errors = [(i, cls, ParamTypeErrorMsg(func_name, n, cls, t))
+            for i, ((n, t), check, cls)
+            in enumerate(zip(plan.params, plan.param_checks, arg_types))
+            if not _ClassMayMatch(check, cls)]
+  for name, cls in sorted((kwarg_types or {}).iteritems()):
+    entry = plan.keyword_checks.get(name)
+    if entry is not None and not _ClassMayMatch(entry[1], cls):
+      errors.append((entry[0], cls, ParamTypeErrorMsg(
+          func_name, name, cls, plan.params[entry[0]][1])))
+  if exception_type is not None:
+    if not issubclass(exception_type,
+                      plan.exceptions + (CheckTypeAnnotationError,)):
+      errors.append((EXCEPTION_INDEX, exception_type, ExceptionTypeErrorMsg(
+          func_name, exception_type, plan.exceptions)))
+  else:
+    return_compiled = (plan.return_class if plan.return_class is not None
+                       else plan.return_check)
+    if not _ClassMayMatch(return_compiled, result_type):
+      errors.append((RETURN_INDEX, result_type, ReturnTypeErrorMsg(
+          func_name, result_type, plan.return_type)))
+  return errors
+
+
+def _ShadowCall(func_name, compiled, shadow):
+  """Create a function that records a call for a ShadowChecker."""
+
+  def CheckedCall(call, args, kwargs):
+    """Call a function, and queue the types involved to be checked.
+
+    Args:
+      call: the function to call
+      args: Arguments passed to the function
+      kwargs: Key/Value arguments passed to the function
+
+    Returns:
+      The result of calling the function
+    """
+    arg_types = tuple(map(type, args))
+    kwarg_types = ({name: type(value) for name, value in kwargs.iteritems()}
+                   if kwargs else None)
+    try:
+      res = call(*args, **kwargs)
+    except Exception as e:
+      shadow.Submit((func_name, compiled, arg_types, kwarg_types, None,
+                     type(e)))
+      raise
+    shadow.Submit((func_name, compiled, arg_types, kwarg_types, type(res),
+                   None))
+    return res
+
+  return CheckedCall
+
+
+def TypeCheck(module, func_name, func, func_sigs, state=None,
+              specialize=True, boundary_only=False, shadow=None):
+  """Decorator for typechecking a function.
+
+  The signatures are compiled into CheckPlans here, once, so calling the
+  decorated function doesn't need to resolve any type names. Plans are only
+  recompiled if a global they were resolved through is rebound.
+
+  Args:
+    module: The module associated with the function to typecheck
+    func_name: Name of the function that's being checked.
+    func: A function to typecheck, or a staticmethod or classmethod object
+      (see _SplitDescriptor)
+    func_sigs: signatures of the function (Function)
+    state: CheckState controlling how often the function is checked. By
+      default, every call is checked.
+    specialize: Whether to generate a wrapper for the function's signature,
+      see _SpecializedWrapper. If False, or if the state has CheckTimings,
+      the generic wrapper is used.
+    boundary_only: Whether to only check calls from outside the module. Calls
+      from functions of the module itself are passed through; they're
+      recognized by the globals of the calling frame. The calls are counted
+      in state.internal_calls and state.boundary_calls.
+    shadow: A ShadowChecker to check calls in the background, or None to
+      check them in the calling thread.
+
+  Returns:
+    A decorated function with typechecking assertions, wrapped in the same
+    descriptor as func
+  """
+  if state is None:
+    state = CheckState(func_name)
+  compiled = _CompiledSignatures(module, func_sigs, state)
+  state.signatures = compiled
+  # A classmethod is wrapped as a classmethod, so we get the class as first
+  # argument and call the underlying function with it.
+  target, descriptor = _SplitDescriptor(func)
+
+  # TODO(raoulDoc): generalise single sig and multiple sig checking
+  # to reuse code?
+  # at the moment this implementation is convenient because for
+  # single signature we stack the errors before raising them
+  # for overloading we only have "no matching signature found"
+  if state.timings is not None:
+    specialize = False  # the generated wrappers don't measure calls
+  if shadow is not None:
+    checked_call = _ShadowCall(func_name, compiled, shadow)
+    specialize = False
+  elif len(func_sigs) == 1:
+    checked_call = _SingleSignatureCall(func_name, compiled)
+  else:
+    checked_call = _OverloadedCall(func_name, compiled)
+
+  module_globals = module.__dict__ if boundary_only else None
+  Wrapped = specialize and _SpecializedWrapper(func_name, state, compiled,
+                                                target, checked_call,
+                                                module_globals)
+  if not Wrapped:
+    def Wrapped(*args, **kwargs):  # pylint: disable=function-redefined
+      """Typecheck a call, if it is sampled (see CheckState)."""
+      if module_globals is not None:
+        if sys._getframe(1).f_globals is module_globals:  # pylint: disable=protected-access
+          state.internal_calls += 1
+          return target(*args, **kwargs)
+        state.boundary_calls += 1
+      state.countdown -= 1
+      if state.countdown > 0:
+        return target(*args, **kwargs)
+      state.countdown = state.Sample()
+      if state.governor is None and state.timings is None:
+        return checked_call(target, args, kwargs)
+      return _MeasuredCall(state, checked_call, target, args, kwargs)
+
+  Wrapped.__name__ = target.__name__
+  Wrapped.__doc__ = target.__doc__
+  Wrapped.__module__ = target.__module__
+  return descriptor(Wrapped) if descriptor else Wrapped
+
+
+def _LazyTypeCheck(module, func_name, func, func_sigs, state, owner, attr,
+                   boundary_only=False, shadow=None):
+  """Decorator like TypeCheck, that only compiles the signatures when needed.
+
+  Returns a trampoline, which calls TypeCheck on the first call of the
+  function, installs the result as owner.attr (unless something else has
+  been installed there in the meantime) and calls it. Later calls through
+  references to the trampoline taken before that are forwarded to the
+  compiled wrapper.
+
+  Two threads calling the function for the first time at the same time
+  might both compile it, which is harmless.
+
+  Args:
+    module: The module associated with the function to typecheck
+    func_name: Name of the function that's being checked.
+    func: A function to typecheck
+    func_sigs: signatures of the function (Function)
+    state: CheckState of the function
+    owner: The module or class the trampoline is installed in
+    attr: The attribute of owner the trampoline is installed as
+    boundary_only: See TypeCheck. Calls through the trampoline always count
+      as calls from outside the module.
+    shadow: See TypeCheck.
+
+  Returns:
+    The trampoline, wrapped in the same descriptor as func
+  """
+  wrapper = []  # the compiled wrapper, after the first call
+
+  def Trampoline(*args, **kwargs):
+    """Compile the checks of a function on its first call."""
+    if not wrapper:
+      wrapped = TypeCheck(module, func_name, func, func_sigs, state,
+                          boundary_only=boundary_only, shadow=shadow)
+      with _INSTRUMENTATION_LOCK:
+        if owner.__dict__.get(attr) is installed:
+          setattr(owner, attr, wrapped)
+      wrapper.append(_SplitDescriptor(wrapped)[0])
+    return wrapper[0](*args, **kwargs)
+
+  target, descriptor = _SplitDescriptor(func)
+  Trampoline.__name__ = target.__name__
+  Trampoline.__doc__ = target.__doc__
+  Trampoline.__module__ = target.__module__
+  installed = descriptor(Trampoline) if descriptor else Trampoline
+  return installed
+
+
+# TODO(raoulDoc): attach line number of functions/classes
+def _PrintWarning(msg):
+  print("(Warning)", msg, "not annotated", file=sys.stderr)
+
+
+_CHECK_STATES = {}  # module name -> {function name: CheckState}
+
+# module name -> ShadowChecker started for shadow=True
+_SHADOW_CHECKERS = {}
+
+
+class _Instrumentation(object):
+  """A checked function or method, and the original it replaced.
+
+  Attributes:
+    owner: The module or class the function is installed in
+    attr: The attribute of owner the function is installed as
+    original: The original function (or staticmethod or classmethod object)
+    checked: The checking wrapper, while the original is installed
+    state: The CheckState of the function
+  """
+
+  __slots__ = ("owner", "attr", "original", "checked", "state")
+
+  def __init__(self, owner, attr, original, state):
+    self.owner = owner
+    self.attr = attr
+    self.original = original
+    self.checked = None
+    self.state = state
+
+  def Uninstrument(self):
+    current = self.owner.__dict__.get(self.attr)
+    if current is self.original:
+      return
+    self.checked = current
+    setattr(self.owner, self.attr, self.original)
+    # Wrappers callers still hold references to stop checking, too: the
+    # countdown never reaches 0.
+    self.state.Suspend()
+
+  def Reinstrument(self):
+    if self.checked is None:
+      return
+    self.state.Resume()
+    setattr(self.owner, self.attr, self.checked)
+    self.checked = None
+
+
+# module name -> {function name: _Instrumentation}
+_INSTRUMENTATIONS = {}
+
+# Serializes installing and removing wrappers.
+_INSTRUMENTATION_LOCK = threading.RLock()
+
+
+def _Check(module, classes_to_check, functions_to_check,
+           sample_rate=1, sample_rates=None, sample_seed=None,
+           check_budget=None, element_budget=None, element_sampling="stride",
+           lazy=False, boundary_only=False, shadow=None, metrics=False,
+           item_sampling=None, sink=None):
+  """TypeChecks a module.
+
+  Args:
+    module: the module to typecheck
+    classes_to_check: list of classes_to_check parsed from the type declarations
+    functions_to_check: list of functions parsed from the type declarations
+    sample_rate: check 1 in sample_rate calls of every function
+    sample_rates: dict overriding sample_rate for individual functions, by
+      name ("Class.method" for methods)
+    sample_seed: if not None, sample randomly with a random source seeded
+      with this value, instead of checking exactly every n-th call
+    check_budget: if not None, adapt the sample rates so that checking takes
+      at most this share of each function's runtime (e.g. 0.02). The sample
+      rates above are the starting points. See Governor.
+    element_budget: maximum number of elements to check per container. See
+      ElementBudget.
+    element_sampling: "stride" to check elements spread evenly over
+      containers (and a moving window of the items of mappings, see
+      ElementBudget), or "random" to check a random sample (seeded with
+      sample_seed, if given), a reservoir sample for mappings
+    lazy: if True, only install trampolines, which compile the checks of a
+      function on its first call. See _LazyTypeCheck.
+    boundary_only: if True, only check calls from other modules, not calls
+      between the functions and methods of this module. See TypeCheck.
+    shadow: if True, check calls in a background thread, and report
+      violations instead of raising errors; see ShadowChecker. Repeated
+      violations are only summarized, see ViolationLimiter. The checker is
+      returned by GetShadowChecker, and stopped at exit. Can also be a
+      ShadowChecker, which the caller is responsible for starting and
+      stopping.
+    metrics: if True, measure how long the checks and the function bodies of
+      the checked calls take, see CheckTimings and Stats. This needs the
+      generic wrappers, so it makes checked calls a bit slower.
+    item_sampling: ItemSampling for the items of generators passed to or
+      returned by the functions. By default, all items are checked.
+    sink: object whose Record method is called for each violation, e.g. a
+      violation_ring.ViolationRing; see ShadowChecker. The violations are
+      recorded whether they're raised or reported in shadow mode (if shadow
+      is True; a ShadowChecker passed in has its own sink).
+  """
+  sample_rates = sample_rates or {}
+  rand = random.Random(sample_seed) if sample_seed is not None else None
+  governor = Governor(check_budget) if check_budget is not None else None
+  if element_sampling not in ("stride", "random"):
+    raise ValueError("Invalid element sampling: {!r}".format(element_sampling))
+  if element_budget is not None or element_sampling == "random":
+    budget = ElementBudget(
+        element_budget or DEFAULT_ELEMENT_BUDGET.max_elements,
+        (rand or random.Random()) if element_sampling == "random" else None)
+  else:
+    budget = None
+  if shadow is True:
+    previous = _SHADOW_CHECKERS.get(module.__name__)
+    if previous is not None:
+      previous.Stop()  # the module is checked anew, don't keep its thread
+    elif not _SHADOW_CHECKERS:
+      atexit.register(_StopShadowCheckers)
+    shadow = ShadowChecker(report=ViolationLimiter(), sink=sink)
+    _SHADOW_CHECKERS[module.__name__] = shadow
+    shadow.Start()
+  shadow = shadow or None
+  states = _CHECK_STATES.setdefault(module.__name__, {})
+  instrumentations = _INSTRUMENTATIONS.setdefault(module.__name__, {})
+
+  def MakeState(name):
+    state = states[name] = CheckState(
+        name, sample_rates.get(name, sample_rate), rand, governor, budget,
+        CheckTimings() if metrics else None, item_sampling,
+        None if shadow else sink)
+    return state
+
+  def Decorate(owner, f_name, f_def, allowed_signatures, state):
+    instrumentations[state.name] = _Instrumentation(owner, f_name, f_def,
+                                                    state)
+    if lazy:
+      return _LazyTypeCheck(module, f_name, f_def, allowed_signatures, state,
+                            owner, f_name, boundary_only, shadow)
+    return TypeCheck(module, f_name, f_def, allowed_signatures, state,
+                     boundary_only=boundary_only, shadow=shadow)
+
+  # typecheck functions in module
+  for f_name, f_def in Functions(module):
+    allowed_signatures = functions_to_check.get(f_name, None)
+    if allowed_signatures is not None:
+      module.__dict__[f_name] = Decorate(module,
+                                         f_name,
+                                         f_def,
+                                         allowed_signatures,
+                                         MakeState(f_name))
+    else:
+      _PrintWarning(f_name)
+
+  # typecheck methods in classes
+  for c_name, c_def in Classes(module):
+    if c_name in classes_to_check:
+      class_methods_to_check = {f.name: f.signatures
+                                for f in classes_to_check[c_name].methods}
+
+      for f_name, f_def in MethodsForClass(c_def):
+        allowed_signatures = class_methods_to_check.get(f_name, None)
+        if allowed_signatures is not None:
+          setattr(c_def, f_name, Decorate(c_def,
+                                          f_name,
+                                          f_def,
+                                          allowed_signatures,
+                                          MakeState(c_name + "." + f_name)))
+        else:
+          _PrintWarning(c_name + "." + f_name)
+    else:
+      _PrintWarning(c_name)
+
+
+def CheckFromFile(module, path, **kwargs):
+  """TypeChecks a module, using the type declarations in a file.
+
+  Args:
+    module: the module to typecheck
+    path: path of the type declaration (.pytd) file
+    **kwargs: options passed on to _Check (sample_rate, sample_rates,
+      sample_seed, check_budget, element_budget, element_sampling, lazy,
+      boundary_only, shadow, metrics, item_sampling, sink)
+  """
+  by_name = ParserUtils().LoadTypeDeclarationFromFile(path)
+  _Check(module, by_name.classes, by_name.funcs, **kwargs)
+
+
+def CheckFromData(module, data, **kwargs):
+  """TypeChecks a module, using type declarations from a string.
+
+  Args:
+    module: the module to typecheck
+    data: type declarations (contents of a .pytd file)
+    **kwargs: options passed on to _Check (sample_rate, sample_rates,
+      sample_seed, check_budget, element_budget, element_sampling, lazy,
+      boundary_only, shadow, metrics, item_sampling, sink)
+  """
+  classes, funcs = ParserUtils().LoadTypeDeclaration(data)
+  _Check(module, classes, funcs, **kwargs)
+
+
+def GetCheckState(module, func_name):
+  """Return the CheckState of a checked function.
+
+  Args:
+    module: the checked module
+    func_name: name of the function ("Class.method" for methods)
+
+  Returns:
+    A CheckState
+
+  Raises:
+    KeyError: if the function isn't checked
+  """
+  return _CHECK_STATES[module.__name__][func_name]
+
+
+def GetShadowChecker(module):
+  """Return the ShadowChecker started for a module checked with shadow=True.
+
+  Stop it to check the calls still queued and to report the summaries of
+  repeated violations; this is done at exit, too.
+
+  Args:
+    module: the checked module
+
+  Returns:
+    A ShadowChecker
+
+  Raises:
+    KeyError: if the module wasn't checked with shadow=True
+  """
+  return _SHADOW_CHECKERS[module.__name__]
+
+
+def _StopShadowCheckers():
+  for shadow in _SHADOW_CHECKERS.values():
+    shadow.Stop()
+
+
+def GetSampleRates(module):
+  """Return the current sample rates of the functions of a checked module.
+
+  Args:
+    module: the checked module
+
+  Returns:
+    A dict {function name: sample rate}
+
+  Raises:
+    KeyError: if the module isn't checked
+  """
+  return {name: state.sample_rate
+          for name, state in _CHECK_STATES[module.__name__].iteritems()}
+
+
+def SetSampleRate(module, sample_rate, func_name=None, sample_seed=None):
+  """Change how often the functions of a checked module are checked.
+
+  Args:
+    module: the checked module
+    sample_rate: check 1 in sample_rate calls
+    func_name: only change this function ("Class.method" for methods).
+      By default, all the functions of the module are changed.
+    sample_seed: if not None, sample randomly, see _Check
+
+  Raises:
+    KeyError: if the module or function isn't checked
+  """
+  rand = random.Random(sample_seed) if sample_seed is not None else None
+  states = _CHECK_STATES[module.__name__]
+  if func_name is not None:
+    states[func_name].SetSampleRate(sample_rate, rand)
+  else:
+    for state in states.itervalues():
+      state.SetSampleRate(sample_rate, rand)
+
+
+FunctionStats = collections.namedtuple(
+    "FunctionStats",
+    ["module", "function", "calls", "checked_calls", "violations",
+     "param_check_ns", "return_check_ns", "exception_check_ns", "body_ns"])
+
+
+def _Nanoseconds(seconds):
+  return int(seconds * 1e9)
+
+
+class CheckStats(object):
+  """A snapshot of the metrics of checked functions, see Stats.
+
+  Attributes:
+    functions: A list of FunctionStats, the functions whose checks took the
+      most time first
+  """
+
+  def __init__(self, functions):
+    self.functions = functions
+
+  def ToJson(self, **kwargs):
+    """Return the metrics as a JSON list of objects, one per function.
+
+    Args:
+      **kwargs: options passed on to json.dumps, e.g. indent
+    """
+    return json.dumps([f._asdict() for f in self.functions], **kwargs)
+
+  def Dump(self, fp, **kwargs):
+    """Write the metrics as JSON (see ToJson) to a file object."""
+    json.dump([f._asdict() for f in self.functions], fp, **kwargs)
+
+
+def Stats(module=None):
+  """Return the metrics of the checked functions.
+
+  Calls, checked calls and violations are always counted. The times (in
+  nanoseconds) are only measured for modules checked with metrics=True,
+  and are None otherwise.
+
+  Args:
+    module: only return the functions of this checked module. By default,
+      the functions of all checked modules are returned.
+
+  Returns:
+    A CheckStats
+
+  Raises:
+    KeyError: if the module isn't checked
+  """
+  if module is not None:
+    modules = [(module.__name__, _CHECK_STATES[module.__name__])]
+  else:
+    modules = _CHECK_STATES.items()
+  functions = []
+  for module_name, states in modules:
+    for name, state in states.iteritems():
+      timings = state.timings
+      if timings is not None:
+        times = [_Nanoseconds(t) for t in (
+            timings.param_time, timings.return_time, timings.exception_time,
+            timings.body_time)]
+      else:
+        times = [None] * 4
+      functions.append(FunctionStats(module_name, name, state.Calls(),
+                                     state.checked_calls, state.violations,
+                                     *times))
+  functions.sort(key=lambda f: (
+      -(f.param_check_ns + f.return_check_ns + f.exception_check_ns)
+      if f.param_check_ns is not None else 0, f.module, f.function))
+  return CheckStats(functions)
+
+
+def _FindInstrumentations(module, name):
+  """Return the _Instrumentations of a module, a class or a function.
+
+  Args:
+    module: the checked module
+    name: None for all the functions and methods of the module, the name of
+      a class for all its methods, or the name of a function ("Class.method"
+      for methods)
+
+  Returns:
+    A list of _Instrumentations
+
+  Raises:
+    KeyError: if the module, class or function isn't checked
+  """
+  instrumentations = _INSTRUMENTATIONS[module.__name__]
+  if name is None:
+    return list(instrumentations.itervalues())
+  if name in instrumentations:
+    return [instrumentations[name]]
+  prefix = name + "."
+  found = [instrumentation
+           for f_name, instrumentation in instrumentations.iteritems()
+           if f_name.startswith(prefix)]
+  if not found:
+    raise KeyError(name)
+  return found
+
+
+def Uninstrument(module, name=None):
+  """Remove the checks of a module, a class or a function at runtime.
+
+  The original functions are put back in place, so calling them costs
+  nothing anymore. Wrappers that callers still hold references to (e.g.
+  after "from module import function") stop checking, too.
+
+  Args:
+    module: the checked module
+    name: None for the whole module, the name of a class, or the name of a
+      function ("Class.method" for methods)
+
+  Raises:
+    KeyError: if the module, class or function isn't checked
+  """
+  with _INSTRUMENTATION_LOCK:
+    for instrumentation in _FindInstrumentations(module, name):
+      instrumentation.Uninstrument()
+
+
+def Reinstrument(module, name=None):
+  """Put back the checks removed by Uninstrument.
+
+  The compiled checks are reused, so the type declarations aren't parsed
+  again. Sampling starts over with the functions' current sample rates.
+
+  Args:
+    module: the checked module
+    name: None for the whole module, the name of a class, or the name of a
+      function ("Class.method" for methods)
+
+  Raises:
+    KeyError: if the module, class or function isn't checked
+  """
+  with _INSTRUMENTATION_LOCK:
+    for instrumentation in _FindInstrumentations(module, name):
+      instrumentation.Reinstrument()
@@ -0,0 +1,395 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Microbenchmarks for the runtime type checker.
+
+Run
+  python -B checker_benchmark.py
+to print the cost per call of the various checking strategies.
+"""
+
+from __future__ import print_function
+
+import array
+import collections
+import imp
+import itertools
+import json
+import inspect
+import random
+import sys
+import timeit
+from pytypedecl import checker
+from pytypedecl import pytd
+from pytypedecl.parse import parser
+from tests import simple
+
+
+NUMBER = 100000
+
+
+def _PerCall(stmt, number=NUMBER):
+  """Return the best time per call of stmt, in microseconds."""
+  return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+
+
+def _Report(name, usec):
+  print("{:<56s} {:8.3f} usec/call".format(name, usec))
+
+
+def BenchCheckPlan():
+  """Compare checking with a precompiled plan vs resolving types per call."""
+  funcs = checker.ParserUtils().LoadTypeDeclaration(
+      "def MultiArgs(a : int, b: int, c:dict, d: str) -> None").funcs
+  sig, = funcs["MultiArgs"]
+
+  def Unchecked(a, b, c, d):  # pylint: disable=unused-argument
+    return None
+  checked = checker.TypeCheck(simple, "MultiArgs", Unchecked, [sig])
+
+  def ResolvePerCall():
+    # This is what the checker used to do on every single call.
+    # pylint: disable=protected-access
+    for t in [p.type for p in sig.params] + [sig.return_type]:
+      checker._ConvertToType(simple, t, {})
+    for e in sig.exceptions:
+      checker._ConvertToType(simple, e, {})
+
+  _Report("MultiArgs unchecked", _PerCall(lambda: Unchecked(1, 2, {}, "")))
+  _Report("MultiArgs checked (compiled plan)",
+          _PerCall(lambda: checked(1, 2, {}, "")))
+  _Report("type resolution saved per call", _PerCall(ResolvePerCall))
+
+
+def BenchWrappers():
+  """Generic vs generated wrappers, for signatures of tests/simple.py."""
+  # pylint: disable=cell-var-from-loop,unused-argument
+  funcs = checker.ParserUtils().LoadTypeDeclarationFromFile(
+      simple.__file__.rsplit(".", 1)[0] + ".pytd").funcs
+
+  # Unchecked copies of the functions in tests/simple.py
+  def IntToInt(i):
+    return 42
+
+  def MultiArgs(a, b, c, d):
+    return None
+
+  def GoodRet():
+    return 42
+
+  def MultiArgsNoType(a, b, c, d, e):
+    return a
+
+  calls = [(IntToInt, lambda f: f(1)),
+           (MultiArgs, lambda f: f(1, 2, {}, "")),
+           (GoodRet, lambda f: f()),
+           (MultiArgsNoType, lambda f: f(1, 2, 3, "4", []))]
+  for func, call in calls:
+    name = func.__name__
+    for specialize in (False, True):
+      checked = checker.TypeCheck(simple, name, func, funcs[name],
+                                  specialize=specialize)
+      _Report("{} {} wrapper".format(
+          name, "generated" if specialize else "generic"),
+              _PerCall(lambda: call(checked)))
+    _Report("{} unchecked".format(name), _PerCall(lambda: call(func)))
+
+
+def BenchKeywordBinding():
+  """Keyword arguments: precomputed index tables vs binding with inspect."""
+  # pylint: disable=protected-access
+  funcs = checker.ParserUtils().LoadTypeDeclaration(
+      "def MultiArgs(a : int, b: int, c:dict, d: str) -> None").funcs
+  sig, = funcs["MultiArgs"]
+
+  def MultiArgs(a, b, c, d):  # pylint: disable=unused-argument
+    return None
+  checked = checker.TypeCheck(simple, "MultiArgs", MultiArgs, [sig],
+                              specialize=False)
+  plan = checker.CompileSignature(simple, sig)
+  if hasattr(inspect, "signature"):
+    signature = inspect.signature(MultiArgs)  # pylint: disable=no-member
+    bind = lambda args, kwargs: signature.bind(*args, **kwargs).arguments
+  else:
+    bind = lambda args, kwargs: inspect.getcallargs(MultiArgs, *args, **kwargs)
+
+  def NaiveChecked(*args, **kwargs):
+    bound = bind(args, kwargs)
+    for (name, _), check in zip(plan.params, plan.param_checks):
+      if name in bound and not checker._Matches(check, bound[name]):
+        raise checker.CheckTypeAnnotationError([name])
+    return MultiArgs(*args, **kwargs)
+
+  _Report("MultiArgs by keyword, index tables",
+          _PerCall(lambda: checked(1, 2, c={}, d="")))
+  _Report("MultiArgs by keyword, bound with inspect",
+          _PerCall(lambda: NaiveChecked(1, 2, c={}, d="")))
+
+
+def BenchSampling():
+  """Cost of a call that the sampler decides not to check."""
+  funcs = checker.ParserUtils().LoadTypeDeclaration(
+      "def IntToInt(i :int) -> int").funcs
+
+  def IntToInt(i):  # pylint: disable=unused-argument
+    return 42
+
+  for rate in (1, 10, 1000):
+    checked = checker.TypeCheck(simple, "IntToInt", IntToInt,
+                                funcs["IntToInt"],
+                                checker.CheckState("IntToInt", rate))
+    _Report("IntToInt checking 1 in {} calls".format(rate),
+            _PerCall(lambda: checked(1)))  # pylint: disable=cell-var-from-loop
+  _Report("IntToInt unchecked", _PerCall(lambda: IntToInt(1)))
+
+
+def BenchOverloadDispatch():
+  """Overloaded function, with and without the dispatch cache."""
+  funcs = checker.ParserUtils().LoadTypeDeclaration("\n".join([
+      "def Coerce(x: int, y: int) -> tuple",
+      "def Coerce(x: long, y: long) -> tuple",
+      "def Coerce(x: float, y: float) -> tuple",
+      "def Coerce(x: complex, y: complex) -> tuple",
+      "def Coerce(x: int, y: float) -> tuple",
+      "def Coerce(x: float, y: int) -> tuple",
+      "def Coerce(x: str, y: str) -> tuple",
+      "def Coerce(x: list, y: list) -> tuple"])).funcs
+
+  def Coerce(x, y):
+    return x, y
+
+  for cacheable in (False, True):
+    state = checker.CheckState("Coerce")
+    checked = checker.TypeCheck(simple, "Coerce", Coerce, funcs["Coerce"],
+                                state)
+    state.signatures.dispatch_cacheable = cacheable
+    _Report("Coerce, 8 overloads, dispatch cache {}".format(
+        "on" if cacheable else "off"),
+            _PerCall(lambda: checked([], [])))  # pylint: disable=cell-var-from-loop
+
+
+def BenchUnion():
+  """Matching a value against a union: compiled per call, cached, inline."""
+  formal = pytd.UnionType([int, long, float, complex])
+  _Report("float vs int or long or float or complex, compiling",
+          _PerCall(lambda: checker._Matches(checker.CompileType(formal), 1.0)))  # pylint: disable=protected-access
+  _Report("float vs int or long or float or complex, IsCompatibleType",
+          _PerCall(lambda: checker.IsCompatibleType(1.0, formal)))
+  compiled = checker.CompileType(formal)
+  _Report("float vs int or long or float or complex, compiled",
+          _PerCall(lambda: isinstance(1.0, compiled)))
+
+
+def BenchContainers():
+  """Checking a large container: sampled list vs memoized tuple."""
+  words = ["w%d" % i for i in range(50000)]
+  list_check = checker.CompileType(pytd.HomogeneousContainerType(list, str))
+  tuple_check = checker.CompileType(pytd.HomogeneousContainerType(tuple, str))
+  words_tuple = tuple(words)
+  _Report("list<str>, 50000 elements, sampled",
+          _PerCall(lambda: list_check.Matches(words)))
+  _Report("tuple<str>, 50000 elements, memoized",
+          _PerCall(lambda: tuple_check.Matches(words_tuple)))
+
+
+def BenchMappings():
+  """Checking a large dict<str, int>: moving window vs reservoir sample."""
+  table = {"k%d" % i: i for i in range(100000)}
+  formal = pytd.GenericType(dict, (str, int))
+  for sampling, rand in (("moving window", None),
+                         ("reservoir", random.Random(0))):
+    state = checker.CheckState("table", element_budget=checker.ElementBudget(
+        16, rand))
+    check = checker.CompileType(formal, state)
+    _Report("dict<str, int>, 100000 items, " + sampling,
+            _PerCall(lambda: check.Matches(table), number=10000))  # pylint: disable=cell-var-from-loop
+
+
+def BenchGeneratorItems():
+  """Cost per item of iterating a checked generator."""
+  items = 100000
+  element = checker.CompileType(int)
+
+  def Count():
+    return iter(xrange(items))
+
+  def NestedGenerator():
+    # This is how generators used to be wrapped: every item checked.
+    for _, elem in enumerate(Count()):
+      if not isinstance(elem, int):
+        raise checker.CheckTypeAnnotationError([])
+      yield elem
+
+  def Checked(sampling):
+    state = checker.CheckState("Count", item_sampling=sampling)
+    return checker._CheckedIterator(Count(), "Count", element, int, state)  # pylint: disable=protected-access
+
+  for name, make in (
+      ("unchecked", Count),
+      ("nested generator", NestedGenerator),
+      ("every item checked", lambda: Checked(None)),
+      ("every 100th checked", lambda: Checked(checker.ItemSampling(100))),
+      ("first 16 checked", lambda: Checked(checker.ItemSampling(first=16)))):
+    _Report("generator<int>, {}".format(name),
+            _PerCall(lambda: sum(make()), number=10) / items)  # pylint: disable=cell-var-from-loop
+
+
+def BenchValidateMany():
+  """Checking a batch of values, grouped by class vs one by one."""
+  values = range(1000000)
+  mixed = values[:]
+  mixed[::1000] = ["x"] * 1000
+  check = checker.CompileType(pytd.UnionType((int, float)))
+
+  def OneByOne():
+    return [i for i, v in enumerate(values)
+            if not checker._Matches(check, v)]  # pylint: disable=protected-access
+
+  _Report("type() of 1000000 values",
+          _PerCall(lambda: map(type, values), number=1))
+  _Report("1000000 values vs int or float, one by one",
+          _PerCall(OneByOne, number=1))
+  for name, batch in (("ints", values), ("0.1% strs", mixed)):
+    _Report("1000000 values vs int or float, ValidateMany, {}".format(name),
+            _PerCall(lambda: checker.ValidateMany(batch, "int or float"),  # pylint: disable=cell-var-from-loop
+                     number=1))
+
+
+def BenchRecords():
+  """Decoding a feed of JSON lines, with and without checking the records."""
+  unit = parser.TypeDeclParser().Parse(
+      "class Point:\n  id: int\n  x: float\n  name: basestring\n")
+  lines = [json.dumps({"id": i, "x": i * 0.5, "name": "p%d" % i})
+           for i in xrange(100000)]
+
+  def Decoded():
+    return itertools.imap(json.loads, lines)
+
+  def Checked():
+    return checker.ValidateRecords(Decoded(), unit, "Point")
+
+  for name, make in (("decoded", Decoded), ("decoded and checked", Checked)):
+    _Report("100000 JSON lines, {}".format(name),
+            _PerCall(lambda: collections.deque(make(), 0), number=1))  # pylint: disable=cell-var-from-loop
+
+
+def BenchBuffers():
+  """Checking a typed buffer on its typecode."""
+  ints = array.array("i", range(1000000))
+  array_check = checker.CompileType(
+      pytd.HomogeneousContainerType(array.array, int))
+  _Report("array.array<int>, 1000000 elements, typecode",
+          _PerCall(lambda: array_check.Matches(ints)))
+
+
+def BenchShadow():
+  """Checking in the calling thread vs recording the types for later."""
+  funcs = checker.ParserUtils().LoadTypeDeclaration(
+      "def MultiArgs(a : int, b: int, c:dict, d: str) -> None").funcs
+
+  def MultiArgs(a, b, c, d):  # pylint: disable=unused-argument
+    return None
+  shadow = checker.ShadowChecker(max_queued=1000000)
+  for mode, kwargs in (("checked", {"specialize": False}),
+                       ("shadow mode", {"shadow": shadow})):
+    checked = checker.TypeCheck(simple, "MultiArgs", MultiArgs,
+                                funcs["MultiArgs"], **kwargs)
+    _Report("MultiArgs, generic wrapper, {}".format(mode),
+            _PerCall(lambda: checked(1, 2, {}, "")))  # pylint: disable=cell-var-from-loop
+  start = timeit.default_timer()
+  queued = len(shadow._queue)  # pylint: disable=protected-access
+  shadow.Drain()
+  _Report("MultiArgs, shadow mode, background check",
+          (timeit.default_timer() - start) / queued * 1e6)
+
+
+def BenchMetrics():
+  """Checked calls with and without measuring where their time goes."""
+  funcs = checker.ParserUtils().LoadTypeDeclaration(
+      "def MultiArgs(a : int, b: int, c:dict, d: str) -> None").funcs
+
+  def MultiArgs(a, b, c, d):  # pylint: disable=unused-argument
+    return None
+  for timings in (None, checker.CheckTimings()):
+    checked = checker.TypeCheck(
+        simple, "MultiArgs", MultiArgs, funcs["MultiArgs"],
+        checker.CheckState("MultiArgs", timings=timings), specialize=False)
+    _Report("MultiArgs, generic wrapper, {}".format(
+        "timed" if timings else "counted"),
+            _PerCall(lambda: checked(1, 2, {}, "")))  # pylint: disable=cell-var-from-loop
+
+
+def BenchBoundary():
+  """Calls within a module, checked vs skipped in boundary-only mode."""
+  for boundary_only in (False, True):
+    module = sys.modules["bench_boundary"] = imp.new_module("bench_boundary")
+    exec("def IntToInt(i):\n  return 42\n"  # pylint: disable=exec-used
+         "def Caller():\n  return IntToInt(1)\n", module.__dict__)
+    checker.CheckFromData(module, "def IntToInt(i: int) -> int",
+                          boundary_only=boundary_only)
+    _Report("IntToInt called within its module, {}".format(
+        "boundary only" if boundary_only else "checked"),
+            _PerCall(module.Caller))
+
+
+def BenchLazyInstall():
+  """Installing the checks of a module eagerly vs lazily."""
+  # pylint: disable=protected-access
+  num_funcs = 200
+  source = compile("\n".join(
+      "def F{0}(a, b, c):\n  return a\n".format(i) for i in xrange(num_funcs)),
+                   "bench_lazy", "exec")
+  decls = checker.ParserUtils().LoadTypeDeclaration("\n".join(
+      "def F{}(a: int or float or complex, b: list<str>, "
+      "c: dict<str, int or None>) -> tuple<int, str>".format(i)
+      for i in xrange(num_funcs)))
+
+  def Install(lazy):
+    module = sys.modules["bench_lazy"] = imp.new_module("bench_lazy")
+    exec(source, module.__dict__)  # pylint: disable=exec-used
+    if lazy is not None:
+      checker._Check(module, decls.classes, decls.funcs, lazy=lazy)
+
+  _Report("create module with {} functions, unchecked".format(num_funcs),
+          _PerCall(lambda: Install(None), number=20))
+  for lazy in (False, True):
+    _Report("install {} functions, {}".format(
+        num_funcs, "lazily" if lazy else "eagerly"),
+            _PerCall(lambda: Install(lazy), number=20))  # pylint: disable=cell-var-from-loop
+
+
+def main():
+  BenchCheckPlan()
+  BenchWrappers()
+  BenchKeywordBinding()
+  BenchSampling()
+  BenchOverloadDispatch()
+  BenchUnion()
+  BenchContainers()
+  BenchMappings()
+  BenchBuffers()
+  BenchGeneratorItems()
+  BenchValidateMany()
+  BenchRecords()
+  BenchLazyInstall()
+  BenchBoundary()
+  BenchShadow()
+  BenchMetrics()
+
+
+if __name__ == "__main__":
+  main()
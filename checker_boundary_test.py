@@ -0,0 +1,56 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from pytypedecl import checker
+from tests import boundary
+
+
+class TestCheckerBoundary(unittest.TestCase):
+
+  def _Counts(self, name):
+    state = checker.GetCheckState(boundary, name)
+    return state.boundary_calls, state.internal_calls
+
+  def testCallsFromOtherModulesChecked(self):
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      boundary.Inner("1")
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      boundary.Outer("1")
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      boundary.Padded(1)
+
+  def testCallsWithinModuleNotChecked(self):
+    outer = self._Counts("Outer")
+    inner = self._Counts("Inner")
+    self.assertEquals(1, boundary.Outer(1))
+    self.assertEquals((outer[0] + 1, outer[1]), self._Counts("Outer"))
+    self.assertEquals((inner[0], inner[1] + 2), self._Counts("Inner"))
+
+  def testMethods(self):
+    padded = self._Counts("Padded")
+    digits = self._Counts("Formatter.Digits")
+    self.assertEquals("1   ", boundary.Formatter().Format(1))
+    self.assertEquals((padded[0], padded[1] + 1), self._Counts("Padded"))
+    self.assertEquals((digits[0], digits[1] + 1),
+                      self._Counts("Formatter.Digits"))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      boundary.Formatter().Digits("1")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import imp
+import sys
+import unittest
+from pytypedecl import checker
+from pytypedecl import pytd
+
+
+def _MakeModule(name, source):
+  """Create a module from source, so that the checker can find it."""
+  module = imp.new_module(name)
+  sys.modules[name] = module
+  exec(source, module.__dict__)  # pylint: disable=exec-used
+  return module
+
+
+class TestCheckerTypeCache(unittest.TestCase):
+
+  def setUp(self):
+    self.module = _MakeModule("cache_test_module", """
+class Foo(object):
+  pass
+
+def TakeFoo(f):
+  return 42
+""")
+
+  def tearDown(self):
+    del sys.modules["cache_test_module"]
+
+  def testHitsAndMisses(self):
+    """Resolving the same type twice evaluates it only once."""
+    cache = checker.GetTypeCache(self.module)
+    foo = pytd.NamedType("Foo")
+    self.assertEquals(self.module.Foo, checker.ConvertToType(self.module, foo))
+    self.assertEquals(self.module.Foo, checker.ConvertToType(self.module, foo))
+    self.assertEquals(1, cache.misses)
+    self.assertEquals(1, cache.hits)
+    self.assertEquals({foo: self.module.Foo}, cache.Entries())
+
+  def testRebindingInvalidates(self):
+    """Rebinding a global the type depends on invalidates the entry."""
+    cache = checker.GetTypeCache(self.module)
+    union = pytd.UnionType((pytd.NamedType("Foo"), pytd.NamedType("int")))
+    checker.ConvertToType(self.module, union)
+    old_foo = self.module.Foo
+    self.module.Foo = type("Foo", (object,), {})
+    resolved = checker.ConvertToType(self.module, union)
+    self.assertEquals([self.module.Foo, int], resolved.type_list)
+    self.assertNotEquals(old_foo, self.module.Foo)
+    self.assertEquals(2, cache.misses)
+    self.assertEquals(0, cache.hits)
+
+  def testShadowedBuiltinInvalidates(self):
+    """Shadowing a builtin with a global invalidates the entry."""
+    checker.ConvertToType(self.module, pytd.NamedType("int"))
+    self.module.int = bool
+    self.assertEquals(bool, checker.ConvertToType(self.module,
+                                                  pytd.NamedType("int")))
+
+  def testCheckedFunctionFollowsRebinding(self):
+    """A checked function picks up a rebound class on its next call."""
+    checker.CheckFromData(self.module, "def TakeFoo(f: Foo) -> int")
+    old_foo = self.module.Foo
+    self.assertEquals(42, self.module.TakeFoo(old_foo()))
+
+    self.module.Foo = type("Foo", (object,), {})
+    self.assertEquals(42, self.module.TakeFoo(self.module.Foo()))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.TakeFoo(old_foo())
+
+  def testGeneratedWrapperNoticesRebinding(self):
+    """The generated wrapper looks up the bindings on every checked call."""
+    checker.CheckFromData(self.module, "def TakeFoo(f: Foo) -> int")
+    old_foo = self.module.Foo
+    self.assertEquals(42, self.module.TakeFoo(old_foo()))
+
+    self.module.Foo = type("Foo", (object,), {})
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.TakeFoo(old_foo())
+    self.assertEquals(42, self.module.TakeFoo(self.module.Foo()))
+
+
+if __name__ == "__main__":
+  unittest.main()
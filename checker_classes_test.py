@@ -66,6 +66,27 @@ class TestCheckerClasses(unittest.TestCase):
     with self.assertRaises(checker.CheckTypeAnnotationError) as context:
       comparators.IsGreater(20, "10")
 
+  def testStaticMethod(self):
+    self.assertEquals(3.0, classes.Geometry.Scale(2, 1.5))
+    self.assertEquals(3.0, classes.Geometry().Scale(2, 1.5))
+    self.assertIsInstance(classes.Geometry.__dict__["Scale"], staticmethod)
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      classes.Geometry.Scale("2", 1.5)
+
+  def testClassDictOnly(self):
+    """Only a class's own methods are instrumented, by walking its __dict__."""
+    self.assertEquals(["Scale"],
+                      [name for name, _ in
+                       checker.MethodsForClass(classes.Geometry)])
+    self.assertEquals("LOUD", classes.LoudEmailer().Shout("loud"))
+    self.assertNotIn("SendEmail", classes.LoudEmailer.__dict__)
+    with self.assertRaises(KeyError):
+      checker.GetCheckState(classes, "LoudEmailer.SendEmail")
+    # inherited methods are checked once, by the base class's wrapper
+    self.assertIs(classes.Emailer.__dict__["SendEmail"],
+                  classes.LoudEmailer.SendEmail.__func__)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -15,6 +15,10 @@
 # limitations under the License.
 
 
+import array
+import random
+import sys
+import threading
 import unittest
 from pytypedecl import checker
 from pytypedecl import pytd
@@ -54,6 +58,83 @@ class TestCheckerGenerics(unittest.TestCase):
     with self.assertRaises(checker.CheckTypeAnnotationError) as context:
       generics.FindInCache(cache, 9999)
 
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.FindInCache({"Albert": "1"}, "Albert")
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.FindInCache({1: 1}, 1)
+
+  def testLargeDictSampled(self):
+    """Of large dicts, only the first 16 items are checked."""
+    state = checker.GetCheckState(generics, "FindInCache")
+    cache = {"k%d" % i: i for i in range(100000)}
+    checked = state.elements_checked
+    skipped = state.elements_skipped
+    self.assertEquals(5, generics.FindInCache(cache, "k5"))
+    self.assertEquals(16, state.elements_checked - checked)
+    self.assertEquals(100000 - 16, state.elements_skipped - skipped)
+
+  def testItemWindow(self):
+    """Successive checks of a large dict cover its first max_scanned items."""
+    d = {i: str(i) for i in range(1000)}
+    budget = checker.ElementBudget(4, max_scanned=100)
+    checked = []
+    for _ in range(25):
+      items, total = budget.SampleItems(d)
+      self.assertEquals(1000, total)
+      checked += items
+    self.assertEquals(list(d.iteritems())[:100], checked)
+    items, _ = budget.SampleItems(d)
+    self.assertEquals(list(d.iteritems())[:4], items)
+
+  def testBadItemFound(self):
+    check = checker.CompileType(pytd.GenericType(dict, (int, int)))
+    d = dict.fromkeys(range(100000), 0)
+    d[list(d)[3000]] = "bad"
+    self.assertIn(False, [check.Matches(d) for _ in range(256)])
+
+  def testRandomItemSample(self):
+    d = {i: str(i) for i in range(1000)}
+    first = list(d)[:100]
+    sampled = set()
+    for seed in range(50):
+      budget = checker.ElementBudget(4, random.Random(seed), max_scanned=100)
+      items, total = budget.SampleItems(d)
+      self.assertEquals(1000, total)
+      self.assertEquals(4, len(items))
+      self.assertEquals(4, len(set(items)))
+      for k, v in items:
+        self.assertEquals(str(k), v)
+      sampled.update(k for k, _ in items)
+    # Items beyond the first four are picked, but none beyond the first 100.
+    self.assertTrue(sampled - set(first[:4]))
+    self.assertFalse(sampled - set(first))
+
+  def testFixedSizeTuple(self):
+    """All elements of a tuple<int, str> are checked."""
+    self.assertEquals(("a", 1), generics.SwapPair((1, "a")))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.SwapPair(("a", 1))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.SwapPair((1, "a", 2))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics._BadSwapPair((1, "a"))
+
+  def testGenericCompatibility(self):
+    pair = pytd.GenericType(tuple, (int, str))
+    self.assertTrue(checker.IsCompatibleType((1, "a"), pair))
+    self.assertFalse(checker.IsCompatibleType((1, 2), pair))
+    self.assertFalse(checker.IsCompatibleType([1, "a"], pair))
+    mapping = pytd.GenericType(dict, (str, pytd.UnionType([int, float])))
+    self.assertTrue(checker.IsCompatibleType({"a": 1, "b": 1.5}, mapping))
+    self.assertFalse(checker.IsCompatibleType({"a": "1"}, mapping))
+    # Parameters of other classes have no known meaning.
+    box = pytd.GenericType(generics.Box, (int, str))
+    self.assertTrue(checker.IsCompatibleType(generics.Box("x"), box))
+
 
   def testGenSimple(self):
     """Type checking of typed generator."""
@@ -76,6 +157,289 @@ class TestCheckerGenerics(unittest.TestCase):
     with self.assertRaises(checker.CheckTypeAnnotationError) as context:
       generics.ConsumeDoubleGenerator(gen_broken, gen_broken)
 
+  def testGenPassedByKeyword(self):
+    """Generators passed by keyword are checked too."""
+    self.assertEquals([1, 2], generics.ConvertGenToList(
+        g=(e for e in [1, 2])))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.ConvertGenToList(g=generics._BadGen())
+
+    gen = (e for e in [1, 2, "3"])
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.ConsumeDoubleGenerator(gen, g2=gen)
+
+  def testGenReturned(self):
+    """Returned typed generators are checked while they're iterated."""
+    self.assertEquals([1, 2, 3], list(generics.CountTo(3)))
+    gen = generics._BadCountTo(3)
+    self.assertEquals([1, 2], [next(gen), next(gen)])
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      next(gen)
+    [error] = context.exception.args[0]
+    self.assertEquals((3, str), (error.iteration, error.observed))
+
+  def testCheckedGenPassedOn(self):
+    """Generators returned by checked functions can be passed to them."""
+    self.assertEquals([1, 2, 3],
+                      generics.ConvertGenToList(generics.CountTo(3)))
+    self.assertEquals([1, 2], generics.ConsumeDoubleGenerator(
+        generics.CountTo(3), generics.CountTo(2)))
+    self.assertEquals([1, 2], generics.ForwardGen(generics.CountTo(2)))
+    self.assertEquals([1, 2], list(generics.PassOnGen(generics.CountTo(2))))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.ForwardGen(generics._BadCountTo(2))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      list(generics.PassOnGen(generics._BadCountTo(2)))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.ConvertGenToList([1, 2])
+
+  def testGenSendAndThrow(self):
+    """send and throw are forwarded to the generator, and checked too."""
+    echo = generics.Echo()
+    self.assertEquals(0, next(echo))
+    self.assertEquals(5, echo.send(5))
+    self.assertEquals(-1, echo.throw(ValueError))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      echo.send("5")
+    echo.close()
+
+  def testItemSampling(self):
+    funcs = checker.ParserUtils().LoadTypeDeclaration(
+        "def Items(items: list) -> generator<int>").funcs
+
+    def Items(items):
+      for item in items:
+        yield item
+
+    def Checked(sampling):
+      state = checker.CheckState("Items", item_sampling=sampling)
+      return checker.TypeCheck(generics, "Items", Items, funcs["Items"],
+                               state)
+
+    every_third = Checked(checker.ItemSampling(every=3))
+    items = [1, "2", "3", 4, "5", "6", 7, "8"]
+    self.assertEquals(items, list(every_third(items)))
+    self.assertRaises(checker.CheckTypeAnnotationError, list,
+                      every_third([1, "2", "3", "4"]))
+
+    first_two = Checked(checker.ItemSampling(first=2))
+    self.assertEquals([1, 2, "3"], list(first_two([1, 2, "3"])))
+    self.assertRaises(checker.CheckTypeAnnotationError, list,
+                      first_two([1, "2"]))
+
+    # Both: the first of every two items, among the first five.
+    both = Checked(checker.ItemSampling(every=2, first=5))
+    self.assertEquals([1, "2", 3, "4", 5, "6", "7"],
+                      list(both([1, "2", 3, "4", 5, "6", "7"])))
+    self.assertRaises(checker.CheckTypeAnnotationError, list,
+                      both([1, "2", 3, "4", "5"]))
+
+    self.assertRaises(ValueError, checker.ItemSampling, every=0)
+    self.assertRaises(ValueError, checker.ItemSampling, first=0)
+
+  def testLongListSampled(self):
+    """Long lists are checked with elements spread over the whole list."""
+    state = checker.GetCheckState(generics, "Length")
+    state.elements_checked = state.elements_skipped = 0
+    self.assertEquals(1001, generics.Length(range(1001)))
+    self.assertEquals(16, state.elements_checked)
+    self.assertEquals(985, state.elements_skipped)
+
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.Length(range(1000) + ["last"])
+
+  def testSets(self):
+    """Containers without __getitem__ are checked, too."""
+    self.assertEquals(3, generics.SetSize({1, 2, 3}))
+    self.assertEquals(3, generics.SetSize(frozenset([1, 2, 3])))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.SetSize({1, 2, "3"})
+
+  def testElementBudget(self):
+    budget = checker.ElementBudget(3)
+    self.assertEquals(([0, 4, 9], 10), budget.Sample(range(10)))
+    self.assertEquals(([0, 1], 2), budget.Sample([0, 1]))
+    elements, total = budget.Sample(set(range(10)))
+    self.assertEquals((3, 10), (len(elements), total))
+
+  def testRandomElementBudget(self):
+    budget = checker.ElementBudget(4, random.Random(0))
+    elements, total = budget.Sample(range(100))
+    self.assertEquals(100, total)
+    self.assertEquals(4, len(set(elements)))
+    self.assertEquals(sorted(elements), elements)
+
+  def testLargerBudget(self):
+    """A function can check more elements than the default."""
+    funcs = checker.ParserUtils().LoadTypeDeclaration(
+        "def Length(l : list<int>) -> int").funcs
+    state = checker.CheckState(
+        "Length", element_budget=checker.ElementBudget(1000))
+    length = checker.TypeCheck(generics, "Length", len, funcs["Length"],
+                               state)
+    values = range(1000)
+    self.assertEquals(1000, length(values))
+    self.assertEquals((1000, 0), (state.elements_checked,
+                                  state.elements_skipped))
+    values[501] = "x"
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      length(values)
+
+  def testImmutableMemo(self):
+    """Tuples are sampled and verified a budget at a time, then remembered."""
+    state = checker.GetCheckState(generics, "JoinAll")
+    state.elements_checked = state.elements_skipped = 0
+    words = tuple("w%d" % i for i in range(10000))
+    self.assertEquals("".join(words), generics.JoinAll(words))
+    # a sample, and the first leading elements
+    self.assertEquals((32, 9968), (state.elements_checked,
+                                   state.elements_skipped))
+    for _ in range(624):
+      generics.JoinAll(words)
+    self.assertEquals(20000, state.elements_checked)
+    self.assertEquals("".join(words), generics.JoinAll(words))
+    self.assertEquals(20000, state.elements_checked)
+
+  def testImmutableCheckedCompletely(self):
+    """A bad element in a tuple is found eventually, and remembered."""
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, str))
+    words = ("a",) * 5000 + (1,) + ("b",) * 5000
+    results = [check.Matches(words) for _ in range(1000)]
+    # the samples miss it, the 313th check covers elements 4992 to 5007
+    self.assertEquals([True] * 312 + [False] * 688, results)
+
+  def testImmutableSampledEveryTime(self):
+    """The sample spread over a tuple is checked on every call."""
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, int))
+    numbers = tuple(range(999)) + ("bad",)
+    self.assertEquals([False] * 3, [check.Matches(numbers) for _ in range(3)])
+    self.assertEquals([False] * 3, [check.Matches(numbers[:999] + ("bad",))
+                                    for _ in range(3)])
+    self.assertFalse(check.Matches(frozenset(["bad"])))
+
+  def testMutableElementsNotMemoized(self):
+    check = checker.CompileType(pytd.HomogeneousContainerType(
+        tuple, pytd.HomogeneousContainerType(list, int)))
+    self.assertFalse(check.memoizable)
+    check = checker.CompileType(pytd.HomogeneousContainerType(
+        tuple, pytd.UnionType([int, str])))
+    self.assertTrue(check.memoizable)
+
+  def testValueDependentElementsNotMemoized(self):
+    """Elements with a custom __instancecheck__ are checked every time."""
+    check = checker.CompileType(pytd.HomogeneousContainerType(
+        tuple, generics.Nonempty))
+    self.assertFalse(check.memoizable)
+    items = ([1],)
+    self.assertTrue(check.Matches(items))
+    del items[0][:]
+    self.assertFalse(check.Matches(items))
+
+  def testImmutableMemoEviction(self):
+    memo = checker._ImmutableContainerMemo(  # pylint: disable=protected-access
+        max_entries=3, max_bytes=10)
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, int))
+    tuples = [tuple(range(i)) for i in range(1, 6)]
+    for t in tuples:
+      memo.Add(t, check, len(t), len(t))
+    self.assertEquals(2, len(memo))
+    self.assertEquals(None, memo.Lookup(tuples[0], check))
+    self.assertEquals(5, memo.Lookup(tuples[4], check))
+    # an equal tuple is still a different container
+    self.assertEquals(None, memo.Lookup(tuple(range(5)), check))
+
+  def testImmutableMemoProgress(self):
+    """Progress only goes forward, and a failure is final."""
+    memo = checker._ImmutableContainerMemo()  # pylint: disable=protected-access
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, int))
+    t = tuple(range(100))
+    memo.Add(t, check, 32, 1000)
+    memo.Add(t, check, 16, 0)
+    self.assertEquals(32, memo.Lookup(t, check))
+    memo.Add(t, check, checker._FAILED, 0)  # pylint: disable=protected-access
+    memo.Add(t, check, 48, 0)
+    self.assertEquals(checker._FAILED, memo.Lookup(t, check))  # pylint: disable=protected-access
+
+  def testImmutableMemoThreads(self):
+    """Adding the same container from many threads keeps the memo sound."""
+    memo = checker._ImmutableContainerMemo(  # pylint: disable=protected-access
+        max_entries=4, max_bytes=1000)
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, int))
+    tuples = [tuple(range(i)) for i in range(1, 9)]
+    errors = []
+
+    def AddAll():
+      try:
+        for _ in range(200):
+          for t in tuples:
+            memo.Add(t, check, len(t), len(t))
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      threads = [threading.Thread(target=AddAll) for _ in range(8)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    finally:
+      sys.setcheckinterval(interval)
+    self.assertEquals([], errors)
+    # pylint: disable=protected-access
+    self.assertEquals(len(memo), len(memo._order))
+    self.assertEquals(sum(size for _, _, _, size
+                          in memo._entries.itervalues()),
+                      memo._bytes)
+
+  def testImmutableMemoSize(self):
+    """The memo is bounded by the size of the elements it keeps alive."""
+    big = tuple("x" * (1 << 20) + str(i) for i in range(4))
+    size = checker._EstimatedSize(big, big[:1])  # pylint: disable=protected-access
+    self.assertTrue(size > 4 << 20, size)
+    memo = checker._ImmutableContainerMemo(  # pylint: disable=protected-access
+        max_bytes=1 << 20)
+    check = checker.CompileType(pytd.HomogeneousContainerType(tuple, str))
+    memo.Add(big, check, 4, size)
+    self.assertEquals(0, len(memo))
+
+  def testArray(self):
+    """Arrays are checked on their typecode, without looking at elements."""
+    state = checker.GetCheckState(generics, "SumArray")
+    ints = array.array("i", range(100000))
+    self.assertEquals(sum(ints), generics.SumArray(ints))
+    self.assertEquals(sum(ints),
+                      generics.SumArray(array.array("L", range(100000))))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      generics.SumArray(array.array("d", [1.0]))
+    self.assertEquals(0, state.elements_skipped)
+
+  def testMemoryview(self):
+    element_type = type(memoryview(b"a")[0])
+    other_type = float if element_type is int else int
+    view = memoryview(b"abc")
+    self.assertTrue(checker.IsCompatibleType(
+        view, pytd.HomogeneousContainerType(memoryview, element_type)))
+    self.assertFalse(checker.IsCompatibleType(
+        view, pytd.HomogeneousContainerType(memoryview, other_type)))
+
+  def testNumpy(self):
+    try:
+      import numpy  # pylint: disable=g-import-not-at-top
+    except ImportError:
+      return  # NumPy is optional
+    float_check = checker.CompileType(
+        pytd.HomogeneousContainerType(numpy.ndarray, float))
+    self.assertTrue(float_check.Matches(numpy.zeros(1000000)))
+    self.assertFalse(float_check.Matches(numpy.zeros(10, dtype=numpy.int8)))
+    # Object arrays carry no element type, so their elements are sampled.
+    self.assertTrue(float_check.Matches(numpy.array([1.0, 2.0], dtype=object)))
+    self.assertFalse(float_check.Matches(numpy.array([1.0, "x"],
+                                                     dtype=object)))
+
 
 if __name__ == "__main__":
   unittest.main()
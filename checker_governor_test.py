@@ -0,0 +1,148 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import unittest
+from pytypedecl import checker
+from tests import simple
+
+
+class TestCheckerGovernor(unittest.TestCase):
+
+  def testSampleRate(self):
+    """Checking 1 in n calls stays within budget."""
+    governor = checker.Governor(budget=0.02, max_sample_rate=1000)
+    # checking costs as much as the function: 1 in 49 calls gives 2%
+    self.assertEquals(49, governor.SampleRate(1.0, 1.0))
+    # checking is cheap enough to check every call
+    self.assertEquals(1, governor.SampleRate(0.01, 1.0))
+    self.assertEquals(1, governor.SampleRate(0.0, 1.0))
+    self.assertEquals(1000, governor.SampleRate(1.0, 0.0))
+
+  def testAdjustAfterWindow(self):
+    governor = checker.Governor(budget=0.1, window=3)
+    state = checker.CheckState("f", governor=governor)
+    for now in range(2):
+      governor.Record(state, now * 0.01, 2e-6, 1e-6)
+    self.assertEquals(1, state.sample_rate)
+    governor.Record(state, 0.02, 2e-6, 1e-6)
+    self.assertEquals(18, state.sample_rate)
+    self.assertEquals(0, state.window_calls)
+
+  def _Call(self, state, now, check_time, body_time):
+    """Account for a call the way the wrappers do.
+
+    Returns:
+      The time spent checking the call
+    """
+    state.countdown -= 1
+    if state.countdown > 0:
+      return 0.0
+    state.countdown = state.Sample()
+    state.governor.Record(state, now, check_time, body_time)
+    return check_time
+
+  def testColdFunction(self):
+    """A function that isn't called for a while is checked on every call."""
+    governor = checker.Governor(budget=0.1, window=10, cold_after=1.0)
+    state = checker.CheckState("f", governor=governor)
+    now = 0.0
+    for _ in range(10):
+      now += 0.01
+      self._Call(state, now, 1.0, 1.0)
+    self.assertEquals(9, state.sample_rate)
+    for _ in range(9):
+      now += 0.01
+      self._Call(state, now, 1.0, 1.0)
+    self.assertEquals(9, state.sample_rate)
+    # One call every 10 seconds: cold once the next checked call comes.
+    for _ in range(9):
+      now += 10.0
+      self._Call(state, now, 1.0, 1.0)
+    self.assertEquals(1, state.sample_rate)
+
+  def testThrottledFunctionIsNotCold(self):
+    """Checked calls further apart than cold_after don't make it cold."""
+    governor = checker.Governor(budget=0.02, cold_after=1.0)
+    state = checker.CheckState("f", governor=governor)
+    check_time = body_time = 0.0
+    # 1000 calls per second, checking costs 200 times the function
+    for i in xrange(300000):
+      checked = self._Call(state, i * 1e-3, 200e-6, 1e-6)
+      if i >= 1000:
+        check_time += checked
+        body_time += 1e-6
+    # About 1 in 9800 calls is checked, i.e. one call every 9.8 seconds
+    self.assertGreater(state.sample_rate, 9000)
+    self.assertLess(check_time / (check_time + body_time), 0.03)
+
+  def testColdWhileOthersAreCalled(self):
+    """Any function's checked call shows that a throttled one went cold."""
+    governor = checker.Governor(budget=0.02, cold_after=1.0)
+    f = checker.CheckState("f", governor=governor)
+    g = checker.CheckState("g", governor=governor)
+    for i in xrange(300000):
+      self._Call(f, i * 1e-3, 200e-6, 1e-6)
+    self.assertGreater(f.sample_rate, 9000)
+    # f is now called once a minute, g, which is cheap to check, every second.
+    # Up to 9800 calls of f since its last checked call were a millisecond
+    # apart; f is cold once the average gap since then is above a second,
+    # i.e. within three hours rather than 9800 minutes.
+    now = 300.0
+    for i in xrange(3 * 3600):
+      now += 1.0
+      if i % 60 == 0:
+        self._Call(f, now, 200e-6, 1e-6)
+      self._Call(g, now, 0.0, 1e-3)
+    self.assertEquals(1, f.sample_rate)
+    self.assertEquals(1, g.sample_rate)
+    self.assertEquals([f, g], governor.states)
+
+  def testSweep(self):
+    """Sweeping from a timer finds cold functions without any calls."""
+    governor = checker.Governor(budget=0.1, window=10, cold_after=1.0)
+    state = checker.CheckState("f", governor=governor)
+    for i in range(10):
+      self._Call(state, i * 0.01, 1.0, 1.0)
+    self.assertEquals(9, state.sample_rate)
+    governor.Sweep(0.5)
+    self.assertEquals(9, state.sample_rate)
+    governor.Sweep(5.0)
+    self.assertEquals(1, state.sample_rate)
+
+  def testGovernedFunction(self):
+    """Checking a trivial function is expensive, so its rate goes up."""
+    funcs = checker.ParserUtils().LoadTypeDeclaration(
+        "def IntToInt(i: int) -> int").funcs
+    state = checker.CheckState(
+        "IntToInt", governor=checker.Governor(budget=0.01, window=10))
+    checked = checker.TypeCheck(simple, "IntToInt", lambda i: i,
+                                funcs["IntToInt"], state)
+    for i in range(10):
+      self.assertEquals(i, checked(i))
+    self.assertTrue(state.sample_rate > 1, state.sample_rate)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      for _ in range(state.sample_rate):
+        checked("not an int")
+
+  def testInvalidBudget(self):
+    with self.assertRaises(ValueError):
+      checker.Governor(budget=0.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
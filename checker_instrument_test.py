@@ -0,0 +1,152 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import unittest
+from pytypedecl import checker
+from tests import instrument
+
+
+class TestCheckerInstrument(unittest.TestCase):
+
+  def setUp(self):
+    self.module = reload(instrument)
+    self.originals = dict(self.module.__dict__)
+    self.method_originals = dict(self.module.Shape.__dict__)
+
+  def _Check(self, **kwargs):
+    self.module.Check(**kwargs)
+
+  def _AssertChecked(self, checked):
+    calls = [lambda: self.module.Double("1"),
+             lambda: self.module.Shape().Grow("1"),
+             lambda: self.module.Shape.Make("1"),
+             lambda: self.module.Shape.Area("1")]
+    for call in calls:
+      if checked:
+        self.assertRaises(checker.CheckTypeAnnotationError, call)
+      else:
+        call()
+
+  def testModule(self):
+    self._Check()
+    self._AssertChecked(True)
+    checker.Uninstrument(self.module)
+    self.assertIs(self.originals["Double"], self.module.Double)
+    for name in ("Grow", "Make", "Area"):
+      self.assertIs(self.method_originals[name],
+                    self.module.Shape.__dict__[name])
+    self._AssertChecked(False)
+    checker.Reinstrument(self.module)
+    self._AssertChecked(True)
+
+  def testClassAndFunction(self):
+    self._Check()
+    checker.Uninstrument(self.module, "Shape")
+    self.assertIs(self.method_originals["Grow"],
+                  self.module.Shape.__dict__["Grow"])
+    self.assertIsNot(self.originals["Double"], self.module.Double)
+    checker.Reinstrument(self.module, "Shape")
+    checker.Uninstrument(self.module, "Shape.Make")
+    self.assertEquals("1", self.module.Shape.Make("1"))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.Shape.Area("1")
+    # reinstrumenting twice is harmless
+    checker.Reinstrument(self.module, "Shape.Make")
+    checker.Reinstrument(self.module, "Shape.Make")
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.Shape.Make("1")
+
+  def testUnknownName(self):
+    self._Check()
+    with self.assertRaises(KeyError):
+      checker.Uninstrument(self.module, "Triple")
+
+  def testHeldReferencesStopChecking(self):
+    self._Check(sample_rate=3)
+    double = self.module.Double
+    checker.Uninstrument(self.module)
+    for _ in range(10):
+      self.assertEquals("11", double("1"))
+    checker.Reinstrument(self.module)
+    self.assertEquals(3, checker.GetCheckState(self.module, "Double")
+                      .sample_rate)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      for _ in range(3):
+        double("1")
+
+  def testHeldReferencesStaySuspended(self):
+    """Changing the sample rate doesn't resume checking, Reinstrument does."""
+    self._Check(check_budget=0.5)
+    double = self.module.Double
+    state = checker.GetCheckState(self.module, "Double")
+    checker.Uninstrument(self.module)
+    # a governor window that completes during an in-flight call
+    for _ in range(state.governor.window):
+      state.governor.Record(state, 0.0, 1.0, 1.0)
+    # an operator changing the sample rate of the whole module
+    checker.SetSampleRate(self.module, 1)
+    # an in-flight call that was due to be checked
+    state.countdown = state.Sample()
+    for _ in range(10):
+      self.assertEquals("11", double("1"))
+    checker.Reinstrument(self.module)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      double("1")
+
+  def testLazy(self):
+    self._Check(lazy=True)
+    checker.Uninstrument(self.module, "Double")
+    self.assertIs(self.originals["Double"], self.module.Double)
+    checker.Reinstrument(self.module, "Double")
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.Double("1")
+    # the trampoline was replaced by the compiled wrapper, which is what
+    # uninstrumenting saves now
+    checker.Uninstrument(self.module, "Double")
+    checker.Reinstrument(self.module, "Double")
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      self.module.Double("1")
+
+  def testConcurrentCallers(self):
+    """Callers see either the checked or the original function."""
+    self._Check()
+    errors = []
+    stop = []
+
+    def Call():
+      while not stop:
+        try:
+          if self.module.Double(2) != 4:
+            errors.append("wrong result")
+        except Exception as e:  # pylint: disable=broad-except
+          errors.append(e)
+
+    threads = [threading.Thread(target=Call) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for _ in range(200):
+      checker.Uninstrument(self.module)
+      checker.Reinstrument(self.module)
+    stop.append(True)
+    for thread in threads:
+      thread.join()
+    self.assertEquals([], errors)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from pytypedecl import checker
+from tests import lazy
+
+
+class TestCheckerLazy(unittest.TestCase):
+
+  def testNotCompiledBeforeFirstCall(self):
+    """Signatures of functions that are never called are never compiled."""
+    self.assertIsNone(checker.GetCheckState(lazy, "Unused").signatures)
+
+  def testCompiledOnFirstCall(self):
+    state = checker.GetCheckState(lazy, "Add")
+    trampoline = lazy.Add
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      trampoline(1, "2")
+    self.assertIsNotNone(state.signatures)
+    # the trampoline replaced itself with the compiled wrapper ...
+    self.assertIsNot(trampoline, lazy.Add)
+    self.assertEquals(3, lazy.Add(1, 2))
+    # ... and forwards calls through old references to it
+    self.assertEquals(3, trampoline(1, 2))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      trampoline(1, 2.0)
+    self.assertEquals("Add", lazy.Add.__name__)
+
+  def testMethods(self):
+    counter = lazy.Counter()
+    self.assertEquals(2, counter.Increment(1))
+    self.assertIsNotNone(
+        checker.GetCheckState(lazy, "Counter.Increment").signatures)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      counter.Increment("1")
+
+  def testClassMethods(self):
+    self.assertEquals(2, lazy.Counter.Next(1))
+    self.assertEquals(2, lazy.Counter().Next(1))
+    self.assertIsInstance(lazy.Counter.__dict__["Next"], classmethod)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      lazy.Counter.Next("1")
+
+
+if __name__ == "__main__":
+  unittest.main()
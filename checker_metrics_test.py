@@ -0,0 +1,107 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import StringIO
+import unittest
+from pytypedecl import checker
+from tests import metrics
+
+
+class TestCheckerMetrics(unittest.TestCase):
+
+  def setUp(self):
+    self.module = reload(metrics)
+
+  def _Stats(self):
+    return {f.function: f for f in checker.Stats(self.module).functions}
+
+  def _CallBadly(self):
+    self.assertRaises(checker.CheckTypeAnnotationError,
+                      self.module.IntToInt, "1")
+    self.assertRaises(checker.CheckTypeAnnotationError,
+                      self.module.IntToInt, None)
+    self.assertRaises(checker.CheckTypeAnnotationError,
+                      self.module.Bar, 1.0)
+
+  def testCounters(self):
+    self.module.Check(sample_rates={"Counter.Add": 3})
+    for i in range(10):
+      self.module.Counter().Add(i)
+    self.module.IntToInt(1)
+    self._CallBadly()
+    stats = self._Stats()
+    self.assertEquals((10, 3, 0), stats["Counter.Add"][2:5])
+    self.assertEquals((3, 3, 2), stats["IntToInt"][2:5])
+    self.assertEquals((1, 1, 1), stats["Bar"][2:5])
+    # Times are only measured with metrics=True.
+    self.assertEquals((None,) * 4, stats["Bar"][5:])
+
+  def testCountersAcrossSampleRateChanges(self):
+    self.module.Check()
+    add = self.module.Counter().Add
+    for i in range(5):
+      add(i)
+    checker.SetSampleRate(self.module, 4, "Counter.Add")
+    for i in range(5):
+      add(i)
+    checker.Uninstrument(self.module, "Counter")
+    add(1)  # still the checked method, but it doesn't count anymore
+    checker.Reinstrument(self.module, "Counter")
+    add(1)
+    self.assertEquals((11, 6, 0), self._Stats()["Counter.Add"][2:5])
+
+  def testTimings(self):
+    self.module.Check(metrics=True)
+    for i in range(10):
+      self.module.IntToInt(i)
+    self._CallBadly()
+    stats = self._Stats()
+    param_ns, return_ns, exception_ns, body_ns = stats["IntToInt"][5:]
+    self.assertGreater(param_ns, 0)
+    self.assertGreater(return_ns, 0)
+    self.assertGreater(exception_ns, 0)
+    self.assertGreater(body_ns, 0)
+    # Calls rejected before the function ran only take parameter time.
+    param_ns, return_ns, exception_ns, body_ns = stats["Bar"][5:]
+    self.assertGreater(param_ns, 0)
+    self.assertEquals((0, 0, 0), (return_ns, exception_ns, body_ns))
+
+  def testJson(self):
+    self.module.Check(metrics=True)
+    self.module.IntToInt(1)
+    stats = checker.Stats(self.module)
+    dumped = StringIO.StringIO()
+    stats.Dump(dumped)
+    self.assertEquals(json.loads(stats.ToJson()),
+                      json.loads(dumped.getvalue()))
+    by_name = {f["function"]: f for f in json.loads(stats.ToJson())}
+    self.assertEquals(["Bar", "Counter.Add", "IntToInt"], sorted(by_name))
+    self.assertEquals("tests.metrics", by_name["IntToInt"]["module"])
+    self.assertEquals(1, by_name["IntToInt"]["calls"])
+    # The functions whose checks took the most time come first.
+    self.assertEquals("IntToInt", stats.functions[0].function)
+
+  def testAllModules(self):
+    self.module.Check()
+    self.assertTrue(any(f.module == "tests.metrics"
+                        for f in checker.Stats().functions))
+    self.assertRaises(KeyError, checker.Stats, json)  # not a checked module
+
+
+if __name__ == "__main__":
+  unittest.main()
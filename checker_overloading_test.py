@@ -17,6 +17,7 @@
 
 import unittest
 from pytypedecl import checker
+from tests import custom
 from tests import overloading
 from tests import simple
 
@@ -40,6 +41,17 @@ class TestCheckerOverloading(unittest.TestCase):
     [actual] = context.exception.args[0]
     self.assertEquals(expected, actual)
 
+  def testOverloadedKeywordArgs(self):
+    """Arguments passed by keyword select the signature, too."""
+    self.assertEquals(42, overloading.Bar(i=1))
+    self.assertEquals(42, overloading.Bar(i="a"))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      overloading.Bar(i=1.0)
+
+    [actual] = context.exception.args[0]
+    self.assertEquals(checker.OverloadingTypeErrorMsg("Bar"), actual)
+
   def testFibonnaciNoError(self):
     """Type checking of fib.
     """
@@ -83,5 +95,47 @@ class TestCheckerOverloading(unittest.TestCase):
     with self.assertRaises(simple.WrongException):
       overloading.ExceptionOverload()
 
+  def testDispatchCache(self):
+    """Signature matching is cached by argument types."""
+    dispatch = checker.GetCheckState(overloading,
+                                     "MultiOverload").signatures.dispatch
+    dispatch.clear()
+    self.assertEquals(42, overloading.MultiOverload(42))
+    self.assertEquals(43, overloading.MultiOverload(43))
+    [plan] = dispatch[(int,)]
+    self.assertEquals(int, plan.return_class)
+
+    expected = checker.OverloadingTypeErrorMsg("MultiOverload")
+    for _ in range(2):
+      with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+        overloading.MultiOverload({})
+      [actual] = context.exception.args[0]
+      self.assertEquals(expected, actual)
+    self.assertEquals((), dispatch[(dict,)])
+
+  def testDispatchCacheCustomInstanceCheck(self):
+    """Classes with a custom __instancecheck__ aren't dispatched by type."""
+    signatures = checker.GetCheckState(overloading, "Sign").signatures
+    self.assertFalse(signatures.dispatch_cacheable)
+    self.assertEquals(1, overloading.Sign(5))
+    self.assertRaises(checker.CheckTypeAnnotationError, overloading.Sign, -1)
+    self.assertEquals({}, signatures.dispatch)
+
+  def testDispatchCacheProxy(self):
+    """Proxies claiming another __class__ aren't dispatched by type()."""
+    self.assertEquals(42, overloading.Bar(custom.Proxy(1)))
+    self.assertRaises(checker.CheckTypeAnnotationError, overloading.Bar,
+                      custom.Proxy(1.0))
+    self.assertEquals(42, overloading.Bar(custom.Proxy("a")))
+
+  def testDispatchCacheBounded(self):
+    """The dispatch cache doesn't grow without bounds."""
+    dispatch = checker.GetCheckState(overloading,
+                                     "MultiOverload").signatures.dispatch
+    for i in range(1000):
+      cls = type("Int%d" % i, (int,), {})
+      self.assertEquals(i, overloading.MultiOverload(cls(i)))
+    self.assertTrue(len(dispatch) <= 256, len(dispatch))
+
 if __name__ == "___main__":
   unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import itertools
+import sys
+import unittest
+from pytypedecl import checker
+from pytypedecl.parse import parser
+from tests import simple
+
+
+_DECLARATIONS = """
+class Record:
+  id: int
+
+class Point(Record):
+  x: int
+  y: float or None
+  tags: list<basestring>
+
+class Basket:
+  fruit: simple.Apple or simple.Banana
+
+class Empty:
+  pass
+"""
+
+
+class Attributes(object):
+
+  def __init__(self, **kwargs):
+    self.__dict__.update(kwargs)
+
+
+class Fields(collections.Mapping):
+  """A mapping that isn't a dict."""
+
+  def __init__(self, **kwargs):
+    self.fields = kwargs
+
+  def __getitem__(self, key):
+    return self.fields[key]
+
+  def __iter__(self):
+    return iter(self.fields)
+
+  def __len__(self):
+    return len(self.fields)
+
+
+class TestCheckerRecords(unittest.TestCase):
+
+  def setUp(self):
+    self.unit = parser.TypeDeclParser().Parse(_DECLARATIONS)
+
+  def _Validate(self, records, class_name="Point", **kwargs):
+    return list(checker.ValidateRecords(records, self.unit, class_name,
+                                        **kwargs))
+
+  def testPlan(self):
+    """Fields of parent classes come first."""
+    plan = checker.CompileRecordPlan(self.unit, "Point")
+    self.assertEquals(("id", "x", "y", "tags"), plan.names)
+    self.assertEquals(int, plan.formals[0])
+    self.assertIsNone(plan.classes)
+    self.assertEquals((int,), checker.CompileRecordPlan(self.unit,
+                                                        "Record").classes)
+
+  def testDicts(self):
+    records = [{"id": 1, "x": 2, "y": None, "tags": []},
+               {"id": 2, "x": "3", "tags": [u"a", 1], "extra": None},
+               {"id": 3, "x": 4, "y": 5.0, "tags": ["a", u"b"]}]
+    [result] = self._Validate(records)
+    self.assertEquals(1, result.index)
+    self.assertIs(records[1], result.record)
+    plan = checker.CompileRecordPlan(self.unit, "Point")
+    self.assertEquals(
+        [checker.FieldTypeErrorMsg("Point", "x", str, int, 1),
+         checker.FieldTypeErrorMsg("Point", "y", None, plan.formals[2], 1),
+         checker.FieldTypeErrorMsg("Point", "tags", list, plan.formals[3],
+                                   1)],
+        result.violations)
+    self.assertIn("field: y is MISSING", str(result.violations[1]))
+
+  def testAllResults(self):
+    records = [{"id": 1}, {"id": "2"}, {}]
+    results = self._Validate(records, "Record", invalid_only=False)
+    self.assertEquals([0, 1, 2], [r.index for r in results])
+    self.assertEquals([0, 1, 1], [len(r.violations) for r in results])
+    self.assertEquals(checker.TypeViolation.FIELD,
+                      results[2].violations[0].kind)
+
+  def testObjectsAndMappings(self):
+    records = [Attributes(id=1), Attributes(id=None), Attributes(),
+               Fields(id=1), Fields(id=1.0), Fields()]
+    self.assertEquals([1, 2, 4, 5],
+                      [r.index for r in self._Validate(records, "Record")])
+
+  def testDefaultDict(self):
+    """Missing fields are reported, not added by __missing__."""
+    records = [collections.defaultdict(int, {"y": "a"}),
+               collections.defaultdict(int, {"id": 1})]
+    [result] = self._Validate(records, "Record")
+    self.assertEquals(0, result.index)
+    self.assertIn("field: id is MISSING", str(result.violations[0]))
+    self.assertEquals({"y": "a"}, records[0])
+
+  def testModule(self):
+    records = [{"fruit": simple.Apple()}, {"fruit": simple.Banana()},
+               {"fruit": "apple"}]
+    results = checker.ValidateRecords(records, self.unit, "Basket",
+                                      module=sys.modules[__name__])
+    self.assertEquals([2], [r.index for r in results])
+
+  def testElementBudget(self):
+    records = [{"id": 1, "x": 1, "y": None,
+                "tags": ["a"] * 50 + [1] + ["a"] * 50}]
+    self.assertEquals([], self._Validate(records))
+    self.assertEquals(1, len(self._Validate(
+        records, element_budget=checker.ElementBudget(1000))))
+
+  def testLazy(self):
+    """Records are only read as results are requested."""
+    records = itertools.imap(lambda i: {"id": i if i % 10 else str(i)},
+                             itertools.count())
+    results = checker.ValidateRecords(records, self.unit, "Record")
+    self.assertEquals([0, 10, 20], [r.index for r in
+                                    itertools.islice(results, 3)])
+
+  def testEmpty(self):
+    self.assertEquals([], self._Validate([{}, None, 1], "Empty"))
+
+  def testUnknownClass(self):
+    self.assertRaises(KeyError, checker.ValidateRecords, [], self.unit,
+                      "Nothing")
+
+
+if __name__ == "__main__":
+  unittest.main()
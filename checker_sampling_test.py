@@ -0,0 +1,85 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+import unittest
+from pytypedecl import checker
+from tests import sampling
+
+
+class TestCheckerSampling(unittest.TestCase):
+
+  def setUp(self):
+    checker.SetSampleRate(sampling, 2)
+    checker.SetSampleRate(sampling, 1000, "Rarely")
+
+  def _CountChecked(self, func, calls):
+    checked = 0
+    for _ in xrange(calls):
+      try:
+        func("not an int")
+      except checker.CheckTypeAnnotationError:
+        checked += 1
+    return checked
+
+  def testModuleRate(self):
+    """Every second call is checked."""
+    self.assertEquals(42, sampling.Often("not an int"))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      sampling.Often("not an int")
+    self.assertEquals(50, self._CountChecked(sampling.Often, 100))
+
+  def testFunctionRate(self):
+    """The rate of a single function can be overridden."""
+    self.assertEquals(1000, checker.GetCheckState(sampling,
+                                                  "Rarely").sample_rate)
+    self.assertEquals(0, self._CountChecked(sampling.Rarely, 999))
+    self.assertEquals(1, self._CountChecked(sampling.Rarely, 1))
+
+  def testClassMethodRate(self):
+    """Methods are sampled, too, and still get their class."""
+    self.assertEquals(42, sampling.Counter.Next("not an int"))
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      sampling.Counter.Next("not an int")
+
+  def testChangeAtRuntime(self):
+    """Changing the rate takes effect immediately."""
+    checker.SetSampleRate(sampling, 1, "Rarely")
+    self.assertEquals(10, self._CountChecked(sampling.Rarely, 10))
+    self.assertEquals(5, self._CountChecked(sampling.Often, 10))
+    checker.SetSampleRate(sampling, 1)
+    self.assertEquals(10, self._CountChecked(sampling.Often, 10))
+
+  def testRandomSampling(self):
+    """Random sampling checks 1 in n calls on average, reproducibly."""
+    checker.SetSampleRate(sampling, 10, "Often", sample_seed=42)
+    checked = self._CountChecked(sampling.Often, 10000)
+    self.assertTrue(800 < checked < 1200, checked)
+    checker.SetSampleRate(sampling, 10, "Often", sample_seed=42)
+    self.assertEquals(checked, self._CountChecked(sampling.Often, 10000))
+
+  def testGetSampleRates(self):
+    self.assertEquals({"Often": 2, "Rarely": 1000, "Counter.Next": 2},
+                      checker.GetSampleRates(sampling))
+
+  def testInvalidRate(self):
+    with self.assertRaises(ValueError):
+      checker.SetSampleRate(sampling, 0, "Often")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,228 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+from pytypedecl import checker
+from tests import shadow
+
+
+class TestCheckerShadow(unittest.TestCase):
+
+  def setUp(self):
+    self.module = reload(shadow)
+    self.reported = []
+    self.shadow = checker.ShadowChecker(max_queued=4,
+                                        report=self.reported.append)
+    self.module.Check(shadow=self.shadow)
+
+  def tearDown(self):
+    self.shadow.Stop()
+
+  def testViolationsReportedLater(self):
+    """Violations don't raise errors, they're reported by the checker."""
+    self.assertEquals("1", self.module.IntToInt("1"))
+    self.assertEquals([], self.reported)
+    self.shadow.Drain()
+    self.assertEquals(
+        [[checker.ParamTypeErrorMsg("IntToInt", "i", str,
+                                    self._Formal("IntToInt", 0)),
+          checker.ReturnTypeErrorMsg("IntToInt", str, int)]],
+        self.reported)
+    self.assertEquals((1, 1), (self.shadow.checked, self.shadow.violations))
+
+  def _Formal(self, func_name, i):
+    state = checker.GetCheckState(self.module, func_name)
+    return state.signatures.plans[0].params[i][1]
+
+  def testExceptions(self):
+    with self.assertRaises(self.module.FooException):
+      self.module.IntToInt(0)
+    with self.assertRaises(ValueError):
+      self.module.IntToInt(None)
+    self.shadow.Drain()
+    self.assertEquals(
+        [[checker.ExceptionTypeErrorMsg(
+            "IntToInt", ValueError, (self.module.FooException,))]],
+        self.reported)
+
+  def testKeywordsAndContainers(self):
+    # Only the type of containers is checked.
+    self.assertEquals(1, self.module.Length(l=["1"]))
+    self.assertEquals(1, self.module.Length(l=("1",)))
+    self.shadow.Drain()
+    self.assertEquals(
+        [[checker.ParamTypeErrorMsg("Length", "l", tuple,
+                                    self._Formal("Length", 0))]],
+        self.reported)
+
+  def testOverloads(self):
+    self.assertEquals(1, self.module.Bar(1))
+    self.assertEquals(1.0, self.module.Bar(1.0))
+    self.shadow.Drain()
+    self.assertEquals([[checker.OverloadingTypeErrorMsg("Bar")]],
+                      self.reported)
+
+  def testCustomInstanceCheck(self):
+    """Classes that look at the value can't be checked by type, so pass."""
+    self.assertEquals(5, self.module.Pos(5))
+    self.assertEquals(-5, self.module.Pos(-5))
+    self.shadow.Drain()
+    self.assertEquals((2, 0), (self.shadow.checked, self.shadow.violations))
+
+  def testMethodsOfDifferentClasses(self):
+    """Methods of the same name are told apart by their class."""
+    limiter = checker.ViolationLimiter(self.reported.append)
+    self.shadow.report = limiter
+    for _ in range(2):
+      self.module.Left().Run("a")
+      self.module.Right().Run(1)
+      self.shadow.Drain()
+    left, right = [errors for errors, in self.reported]
+    self.assertEquals(("Left.Run", "Right.Run"),
+                      (left.qualified_name, right.qualified_name))
+    # the messages don't name the class
+    self.assertEquals(checker.ParamTypeErrorMsg("Run", "x", str,
+                                                self._Formal("Left.Run", 1)),
+                      left)
+    self.assertEquals(2, limiter.suppressed)
+
+  def testDropsWhenFull(self):
+    for i in range(10):
+      self.module.IntToInt(i + 1)
+    self.assertEquals(6, self.shadow.dropped)
+    self.shadow.Drain()
+    self.assertEquals(4, self.shadow.checked)
+
+  def testBackgroundThread(self):
+    self.module.IntToInt("1")
+    self.shadow.Start()
+    deadline = time.time() + 10
+    while not self.reported and time.time() < deadline:
+      time.sleep(0.01)
+    self.assertEquals(1, len(self.reported))
+
+  def testBackgroundThreadSurvivesErrors(self):
+    """Errors in the background thread are counted, and checking goes on."""
+    def Report(errors):
+      self.reported.append(errors)
+      if len(self.reported) == 1:
+        raise ValueError("report failed")
+    self.shadow.report = Report
+    self.module.IntToInt("1")
+    self.module.IntToInt("2")
+    self.shadow.Start()
+    deadline = time.time() + 10
+    while len(self.reported) < 2 and time.time() < deadline:
+      time.sleep(0.01)
+    self.assertEquals(2, len(self.reported))
+    self.assertEquals(1, self.shadow.errors)
+    self.assertTrue(self.shadow._thread.is_alive())
+
+
+class TestShadowModule(unittest.TestCase):
+  """shadow=True starts a ShadowChecker for the module."""
+
+  def testGetShadowChecker(self):
+    module = reload(shadow)
+    module.Check(shadow=True)
+    shadow_checker = checker.GetShadowChecker(module)
+    self.addCleanup(shadow_checker.Stop)
+    reported = []
+    shadow_checker.report.report = reported.append
+    self.assertEquals("1", module.IntToInt("1"))
+    self.assertEquals("1", module.IntToInt("1"))
+    shadow_checker.Stop()
+    self.assertEquals((2, 2), (shadow_checker.checked,
+                               shadow_checker.violations))
+    # the repeats are summarized when the checker stops
+    self.assertEquals([2, 2], map(len, reported))
+    self.assertEquals([1, 1], [summary.count for summary in reported[1]])
+
+  def testCheckedAgain(self):
+    """Checking a module again stops the thread of its previous checker."""
+    module = reload(shadow)
+    module.Check(shadow=True)
+    first = checker.GetShadowChecker(module)
+    module.Check(shadow=True)
+    second = checker.GetShadowChecker(module)
+    self.addCleanup(second.Stop)
+    self.assertIsNot(first, second)
+    self.assertEquals(None, first._thread)  # pylint: disable=protected-access
+
+  def testNotShadowed(self):
+    self.assertRaises(KeyError, checker.GetShadowChecker, checker)
+
+
+class TestViolationLimiter(unittest.TestCase):
+
+  def setUp(self):
+    self.now = 100.0
+    self.reported = []
+    self.limiter = checker.ViolationLimiter(self.reported.append,
+                                            summary_interval=60,
+                                            clock=lambda: self.now)
+
+  def testRepeatsSummarized(self):
+    bad_str = checker.ParamTypeErrorMsg("IntToInt", "i", str, int)
+    bad_list = checker.ParamTypeErrorMsg("IntToInt", "i", list, int)
+    bad_return = checker.ReturnTypeErrorMsg("IntToInt", str, int)
+    self.limiter([bad_str, bad_return])
+    for _ in range(1000):
+      self.limiter([bad_str])
+    self.limiter([bad_list])
+    self.assertEquals([[bad_str, bad_return], [bad_list]], self.reported)
+    self.assertEquals(1000, self.limiter.suppressed)
+
+    self.now += 60
+    self.limiter([bad_str])
+    self.assertEquals([checker.ViolationSummary(bad_str, 1001, 60.0)],
+                      self.reported[2])
+    self.assertEquals(
+        str(bad_str) + " (repeated 1001 times in the last 60 seconds)",
+        str(self.reported[2][0]))
+
+    # Repeats are counted again from the summary on, and never reported
+    # individually anymore.
+    self.limiter([bad_return, bad_str])
+    self.now += 5
+    self.limiter.Flush()
+    self.assertEquals(4, len(self.reported))
+    self.assertEquals([(bad_str, 1, 5.0), (bad_return, 1, 5.0)],
+                      sorted(self.reported[3], key=lambda s: str(s)))
+
+  def testFlushWithoutRepeats(self):
+    self.limiter([checker.OverloadingTypeErrorMsg("Bar")])
+    self.limiter.Flush()
+    self.assertEquals(1, len(self.reported))
+
+  def testFlushedOnStop(self):
+    """Repeats of the last interval of a storm aren't lost at shutdown."""
+    shadow = checker.ShadowChecker(report=self.limiter)
+    shadow.Start()
+    bad_str = checker.ParamTypeErrorMsg("IntToInt", "i", str, int)
+    for _ in range(3):
+      self.limiter([bad_str])
+    shadow.Stop()
+    self.assertEquals([[bad_str], [checker.ViolationSummary(bad_str, 2, 0.0)]],
+                      self.reported)
+    # a report function without Flush is fine, too
+    checker.ShadowChecker(report=self.reported.append).Stop()
+
+
+if __name__ == "__main__":
+  unittest.main()
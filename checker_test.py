@@ -18,6 +18,8 @@
 import types
 import unittest
 from pytypedecl import checker
+from pytypedecl import pytd
+from pytypedecl.parse import parser
 from tests import simple
 
 
@@ -42,6 +44,19 @@ class TestChecker(unittest.TestCase):
     [actual] = context.exception.args[0]
     self.assertEquals(expected, actual)
 
+  def testErrorFormatting(self):
+    """Errors are structured, and only formatted when printed."""
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      simple.IntToInt("test")
+
+    [actual] = context.exception.args[0]
+    self.assertEquals(("IntToInt", checker.TypeViolation.PARAM, "i", str),
+                      actual.Key())
+    self.assertEquals("[TYPE_ERROR] Function: IntToInt, parameter: i => "
+                      "FOUND: <type 'str'> but EXPECTED: <type 'int'>",
+                      str(actual))
+    self.assertIn(repr(str(actual)), str(context.exception))
+
   def testMultiArgTypeError(self):
     """Type checking of function with multiple argument.
     """
@@ -166,6 +181,125 @@ class TestChecker(unittest.TestCase):
     [actual] = context.exception.args[0]
     self.assertEquals(expected_p, actual)
 
+  def testCompileSignature(self):
+    """Types of a signature are resolved into a CheckPlan."""
+    unit = parser.TypeDeclParser().Parse(
+        "def f(a: int, b, c: Apple or None) -> str raises FooException")
+    [sig] = unit.Lookup("f").signatures
+    plan = checker.CompileSignature(simple, sig)
+    self.assertEquals(((0, int), (2, (simple.Apple, types.NoneType))),
+                      plan.class_checks)
+    self.assertEquals((), plan.other_checks)
+    self.assertEquals(pytd.UnionType([simple.Apple, types.NoneType]),
+                      plan.params[2][1])
+    self.assertEquals(str, plan.return_class)
+    self.assertEquals((simple.FooException,), plan.exceptions)
+
+  def testNoTypeResolutionPerCall(self):
+    """Type names are not evaluated again when a checked function is called.
+    """
+    evaluated = []
+    original = checker._EvalWithModuleContext
+    def CountingEval(expr, module):
+      evaluated.append(expr)
+      return original(expr, module)
+    checker._EvalWithModuleContext = CountingEval
+    try:
+      simple.IntToInt(2)
+      simple.MultiArgsNoType(1, 2, 3, "4", [])
+      with self.assertRaises(simple.FooException):
+        simple.FooFail()
+    finally:
+      checker._EvalWithModuleContext = original
+    self.assertEquals([], evaluated)
+
+  def testSpecializedWrapper(self):
+    """Simple signatures get a wrapper with the function's own parameters."""
+    self.assertEquals(("i",), simple.IntToInt.__code__.co_varnames[:1])
+    self.assertEquals(1, simple.IntToInt.__code__.co_argcount)
+    self.assertEquals(42, simple.IntToInt(i=1))
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      simple.IntToInt(1, 2)
+    self.assertIsInstance(context.exception.args[1], TypeError)
+    with self.assertRaises(checker.CheckTypeAnnotationError):
+      simple.IntToInt(i="1")
+
+  def testWrapperSharedByShape(self):
+    """Wrappers are only compiled once per signature shape."""
+    [sig] = parser.TypeDeclParser().Parse(
+        "def f(i: int) -> int").Lookup("f").signatures
+    def Double(i):
+      return 2 * i
+    def Negate(i):
+      return -i
+    double = checker.TypeCheck(simple, "Double", Double, [sig])
+    negate = checker.TypeCheck(simple, "Negate", Negate, [sig])
+    self.assertIs(double.__code__, negate.__code__)
+    self.assertEquals((4, -2), (double(2), negate(2)))
+
+  def testGenericWrapper(self):
+    """The generic wrapper reports the same errors as the generated one."""
+    [sig] = parser.TypeDeclParser().Parse(
+        "def f(a: int, b: str) -> int").Lookup("f").signatures
+    def Length(a, b):
+      return len(b)
+    wrappers = [checker.TypeCheck(simple, "Length", Length, [sig], **kwargs)
+                for kwargs in ({}, {"specialize": False})]
+    self.assertIsNot(wrappers[0].__code__, wrappers[1].__code__)
+    errors = []
+    for wrapped in wrappers:
+      self.assertEquals(3, wrapped(1, "abc"))
+      with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+        wrapped("1", "abc")
+      errors.append(context.exception.args[0])
+      with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+        wrapped(1, None)
+      errors.append(context.exception.args[0])
+      # arguments that don't fit the parameters
+      self.assertEquals(3, wrapped(1, b="abc"))
+      for args, kwargs in (((1,), {}), ((1, "abc", 2), {}),
+                           ((1, "abc"), {"c": 2}), ((), {"b": "abc"})):
+        with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+          wrapped(*args, **kwargs)
+        errors.append(context.exception.args[0])
+    self.assertEquals(errors[:6], errors[6:])
+    # a parameter passed twice fails binding the generated wrapper's params
+    with self.assertRaisesRegexp(TypeError, "multiple values") as context:
+      wrappers[0](1, a=2)
+    self.assertNotIsInstance(context.exception,
+                             checker.CheckTypeAnnotationError)
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      wrappers[1](1, a=2)
+    self.assertEquals(
+        [checker.ExceptionTypeErrorMsg("Length", TypeError, ())],
+        context.exception.args[0])
+    self.assertEquals([checker.ParamTypeErrorMsg("Length", "a", str, int)],
+                      errors[0])
+    self.assertEquals([checker.ExceptionTypeErrorMsg("Length", TypeError, ())],
+                      errors[2])
+
+  def testKeywordArgs(self):
+    """Arguments passed by keyword are checked against their param."""
+    [sig] = parser.TypeDeclParser().Parse(
+        "def f(a: int, b, c: str) -> int").Lookup("f").signatures
+    def Length(a, b, c="abc"):
+      return len(c)
+    wrapped = checker.TypeCheck(simple, "Length", Length, [sig])
+    self.assertEquals(2, wrapped(1, b=None, c="ab"))
+    self.assertEquals(3, wrapped(b=None, a=1))
+
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      wrapped(c=[], b=None, a="1")
+    self.assertEquals(
+        [checker.ParamTypeErrorMsg("Length", "a", str, int),
+         checker.ParamTypeErrorMsg("Length", "c", list, str)],
+        context.exception.args[0])
+
+    # unknown keywords are left to the function itself
+    with self.assertRaises(checker.CheckTypeAnnotationError) as context:
+      wrapped(1, None, d=1)
+    self.assertIsInstance(context.exception.args[1], TypeError)
+
 
 if __name__ == "__main__":
   unittest.main()
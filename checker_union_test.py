@@ -15,9 +15,11 @@
 # limitations under the License.
 
 
+import types
 import unittest
 from pytypedecl import checker
 from pytypedecl import pytd
+from tests import custom
 from tests import simple
 from tests import union
 
@@ -163,6 +165,74 @@ class TestCheckerUnion(unittest.TestCase):
     [actual] = context.exception.args[0]
     self.assertEquals(expected, actual)
 
+  def testCompiledTypeCache(self):
+    """Formal types are compiled once, and found by identity."""
+    compiled = checker._COMPILED_TYPES  # pylint: disable=protected-access
+    compiled.clear()
+    formal = pytd.UnionType([int, float])
+    self.assertTrue(checker.IsCompatibleType(1, formal))
+    self.assertTrue(checker.IsCompatibleType(2.0, formal))
+    self.assertFalse(checker.IsCompatibleType("1", formal))
+    [(key, (cached_formal, check, _))] = compiled.items()
+    self.assertEquals((id(formal), (int, float)), (key, check))
+    self.assertIs(formal, cached_formal)
+    self.assertTrue(checker.IsCompatibleType(1, int))
+    self.assertEquals(1, len(compiled))
+
+  def testCustomInstanceCheck(self):
+    """Classes with a custom __instancecheck__ are checked every time."""
+
+    formal = pytd.UnionType([custom.Positive, str])
+    self.assertTrue(checker.IsCompatibleType(1, formal))
+    self.assertFalse(checker.IsCompatibleType(-1, formal))
+    self.assertTrue(checker.IsCompatibleType(2, formal))
+
+  def testCompiledTypeCacheBounded(self):
+    compiled = checker._COMPILED_TYPES  # pylint: disable=protected-access
+    formals = [pytd.UnionType([int, float]) for _ in range(2000)]
+    for formal in formals:
+      self.assertTrue(checker.IsCompatibleType(1, formal))
+    self.assertTrue(len(compiled) <= 1024, len(compiled))
+
+  def testCompiledTypeCacheEvictsLeastRecentlyUsed(self):
+    """A formal type in use stays compiled while others come and go."""
+    compiled = checker._COMPILED_TYPES  # pylint: disable=protected-access
+    compiled.clear()
+    hot = pytd.UnionType([int, float])
+    formals = [pytd.UnionType([int, float]) for _ in range(3000)]
+    for formal in formals:
+      self.assertTrue(checker.IsCompatibleType(1, formal))
+      self.assertTrue(checker.IsCompatibleType(1, hot))
+      self.assertIn(id(hot), compiled)
+    self.assertIn(id(formals[-1]), compiled)
+    self.assertNotIn(id(formals[0]), compiled)
+
+  def testCompileNestedUnion(self):
+    """Nested unions of classes become a single tuple of classes."""
+    formal = pytd.UnionType([int, pytd.UnionType([float, pytd.UnionType(
+        [complex, int])])])
+    self.assertEquals((int, float, complex), checker.CompileType(formal))
+    self.assertEquals(str, checker.CompileType(pytd.UnionType([str])))
+
+  def testCompileIntersection(self):
+    compiled = checker.CompileType(pytd.IntersectionType([union.Readable,
+                                                          union.Writable]))
+    self.assertTrue(checker._IsTypeDeterminedCheck(compiled))  # pylint: disable=protected-access
+    self.assertTrue(compiled.Matches(union.File()))
+    self.assertFalse(compiled.Matches(union.Readable()))
+
+  def testCompileMixedUnion(self):
+    """Classes are checked with one isinstance, before containers."""
+    compiled = checker.CompileType(pytd.UnionType([
+        int, pytd.HomogeneousContainerType(list, str), types.NoneType]))
+    self.assertEquals((int, types.NoneType), compiled.classes)
+    self.assertFalse(checker._IsTypeDeterminedCheck(compiled))  # pylint: disable=protected-access
+    self.assertTrue(compiled.Matches(1))
+    self.assertTrue(compiled.Matches(None))
+    self.assertTrue(compiled.Matches(["a"]))
+    self.assertFalse(compiled.Matches([1]))
+    self.assertFalse(compiled.Matches(1.0))
+
   # TODO(raoulDoc): more tests! mixing overloading etc
 
 
@@ -0,0 +1,104 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import array
+import sys
+import unittest
+from pytypedecl import checker
+from pytypedecl import pytd
+from tests import custom
+from tests import simple
+
+
+class TestCheckerValidate(unittest.TestCase):
+
+  def testClasses(self):
+    values = [1, "a", 2.0, None, True, 3L]
+    self.assertEquals([], checker.ValidateMany(values, "object"))
+    self.assertEquals([1, 2, 3, 5], checker.ValidateMany(values, "int"))
+    self.assertEquals([1, 3], checker.ValidateMany(values,
+                                                   "int or float or long"))
+    self.assertEquals([0, 1, 2, 4, 5], checker.ValidateMany(values, "None"))
+    self.assertEquals([], checker.ValidateMany([], "int"))
+
+  def testContainers(self):
+    """Containers are only looked into if their class might match."""
+    values = [[1], [1, "2"], (1,), [], None, array.array("i", [1]),
+              array.array("d", [1.0])]
+    self.assertEquals([1, 2, 4, 6],
+                      checker.ValidateMany(
+                          values, "list<int> or array.array<int>",
+                          module=sys.modules[__name__]))
+    self.assertEquals([1, 2, 5, 6],
+                      checker.ValidateMany(values, "list<int> or None"))
+    self.assertEquals([0, 1],
+                      checker.ValidateMany([{1: "a"}, {"a": "b"}, {"a": 1}],
+                                           "dict<str, int>"))
+
+  def testElementBudget(self):
+    values = [range(50) + ["x"] + range(50), range(100)]
+    self.assertEquals([], checker.ValidateMany(values, "list<int>"))
+    self.assertEquals([0], checker.ValidateMany(
+        values, "list<int>", element_budget=checker.ElementBudget(1000)))
+
+  def testTypes(self):
+    """Types can also be given as type nodes or python types."""
+    values = [1, "a", None]
+    self.assertEquals([1], checker.ValidateMany(
+        values, pytd.UnionType((pytd.NamedType("int"),
+                                pytd.NamedType("None")))))
+    self.assertEquals([1], checker.ValidateMany(
+        values, pytd.UnionType((int, type(None)))))
+    self.assertEquals([0, 2], checker.ValidateMany(values, str))
+
+  def testModule(self):
+    values = [simple.Apple(), simple.Banana(), "apple"]
+    self.assertEquals([1, 2], checker.ValidateMany(values, "simple.Apple",
+                                                   sys.modules[__name__]))
+    self.assertRaises(NameError, checker.ValidateMany, values, "Apple")
+
+  def testIterable(self):
+    self.assertEquals([2], checker.ValidateMany(iter([1, 2, "3"]), "int"))
+
+  def testCustomClass(self):
+    """Values that lie about their class are checked one by one."""
+    values = [custom.Proxy(1), custom.Proxy("1")]
+    self.assertEquals([1], checker.ValidateMany(values, "int"))
+
+  def testCustomInstanceCheck(self):
+    """Classes with a custom __instancecheck__ are checked value by value."""
+    self.assertEquals([1], checker.ValidateMany([1, -1, 5], custom.Positive))
+    self.assertEquals([1, 3], checker.ValidateMany(
+        [1, -1, "a", None], pytd.UnionType((custom.Positive, str))))
+    self.assertEquals([1, 3], checker.ValidateMany(
+        [1, -1, 5, 2.0], pytd.IntersectionType((int, custom.Positive))))
+
+  def testSyntaxError(self):
+    self.assertRaises(SyntaxError, checker.ValidateMany, [1], "int or or int")
+    # the shared parser recovers
+    self.assertEquals([1], checker.ValidateMany([1, "a"], "int or float"))
+
+  def testParsedTypesCached(self):
+    """Type strings are only parsed once."""
+    self.assertEquals([1], checker.ValidateMany([1, "a"], "int or long"))
+    pytd_type = checker._PARSED_TYPES["int or long"]
+    self.assertEquals([0], checker.ValidateMany(["a", 1], "int or long"))
+    self.assertIs(pytd_type, checker._PARSED_TYPES["int or long"])
+
+
+if __name__ == "__main__":
+  unittest.main()
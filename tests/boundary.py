@@ -0,0 +1,55 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Used for tests."""
+
+import sys
+from pytypedecl import checker
+
+
+# def Inner(i: int) -> int
+def Inner(i):
+  return i
+
+
+# def Outer(i: int) -> int
+def Outer(i):
+  # Inner is declared to take an int, but calls from this module aren't
+  # checked.
+  Inner(str(i))
+  return Inner(i)
+
+
+# def Padded(s: str, width: int) -> str
+def Padded(s, width=8):
+  return s.ljust(width)
+
+
+class Formatter(object):
+
+  # def Format(self, i: int) -> str
+  def Format(self, i):
+    # Digits is declared to take an int; the call isn't checked.
+    return Padded(self.Digits(str(i)), width=4)
+
+  # def Digits(self, i: int) -> str
+  def Digits(self, i):
+    return str(i)
+
+
+checker.CheckFromFile(sys.modules[__name__], __file__ + "td",
+                      boundary_only=True)
@@ -57,4 +57,28 @@ class Comparators(object):
     return a > b
 
 
+class _ExplodingDescriptor(object):
+  """Fails when it's looked up, which the checker must not do."""
+
+  def __get__(self, obj, cls):
+    raise RuntimeError("looked up")
+
+
+class Geometry(object):
+
+  exploding = _ExplodingDescriptor()
+
+  # def Scale(x: int or float, factor: int or float) -> float
+  @staticmethod
+  def Scale(x, factor):
+    return float(x * factor)
+
+
+class LoudEmailer(Emailer):
+
+  # def Shout(self, msg: str) -> str
+  def Shout(self, msg):
+    return msg.upper()
+
+
 checker.CheckFromFile(sys.modules[__name__], __file__ + "td")
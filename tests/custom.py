@@ -0,0 +1,39 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Used for tests: classes that change what isinstance sees."""
+
+
+class PositiveMeta(type):
+
+  def __instancecheck__(cls, instance):
+    return isinstance(instance, (int, long)) and instance > 0
+
+
+class Positive(object):
+  """Positive ints are instances, whatever their class."""
+  __metaclass__ = PositiveMeta
+
+
+class Proxy(object):
+  """Stands in for a value, and claims to be of the value's class."""
+
+  def __init__(self, value):
+    self.value = value
+
+  @property
+  def __class__(self):  # pylint: disable=invalid-name
+    return type(self.value)
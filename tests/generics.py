@@ -22,6 +22,7 @@
 # pylint: disable=g-line-too-long
 # pylint: disable=unused-variable
 
+import array  # pylint: disable=unused-import
 import sys
 from pytypedecl import checker
 
@@ -42,16 +43,52 @@ class Box(object):
     return iter([self.data])
 
 
+class NonemptyMeta(type):
+
+  def __instancecheck__(cls, instance):
+    return isinstance(instance, list) and len(instance) > 0
+
+
+class Nonempty(object):
+  """Nonempty lists are instances, whatever their contents."""
+  __metaclass__ = NonemptyMeta
+
+
 # def UnwrapBox(b: Box<int>) -> int
 def UnwrapBox(b):
   return b.Get()
 
 
+# def SetSize(s: frozenset<int> or set<int>) -> int
+def SetSize(s):
+  return len(s)
+
+
+# def JoinAll(t: tuple<str>) -> str
+def JoinAll(t):
+  return "".join(t)
+
+
+# def SumArray(a: array.array<int or long>) -> int or long
+def SumArray(a):
+  return sum(a)
+
+
 # def FindInCache(cache: dict<str, int>, k: str) -> int
 def FindInCache(cache, k):
   return cache[k]
 
 
+# def SwapPair(p: tuple<int, str>) -> tuple<str, int>
+def SwapPair(p):
+  return p[1], p[0]
+
+
+# def _BadSwapPair(p: tuple<int, str>) -> tuple<str, int>
+def _BadSwapPair(p):
+  return p
+
+
 # def _BadGen() -> generator
 def _BadGen():
   """This is *supposed* to yield integers..."""
@@ -59,11 +96,44 @@ def _BadGen():
     yield num
 
 
+# def CountTo(n: int) -> generator<int>
+def CountTo(n):
+  for i in xrange(1, n + 1):
+    yield i
+
+
+# def _BadCountTo(n: int) -> generator<int>
+def _BadCountTo(n):
+  for i in xrange(1, n):
+    yield i
+  yield str(n)
+
+
+# def Echo() -> generator<int>
+def Echo():
+  value = 0
+  while True:
+    try:
+      value = yield value
+    except ValueError:
+      value = -1
+
+
 # def ConvertGenToList(g: generator<int>) -> list<int>
 def ConvertGenToList(g):
   return list(g)
 
 
+# def PassOnGen(g: generator<int>) -> generator<int>
+def PassOnGen(g):
+  return g
+
+
+# def ForwardGen(g: generator<int>) -> list<int>
+def ForwardGen(g):
+  return ConvertGenToList(g)
+
+
 def ConsumeDoubleGenerator(g1, g2):
 
   l1 = [e for e in g1]
@@ -0,0 +1,46 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Used for tests. Checked by the tests, which reload it to start over."""
+
+import sys
+from pytypedecl import checker
+
+
+# def Double(i: int) -> int
+def Double(i):
+  return 2 * i
+
+
+class Shape(object):
+
+  # def Grow(self, i: int) -> int
+  def Grow(self, i):
+    return i * 2
+
+  # def Make(cls, i: int) -> int
+  @classmethod
+  def Make(cls, i):
+    return i
+
+  # def Area(i: int) -> int
+  @staticmethod
+  def Area(i):
+    return i
+
+
+def Check(**kwargs):
+  checker.CheckFromFile(sys.modules[__name__], __file__ + "td", **kwargs)
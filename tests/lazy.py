@@ -0,0 +1,48 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Used for tests."""
+
+# pylint: disable=unused-argument
+
+import sys
+from pytypedecl import checker
+
+
+# def Add(a: int, b: int) -> int
+def Add(a, b):
+  return a + b
+
+
+# def Unused(l: list<int or float>) -> dict<str, int>
+def Unused(l):
+  return {}
+
+
+class Counter(object):
+
+  # def Increment(self, i: int) -> int
+  def Increment(self, i):
+    return i + 1
+
+  # def Next(cls, i: int) -> int
+  @classmethod
+  def Next(cls, i):
+    return i + 1
+
+
+checker.CheckFromFile(sys.modules[__name__], __file__ + "td", lazy=True)
@@ -0,0 +1,44 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Used for tests. Checked by the tests, which reload it to start over."""
+
+import sys
+from pytypedecl import checker
+
+
+# def IntToInt(i: int or None) -> int
+def IntToInt(i):
+  if i is None:
+    raise ValueError()
+  return i
+
+
+# def Bar(x: int) -> int
+# def Bar(x: str) -> str
+def Bar(x):
+  return x
+
+
+class Counter(object):
+
+  # def Add(self, i: int) -> int
+  def Add(self, i):
+    return i
+
+
+def Check(**kwargs):
+  checker.CheckFromFile(sys.modules[__name__], __file__ + "td", **kwargs)
@@ -21,6 +21,7 @@
 
 import sys
 from pytypedecl import checker
+from tests import custom
 from tests import simple
 
 
@@ -54,4 +55,13 @@ def MultiOverload(a):
 def ExceptionOverload():
   raise simple.WrongException
 
+
+Positive = custom.Positive
+
+
+# def Sign(x: Positive) -> int
+# def Sign(x: str) -> int
+def Sign(x):
+  return 1
+
 checker.CheckFromFile(sys.modules[__name__], __file__ + "td")
@@ -0,0 +1,71 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Used for tests. Checked by the tests, which reload it to start over."""
+
+import sys
+from pytypedecl import checker
+from tests import custom
+
+
+class FooException(Exception):
+  pass
+
+
+# def IntToInt(i: int or None) -> int raises FooException
+def IntToInt(i):
+  if i is None:
+    raise ValueError(i)
+  if i == 0:
+    raise FooException()
+  return i
+
+
+# def Length(l: list<int>) -> int
+def Length(l):
+  return len(l)
+
+
+Positive = custom.Positive
+
+
+# def Pos(x: Positive) -> int
+def Pos(x):
+  return x
+
+
+# def Bar(x: int) -> int
+# def Bar(x: str) -> str
+def Bar(x):
+  return x
+
+
+class Left(object):
+
+  # def Run(self, x: int) -> object
+  def Run(self, x):
+    return x
+
+
+class Right(object):
+
+  # def Run(self, x: str) -> object
+  def Run(self, x):
+    return x
+
+
+def Check(**kwargs):
+  checker.CheckFromFile(sys.modules[__name__], __file__ + "td", **kwargs)
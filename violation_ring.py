@@ -0,0 +1,271 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Violation records shared between processes, in a memory-mapped file.
+
+Pre-forked worker processes can all write the violations they find to the
+same file, and a separate process can read and aggregate them, without any
+service in between. Records have a fixed size and only hold hashes of the
+function and type names; use NameHash to map them back.
+
+The file is divided into lanes. A process claims a lane on its first write
+with a non-blocking lock, and is then the only writer of that lane, which
+it uses as a ring buffer: once it's full, the oldest records are
+overwritten. So writers never wait for each other, and the file never
+grows. If all lanes are taken, records are dropped (and counted in
+ViolationRing.dropped). The lock is released when the process exits, so
+the lane can be reused by a new worker.
+
+Threads of a process share its lane. A thread that finds another one
+writing drops its record too, rather than waiting.
+
+Readers check the sequence number of every record before and after reading
+it, and skip records that are being overwritten.
+
+Locking lanes uses fcntl, so this needs a POSIX system.
+"""
+
+import collections
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+# Parameter indices for violations that aren't about a parameter.
+RETURN = -1
+EXCEPTION = -2
+OVERLOAD = -3
+GENERATOR = -4  # an item of a generator passed to or returned by a function
+
+# Type hash of violations without an observed type (OVERLOAD). No type name
+# hashes to it, see NameHash.
+NO_TYPE = 0
+
+_MAGIC = b"PTDV"
+_VERSION = 1
+# magic, version, number of lanes, records per lane, record size
+_HEADER = struct.Struct("<4sIIII")
+_HEADER_SIZE = 64
+# number of records ever written to the lane, pid of the writer
+_LANE_HEADER = struct.Struct("<QI")
+_LANE_HEADER_SIZE = 16
+# sequence number (1-based, 0 while the record is written), function id,
+# parameter index, observed type hash, pid, timestamp
+_RECORD = struct.Struct("<QIhxxIId")
+_SEQUENCE = struct.Struct("<Q")
+
+# Lanes claimed by this process, per file. POSIX locks don't keep two
+# ViolationRings of the same process from claiming the same lane.
+_CLAIMED_LANES = {}  # (path, pid) -> set of lane numbers
+
+
+Violation = collections.namedtuple(
+    "Violation",
+    ["function_id", "param_index", "type_hash", "pid", "timestamp"])
+
+
+def NameHash(name):
+  """Return the 32 bit hash of a function or type name used in records."""
+  if not isinstance(name, bytes):
+    name = name.encode("utf-8")
+  return zlib.crc32(name) & 0xffffffff or 1  # 0 is NO_TYPE
+
+
+def TypeName(cls):
+  """Return the name of a class, as hashed for records."""
+  return "{}.{}".format(cls.__module__, cls.__name__)
+
+
+class ViolationRing(object):
+  """A file of violation records, shared by many writers and readers.
+
+  Attributes:
+    path: Path of the file
+    lanes: Number of lanes, i.e. of processes that can write at the same time
+    capacity: Number of records per lane
+    dropped: Number of records this process couldn't write, because all
+      lanes were taken, or because another thread was writing
+  """
+
+  def __init__(self, path, lanes=64, capacity=4096):
+    """Open the file at path, creating it if it doesn't exist.
+
+    Args:
+      path: Path of the file
+      lanes: Number of lanes, for a new file
+      capacity: Number of records per lane, for a new file
+
+    Raises:
+      ValueError: if the file exists but isn't a violation ring
+    """
+    self.path = path
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER_SIZE, 0)
+      try:
+        if os.fstat(fd).st_size == 0:
+          size = _HEADER_SIZE + lanes * (_LANE_HEADER_SIZE +
+                                         capacity * _RECORD.size)
+          os.ftruncate(fd, size)
+          os.write(fd, _HEADER.pack(_MAGIC, _VERSION, lanes, capacity,
+                                    _RECORD.size))
+      finally:
+        fcntl.lockf(fd, fcntl.LOCK_UN, _HEADER_SIZE, 0)
+      self._map = mmap.mmap(fd, 0)
+    except:
+      os.close(fd)
+      raise
+    self._fd = fd
+    self._lane = None
+    self._pid = None
+    self._lock = threading.Lock()
+    # only held to add one to dropped, which threads may do concurrently
+    self._dropped_lock = threading.Lock()
+    self.dropped = 0
+    magic, version, self.lanes, self.capacity, record_size = (
+        _HEADER.unpack_from(self._map, 0))
+    if (magic, version, record_size) != (_MAGIC, _VERSION, _RECORD.size):
+      self.Close()
+      raise ValueError("Not a violation ring: {!r}".format(path))
+    self._lane_size = _LANE_HEADER_SIZE + self.capacity * _RECORD.size
+
+  def Close(self):
+    """Close the file. This releases the lane of this process.
+
+    As POSIX locks are per process, closing any ViolationRing of a file
+    releases the lanes of all the ViolationRings of the file in this process.
+    """
+    self._map.close()
+    os.close(self._fd)
+    if self._lane is not None:
+      _CLAIMED_LANES.get((self.path, self._pid), set()).discard(self._lane)
+      self._lane = None
+
+  def _LaneOffset(self, lane):
+    return _HEADER_SIZE + lane * self._lane_size
+
+  def _ClaimLane(self):
+    """Claim a lane for this process, or return None if all are taken."""
+    pid = os.getpid()
+    claimed = _CLAIMED_LANES.setdefault((self.path, pid), set())
+    for lane in range(self.lanes):
+      if lane in claimed:
+        continue
+      try:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1,
+                    self._LaneOffset(lane))
+      except IOError:
+        continue  # another process writes to this lane
+      claimed.add(lane)
+      offset = self._LaneOffset(lane)
+      count, _ = _LANE_HEADER.unpack_from(self._map, offset)
+      _LANE_HEADER.pack_into(self._map, offset, count, pid)
+      return lane
+    return None
+
+  def Write(self, function_id, param_index, type_hash, timestamp=None):
+    """Append a violation record. Never blocks.
+
+    Args:
+      function_id: NameHash of the function name
+      param_index: Index of the parameter, or RETURN, EXCEPTION or OVERLOAD
+      type_hash: NameHash of the name of the observed type (see TypeName)
+      timestamp: Time of the violation, by default the current time
+    """
+    if not self._lock.acquire(False):
+      with self._dropped_lock:
+        self.dropped += 1
+      return
+    try:
+      self._Write(function_id, param_index, type_hash, timestamp)
+    finally:
+      self._lock.release()
+
+  def _Write(self, function_id, param_index, type_hash, timestamp):
+    """Implementation of Write, called with the lock held."""
+    pid = os.getpid()
+    if self._pid != pid:
+      # first write, or first write after a fork: locks aren't inherited
+      self._pid = pid
+      self._lane = self._ClaimLane()
+    if self._lane is None:
+      with self._dropped_lock:
+        self.dropped += 1
+      return
+    lane_offset = self._LaneOffset(self._lane)
+    count, _ = _LANE_HEADER.unpack_from(self._map, lane_offset)
+    offset = (lane_offset + _LANE_HEADER_SIZE +
+              (count % self.capacity) * _RECORD.size)
+    _SEQUENCE.pack_into(self._map, offset, 0)
+    _RECORD.pack_into(self._map, offset, 0, function_id, param_index,
+                      type_hash, pid,
+                      time.time() if timestamp is None else timestamp)
+    _SEQUENCE.pack_into(self._map, offset, count + 1)
+    _LANE_HEADER.pack_into(self._map, lane_offset, count + 1, pid)
+
+  def Record(self, func_name, param_index, observed_type):
+    """Write a violation of a checked function.
+
+    Args:
+      func_name: Name of the function ("Class.method" for methods)
+      param_index: Index of the parameter, or RETURN, EXCEPTION, OVERLOAD or
+        GENERATOR
+      observed_type: The class of the offending value, or None (for
+        OVERLOAD), which is recorded as NO_TYPE
+    """
+    self.Write(NameHash(func_name), param_index,
+               NO_TYPE if observed_type is None
+               else NameHash(TypeName(observed_type)))
+
+  def Read(self):
+    """Return the records currently in the file, of all lanes.
+
+    Returns:
+      A list of Violations, oldest first within each lane
+    """
+    violations = []
+    for lane in range(self.lanes):
+      lane_offset = self._LaneOffset(lane)
+      count, _ = _LANE_HEADER.unpack_from(self._map, lane_offset)
+      for sequence in range(max(1, count - self.capacity + 1), count + 1):
+        offset = (lane_offset + _LANE_HEADER_SIZE +
+                  ((sequence - 1) % self.capacity) * _RECORD.size)
+        record = _RECORD.unpack_from(self._map, offset)
+        if (record[0] != sequence or
+            _SEQUENCE.unpack_from(self._map, offset)[0] != sequence):
+          continue  # overwritten while we were reading
+        violations.append(Violation(*record[1:]))
+    return violations
+
+  def Aggregate(self):
+    """Count the records of all lanes per function, parameter and type.
+
+    Returns:
+      A dict {(function_id, param_index, type_hash): (count, first timestamp,
+      last timestamp)}
+    """
+    totals = {}
+    for v in self.Read():
+      key = (v.function_id, v.param_index, v.type_hash)
+      count, first, last = totals.get(key, (0, v.timestamp, v.timestamp))
+      totals[key] = (count + 1, min(first, v.timestamp),
+                     max(last, v.timestamp))
+    return totals
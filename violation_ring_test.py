@@ -0,0 +1,220 @@
+# -*- coding:utf-8; python-indent:2; indent-tabs-mode:nil -*-
+
+# Copyright 2013 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from pytypedecl import checker
+from pytypedecl import violation_ring
+
+
+class TestViolationRing(unittest.TestCase):
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tempdir, "violations")
+    self.rings = []
+
+  def tearDown(self):
+    for ring in self.rings:
+      ring.Close()
+    shutil.rmtree(self.tempdir)
+
+  def _Open(self, **kwargs):
+    ring = violation_ring.ViolationRing(self.path, **kwargs)
+    self.rings.append(ring)
+    return ring
+
+  def testWriteAndRead(self):
+    ring = self._Open(lanes=2, capacity=8)
+    ring.Record("IntToInt", 0, str)
+    ring.Write(1, violation_ring.RETURN, 2, timestamp=42.0)
+    first, second = ring.Read()
+    self.assertEquals(
+        (violation_ring.NameHash("IntToInt"), 0,
+         violation_ring.NameHash("__builtin__.str"), os.getpid()),
+        first[:4])
+    self.assertEquals(violation_ring.Violation(1, -1, 2, os.getpid(), 42.0),
+                      second)
+    # another reader sees the same records
+    self.assertEquals([first, second], self._Open().Read())
+
+  def testRingOverwritesOldest(self):
+    ring = self._Open(lanes=1, capacity=4)
+    for i in range(10):
+      ring.Write(i, 0, 0)
+    self.assertEquals([6, 7, 8, 9], [v.function_id for v in ring.Read()])
+
+  def testAggregate(self):
+    ring = self._Open()
+    for t in (1.0, 3.0, 2.0):
+      ring.Write(1, 0, 7, timestamp=t)
+    ring.Write(1, 1, 7, timestamp=5.0)
+    self.assertEquals({(1, 0, 7): (3, 1.0, 3.0), (1, 1, 7): (1, 5.0, 5.0)},
+                      ring.Aggregate())
+
+  def testNotARing(self):
+    with open(self.path, "w") as f:
+      f.write("x" * 100)
+    with self.assertRaises(ValueError):
+      violation_ring.ViolationRing(self.path)
+
+  def _InChild(self, func):
+    """Run func in a child process, and return its exit status."""
+    pid = os.fork()
+    if pid == 0:
+      try:
+        status = func()
+      except BaseException:  # pylint: disable=broad-except
+        status = 99
+      os._exit(status)  # pylint: disable=protected-access
+    return os.waitpid(pid, 0)[1] >> 8
+
+  def testProcesses(self):
+    """Records of several processes are aggregated, one lane per process."""
+    ring = self._Open(lanes=4, capacity=16)
+    ring.Write(1, 0, 0)
+
+    def Child():
+      for _ in range(5):
+        ring.Write(2, 0, 0)
+      return ring.dropped
+
+    self.assertEquals([0, 0, 0], [self._InChild(Child) for _ in range(3)])
+    self.assertEquals({(1, 0, 0): 1, (2, 0, 0): 15},
+                      {k: v[0] for k, v in ring.Aggregate().iteritems()})
+    self.assertEquals(4, len({v.pid for v in ring.Read()}))
+
+  def testAllLanesTaken(self):
+    """Writers don't wait for a free lane; they drop the record."""
+    ring = self._Open(lanes=1, capacity=16)
+    ring.Write(1, 0, 0)
+
+    def Child():
+      ring.Write(2, 0, 0)
+      return ring.dropped
+
+    self.assertEquals(1, self._InChild(Child))
+    self.assertEquals([1], [v.function_id for v in ring.Read()])
+
+  def testThreads(self):
+    """Threads may drop records when they collide, but never lose them."""
+    ring = self._Open(lanes=1, capacity=1 << 15)
+
+    def WriteAll(function_id):
+      for _ in range(2000):
+        ring.Write(function_id, 0, 0)
+
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+      threads = [threading.Thread(target=WriteAll, args=(i,))
+                 for i in range(8)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+    finally:
+      sys.setcheckinterval(interval)
+    self.assertEquals(16000, len(ring.Read()) + ring.dropped)
+
+  def _CheckedModule(self, source, declarations, **kwargs):
+    module = imp.new_module("violation_ring_test_module")
+    sys.modules[module.__name__] = module
+    self.addCleanup(sys.modules.pop, module.__name__)
+    exec(source, module.__dict__)  # pylint: disable=exec-used
+    checker.CheckFromData(module, declarations, **kwargs)
+    return module
+
+  def testShadowCheckerSink(self):
+    ring = self._Open()
+    shadow = checker.ShadowChecker(report=lambda errors: None, sink=ring)
+    module = self._CheckedModule("def IntToInt(i):\n  return i\n",
+                                 "def IntToInt(i: int) -> int",
+                                 shadow=shadow)
+    module.IntToInt(1.5)
+    shadow.Drain()
+    float_hash = violation_ring.NameHash(violation_ring.TypeName(float))
+    func_hash = violation_ring.NameHash("IntToInt")
+    self.assertEquals(
+        [(func_hash, 0, float_hash), (func_hash, violation_ring.RETURN,
+                                      float_hash)],
+        [v[:3] for v in ring.Read()])
+
+  def testRaisedViolationsRecorded(self):
+    """Without shadow mode, violations are recorded as they're raised."""
+    ring = self._Open()
+    module = self._CheckedModule(
+        "def Swap(a, b):\n  return b\n"
+        "def Bar(x):\n  return x\n"
+        "def Count():\n  yield 1.5\n",
+        "def Swap(a: int, b: str) -> int\n"
+        "def Bar(x: int) -> int\n"
+        "def Bar(x: str) -> str\n"
+        "def Count() -> generator<int>",
+        sink=ring)
+    for call in (lambda: module.Swap(1, 1.5), lambda: module.Bar(1.5),
+                 lambda: list(module.Count())):
+      self.assertRaises(checker.CheckTypeAnnotationError, call)
+    float_hash = violation_ring.NameHash(violation_ring.TypeName(float))
+    self.assertEquals(
+        [(violation_ring.NameHash("Swap"), 1, float_hash),
+         (violation_ring.NameHash("Swap"), violation_ring.RETURN, float_hash),
+         (violation_ring.NameHash("Bar"), violation_ring.OVERLOAD,
+          violation_ring.NO_TYPE),
+         (violation_ring.NameHash("Count"), violation_ring.GENERATOR,
+          float_hash)],
+        [v[:3] for v in ring.Read()])
+
+  def testMethodsRecordedWithClass(self):
+    ring = self._Open()
+    module = self._CheckedModule(
+        "class A(object):\n  def run(self, x):\n    return 1\n"
+        "class B(object):\n  def run(self, x):\n    return 1\n",
+        "class A:\n  def run(self, x: int) -> int\n\n"
+        "class B:\n  def run(self, x: str) -> int\n",
+        sink=ring)
+    self.assertRaises(checker.CheckTypeAnnotationError, module.A().run, "a")
+    self.assertRaises(checker.CheckTypeAnnotationError, module.B().run, 1)
+    self.assertEquals(
+        [(violation_ring.NameHash("A.run"), 1,
+          violation_ring.NameHash(violation_ring.TypeName(str))),
+         (violation_ring.NameHash("B.run"), 1,
+          violation_ring.NameHash(violation_ring.TypeName(int)))],
+        [v[:3] for v in ring.Read()])
+
+  def testShadowOverloadHasNoType(self):
+    ring = self._Open()
+    shadow = checker.ShadowChecker(report=lambda errors: None, sink=ring)
+    module = self._CheckedModule("def Bar(x):\n  return x\n",
+                                 "def Bar(x: int) -> int\n"
+                                 "def Bar(x: str) -> str",
+                                 shadow=shadow)
+    module.Bar(None)
+    shadow.Drain()
+    self.assertEquals(
+        [(violation_ring.NameHash("Bar"), violation_ring.OVERLOAD,
+          violation_ring.NO_TYPE)],
+        [v[:3] for v in ring.Read()])
+
+
+if __name__ == "__main__":
+  unittest.main()